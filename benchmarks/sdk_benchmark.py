@@ -0,0 +1,376 @@
+"""Measures the overhead of the SDK on the hot paths of a service: the
+entrypoint wrapper with and without monitoring, ``store()`` throughput through
+the database writer, reading monitored data, raw, rolled up and aggregated,
+as the tables grow, validation of the array and dataframe types, parameter
+updates and reads of monitored data while the writer is busy.
+
+Everything runs in-process with the FastAPI TestClient. The monitoring
+database is created in the working directory and removed afterwards. The
+results are written as JSON, which can be compared with the results of another
+SDK version.
+
+Run from the repository root, with the SDK installed (``pip install -e .``)::
+
+    python benchmarks/sdk_benchmark.py --output results.json
+    python benchmarks/sdk_benchmark.py --compare results.json
+"""
+
+import argparse
+import datetime
+import importlib.metadata
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from daeploy._service import db
+from daeploy._service.service import _Service
+from daeploy.data_types import ArrayInput, DataFrameInput
+
+SCHEMA_VERSION = 1
+
+# Rows in the table for the read benchmarks
+TABLE_SIZES = [1_000, 10_000, 50_000]
+
+
+def measure(func: Callable[[], None], repeat: int, number: int = 1) -> dict:
+    """Time a function
+
+    Args:
+        func (Callable[[], None]): The function to time.
+        repeat (int): Number of timed rounds.
+        number (int): Calls of the function per round. Defaults to 1.
+
+    Returns:
+        dict: Mean, median, min, max and standard deviation of the seconds per
+        call and the calls per second.
+    """
+    func()  # Warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    mean = statistics.mean(timings)
+    return {
+        "mean_s": mean,
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "ops_per_s": 1 / mean if mean else None,
+        "rounds": repeat,
+        "calls_per_round": number,
+    }
+
+
+def bench_entrypoint(repeat: int) -> Dict[str, dict]:
+    """Requests to a trivial entrypoint, without and with monitoring"""
+    results = {}
+    for monitor in (False, True):
+        service = _Service()
+
+        def echo(value: int) -> int:
+            return value
+
+        service.entrypoint(monitor=monitor)(echo)
+        client = TestClient(service.app)
+        name = f"entrypoint/monitor_{'on' if monitor else 'off'}"
+        results[name] = measure(
+            lambda c=client: c.post("/echo", json={"value": 1}), repeat, 10
+        )
+    db.QUEUE.join()
+    return results
+
+
+def bench_store(repeat: int) -> Dict[str, dict]:
+    """Values stored with ``store()`` until the writer thread has written them"""
+    service = _Service()
+    values = 1000
+
+    def store_values():
+        for value in range(values):
+            service.store(benchmark_store=value)
+        db.QUEUE.join()
+
+    result = measure(store_values, repeat)
+    result["values_per_s"] = values / result["mean_s"]
+    return {"store/write_to_ts": result}
+
+
+def _fill_table(name: str, rows: int):
+    """Insert rows into a stored variable directly, bypassing the writer"""
+    service = _Service()
+    service.store(**{name: 0.0})
+    db.QUEUE.join()
+    variable_id = db.VARIABLES[name].id
+    start = datetime.datetime.utcnow() - datetime.timedelta(seconds=rows + 1)
+    with db.ENGINE.begin() as connection:
+        db._insert_samples(
+            connection,
+            [
+                {
+                    "variable_id": variable_id,
+                    "ts": start + datetime.timedelta(seconds=row),
+                    "value_num": row,
+                }
+                for row in range(rows - 1)
+            ],
+        )
+
+
+def bench_read(repeat: int) -> Dict[str, dict]:
+    """Reading a variable, directly and through ``/~monitor``, and aggregating
+    it over 5 minute buckets, per table size"""
+    results = {}
+    client = TestClient(_Service().app)
+    for rows in TABLE_SIZES:
+        name = f"benchmark_read_{rows}"
+        _fill_table(name, rows)
+        results[f"read_from_ts/{rows}_rows"] = measure(
+            lambda n=name: db.read_from_ts(n), repeat
+        )
+        results[f"monitor_json/{rows}_rows"] = measure(
+            lambda n=name: client.get("/~monitor", params={"variables": [n]}),
+            repeat,
+        )
+        results[f"monitor_json_1m/{rows}_rows"] = measure(
+            lambda n=name: client.get(
+                "/~monitor", params={"variables": [n], "resolution": "1m"}
+            ),
+            repeat,
+        )
+        results[f"monitor_aggregate/{rows}_rows"] = measure(
+            lambda n=name: client.get(
+                "/~monitor/aggregate", params={"variables": [n], "fn": "mean,max"}
+            ),
+            repeat,
+        )
+        results[f"monitor_aggregate_p95/{rows}_rows"] = measure(
+            lambda n=name: client.get(
+                "/~monitor/aggregate", params={"variables": [n], "fn": "mean,p95"}
+            ),
+            repeat,
+        )
+    return results
+
+
+def bench_concurrent(repeat: int) -> Dict[str, dict]:
+    """Reads of a variable with 10k rows and stored values per second, each
+    alone and both at the same time. A write is counted when it is queued, and
+    the queue is kept short."""
+    service = _Service()
+    name = "benchmark_concurrent"
+    _fill_table(name, 10_000)
+    seconds = max(repeat / 10, 1)
+
+    def read(stop: threading.Event) -> int:
+        reads = 0
+        while not stop.is_set():
+            db.read_from_ts(name)
+            reads += 1
+        return reads
+
+    def write(stop: threading.Event) -> int:
+        writes = 0
+        while not stop.is_set():
+            for _ in range(100):
+                service.store(benchmark_concurrent_write=float(writes))
+                writes += 1
+            # Keep the queue short, so that values are counted when written
+            while db.queue_depth() > 1000:
+                time.sleep(0.001)
+        db.QUEUE.join()
+        return writes
+
+    def throughput(scenario: str, readers: int, writers: int) -> Dict[str, dict]:
+        stop = threading.Event()
+        with ThreadPoolExecutor(readers + writers) as pool:
+            start = time.perf_counter()
+            reads = [pool.submit(read, stop) for _ in range(readers)]
+            writes = [pool.submit(write, stop) for _ in range(writers)]
+            time.sleep(seconds)
+            stop.set()
+            counts = {
+                "reads": sum(future.result() for future in reads),
+                "writes": sum(future.result() for future in writes),
+            }
+        elapsed = time.perf_counter() - start
+        return {
+            f"concurrent/{scenario}/{kind}": {
+                "mean_s": elapsed / count,
+                "ops_per_s": count / elapsed,
+                "seconds": elapsed,
+                "operations": count,
+            }
+            for kind, count in counts.items()
+            if count
+        }
+
+    results = {}
+    results.update(throughput("read_only", readers=4, writers=0))
+    results.update(throughput("write_only", readers=0, writers=1))
+    results.update(throughput("read_and_write", readers=4, writers=1))
+    return results
+
+
+def bench_validation(repeat: int) -> Dict[str, dict]:
+    """Validation of the array and dataframe input types"""
+    array = TypeAdapter(ArrayInput)
+    dataframe = TypeAdapter(DataFrameInput)
+    array_value = np.random.rand(10_000).tolist()
+    dataframe_value = pd.DataFrame(
+        np.random.rand(1000, 10), columns=[f"col{i}" for i in range(10)]
+    ).to_dict(orient="list")
+    return {
+        "validation/array_10k": measure(
+            lambda: array.validate_python(array_value), repeat, 10
+        ),
+        "validation/dataframe_1000x10": measure(
+            lambda: dataframe.validate_python(dataframe_value), repeat, 10
+        ),
+    }
+
+
+def bench_parameters(repeat: int) -> Dict[str, dict]:
+    """Parameter updates from code, through the API and in bulk"""
+    service = _Service()
+    names = [f"parameter_{index}" for index in range(10)]
+    for name in names:
+        service.add_parameter(name, 0.0)
+    client = TestClient(service.app)
+    return {
+        "parameters/set_parameter": measure(
+            lambda: service.set_parameter("parameter_0", 1.0), repeat, 100
+        ),
+        "parameters/post_single": measure(
+            lambda: client.post("/~parameters/parameter_0", json={"value": 1.0}),
+            repeat,
+            10,
+        ),
+        "parameters/post_bulk_10": measure(
+            lambda: client.post("/~parameters", json={name: 1.0 for name in names}),
+            repeat,
+            10,
+        ),
+    }
+
+
+BENCHMARKS = {
+    "entrypoint": bench_entrypoint,
+    "store": bench_store,
+    "read": bench_read,
+    "validation": bench_validation,
+    "parameters": bench_parameters,
+    "concurrent": bench_concurrent,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _sdk_version() -> str:
+    try:
+        return importlib.metadata.version("daeploy")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def run(repeat: int, selected: List[str]) -> dict:
+    """Run the selected benchmarks
+
+    Args:
+        repeat (int): Number of timed rounds per benchmark.
+        selected (List[str]): Names of the benchmark groups to run.
+
+    Returns:
+        dict: The environment and the results, per benchmark
+    """
+    results = {}
+    try:
+        db.initialize_db()
+        for group in selected:
+            results.update(BENCHMARKS[group](repeat))
+    finally:
+        db.remove_db()
+    return {
+        "schema": SCHEMA_VERSION,
+        "environment": {
+            "sdk_version": _sdk_version(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Print the change of the mean time per call against a baseline"""
+    print(f"{'benchmark':<36}{'baseline [ms]':>15}{'current [ms]':>15}{'change':>10}")
+    for name, result in results["results"].items():
+        previous = baseline["results"].get(name)
+        current = result["mean_s"] * 1000
+        if previous is None:
+            print(f"{name:<36}{'-':>15}{current:>15.3f}{'new':>10}")
+            continue
+        before = previous["mean_s"] * 1000
+        print(
+            f"{name:<36}{before:>15.3f}{current:>15.3f}"
+            f"{(current - before) / before:>+10.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results to compare with")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = run(args.repeat, args.only)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    else:
+        print(f"{'benchmark':<36}{'mean [ms]':>12}{'ops/s':>12}")
+        for name, result in results["results"].items():
+            print(
+                f"{name:<36}{result['mean_s'] * 1000:>12.3f}"
+                f"{result['ops_per_s']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compares the default FastAPI response serialization with the fast JSON mode
+(``service.entrypoint(fast_json=True)``) for typical daeploy.data_types payloads.
+
+Run from the repository root, with the SDK installed (``pip install -e .``)::
+
+    python benchmarks/serialization_benchmark.py
+"""
+
+import argparse
+import logging
+import timeit
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from daeploy._service.service import _Service
+from daeploy.data_types import ArrayOutput, DataFrameOutput
+
+PAYLOADS = {
+    "array_100k": lambda: np.random.rand(100_000),
+    "array_1000x100": lambda: np.random.rand(1000, 100),
+    "dataframe_10k_x10": lambda: pd.DataFrame(
+        np.random.rand(10_000, 10), columns=[f"col{i}" for i in range(10)]
+    ),
+}
+
+RETURN_TYPES = {
+    "array_100k": ArrayOutput,
+    "array_1000x100": ArrayOutput,
+    "dataframe_10k_x10": DataFrameOutput,
+}
+
+
+def create_service(payload_name: str, fast_json: bool) -> _Service:
+    """Create a service with one entrypoint that returns a fixed payload"""
+    service = _Service()
+    payload = PAYLOADS[payload_name]()
+
+    def payload_entrypoint():
+        return payload
+
+    payload_entrypoint.__annotations__["return"] = RETURN_TYPES[payload_name]
+    service.entrypoint(fast_json=fast_json)(payload_entrypoint)
+    return service
+
+
+def run(repeat: int) -> dict:
+    """Time requests to the default and the fast JSON path for each payload
+
+    Args:
+        repeat (int): Number of requests per payload and path
+
+    Returns:
+        dict: Mean seconds per request, per payload and path
+    """
+    results = {}
+    for payload_name in PAYLOADS:
+        results[payload_name] = {}
+        for path, fast_json in (("default", False), ("fast_json", True)):
+            client = TestClient(create_service(payload_name, fast_json).app)
+            response = client.post("/payload_entrypoint")
+            assert response.status_code == 200, response.text
+            seconds = timeit.timeit(
+                lambda c=client: c.post("/payload_entrypoint"), number=repeat
+            )
+            results[payload_name][path] = seconds / repeat
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = run(args.repeat)
+    print(f"{'payload':<20}{'default [ms]':>15}{'fast_json [ms]':>15}{'speedup':>10}")
+    for payload_name, timings in results.items():
+        default, fast = timings["default"], timings["fast_json"]
+        print(
+            f"{payload_name:<20}{default * 1000:>15.2f}{fast * 1000:>15.2f}"
+            f"{default / fast:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
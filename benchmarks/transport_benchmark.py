@@ -0,0 +1,166 @@
+"""Compares server transport configurations of ``service.run()``: TCP and Unix
+domain sockets, the asyncio and uvloop event loops and the h11 and httptools
+HTTP parsers. Configurations that need packages that are not installed are
+skipped.
+
+Run from the repository root, with the SDK installed (``pip install -e .``)::
+
+    python benchmarks/transport_benchmark.py
+"""
+
+import argparse
+import importlib.util
+import logging
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from daeploy._service.service import _Service
+
+PORT = 8765
+
+# Name, listen on a Unix domain socket, event loop and HTTP parser
+CONFIGURATIONS = [
+    ("tcp asyncio h11", False, "asyncio", "h11"),
+    ("tcp uvloop httptools", False, "uvloop", "httptools"),
+    ("uds asyncio h11", True, "asyncio", "h11"),
+    ("uds uvloop httptools", True, "uvloop", "httptools"),
+]
+
+
+def create_service() -> _Service:
+    """Create a service with a single cheap entrypoint, so that the transport
+    dominates the time of a request"""
+    service = _Service()
+
+    @service.entrypoint
+    async def echo(value: int) -> int:
+        return value
+
+    return service
+
+
+def serve(uds: str, loop: str, http: str):
+    """Entry point of the server process"""
+    logging.disable(logging.CRITICAL)
+    create_service().run(port=PORT, uds=uds, loop=loop, http=http)
+
+
+def client(uds: str) -> httpx.Client:
+    """A client with keep-alive connections to the server"""
+    if uds:
+        return httpx.Client(
+            transport=httpx.HTTPTransport(uds=uds), base_url="http://service"
+        )
+    return httpx.Client(base_url=f"http://127.0.0.1:{PORT}")
+
+
+def wait_until_up(uds: str, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with client(uds) as session:
+                if session.get("/~health").status_code == 200:
+                    return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError("The service did not start")
+
+
+def measure(uds: str, requests: int, concurrency: int) -> dict:
+    """Send requests from concurrent clients and time them
+
+    Args:
+        uds (str): Path of the Unix domain socket, or None for TCP.
+        requests (int): Number of requests per client.
+        concurrency (int): Number of concurrent clients.
+
+    Returns:
+        dict: Requests per second and the median and 99th percentile latency
+        in milliseconds.
+    """
+
+    def run_client(_) -> list:
+        latencies = []
+        with client(uds) as session:
+            for value in range(requests):
+                start = time.perf_counter()
+                response = session.post("/echo", json={"value": value})
+                latencies.append(time.perf_counter() - start)
+                assert response.json() == value, response.text
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = sorted(
+            latency
+            for latencies in pool.map(run_client, range(concurrency))
+            for latency in latencies
+        )
+    seconds = time.perf_counter() - start
+    return {
+        "requests_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run(requests: int, concurrency: int) -> dict:
+    """Start a server for each available configuration and measure it
+
+    Args:
+        requests (int): Number of requests per client.
+        concurrency (int): Number of concurrent clients.
+
+    Returns:
+        dict: Results of :func:`measure`, per configuration
+    """
+    context = multiprocessing.get_context("fork")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, use_uds, loop, http in CONFIGURATIONS:
+            missing = [
+                package
+                for package in (loop, http)
+                if package not in ("asyncio", "h11")
+                and not importlib.util.find_spec(package)
+            ]
+            if missing:
+                logging.warning(f"Skipping {name}, {', '.join(missing)} not installed")
+                continue
+            uds = os.path.join(directory, "service.sock") if use_uds else None
+            server = context.Process(target=serve, args=(uds, loop, http))
+            server.start()
+            try:
+                wait_until_up(uds)
+                measure(uds, 10, concurrency)
+                results[name] = measure(uds, requests, concurrency)
+            finally:
+                server.terminate()
+                server.join(10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = run(args.requests, args.concurrency)
+    print(f"{'configuration':<24}{'req/s':>10}{'p50 [ms]':>10}{'p99 [ms]':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<24}{result['requests_per_second']:>10.0f}"
+            f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Binary encodings for numeric entrypoint payloads.
+
+Entrypoints that use the :mod:`daeploy.data_types` can receive and return
+the following formats in addition to JSON, selected with the ``Content-Type``
+and ``Accept`` headers:
+
+    * ``application/x-npy``: A single numpy array in ``.npy`` format.
+    * ``application/vnd.apache.arrow.stream``: A single pandas DataFrame in
+      Arrow IPC stream format. Requires ``pyarrow``.
+    * ``application/msgpack``: Any msgpack document, where numpy arrays and
+      pandas DataFrames are packed as binary extension types. Requires
+      ``msgpack``.
+"""
+
+import importlib
+import io
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+JSON = "application/json"
+NPY = "application/x-npy"
+ARROW = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+MEDIA_TYPES = {"json": JSON, "npy": NPY, "arrow": ARROW, "msgpack": MSGPACK}
+BINARY_MEDIA_TYPES = (NPY, ARROW, MSGPACK)
+
+_ALIASES = {"application/x-msgpack": MSGPACK}
+
+_EXT_NDARRAY = 1
+_EXT_DATAFRAME = 2
+
+
+def _require(module: str) -> Any:
+    """Import an optional dependency
+
+    Args:
+        module (str): Name of the module
+
+    Raises:
+        ImportError: If the module is not installed
+
+    Returns:
+        Any: The imported module
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(
+            f"The package {module} is required for this encoding."
+            f" Install it with: pip install {module}"
+        )
+
+
+def media_type(content_type: Optional[str]) -> str:
+    """Normalized media type of a ``Content-Type`` header
+
+    Args:
+        content_type (Optional[str]): Value of the header
+
+    Returns:
+        str: The media type without parameters, e.g. ``application/json``
+    """
+    media = (content_type or "").split(";")[0].strip().lower()
+    return _ALIASES.get(media, media)
+
+
+def can_encode(value: Any, media: str) -> bool:
+    """Check if a value can be encoded with a binary media type
+
+    Args:
+        value (Any): Value to encode
+        media (str): One of the binary media types
+
+    Returns:
+        bool: True if value can be encoded as media
+    """
+    if media == NPY:
+        return isinstance(value, np.ndarray) and value.dtype != object
+    if media == ARROW:
+        return isinstance(value, pd.DataFrame)
+    return media == MSGPACK
+
+
+def negotiate(accept: Optional[str], value: Any) -> Optional[str]:
+    """Pick a binary media type for a response from an ``Accept`` header
+
+    Args:
+        accept (Optional[str]): Value of the ``Accept`` header
+        value (Any): The value to send
+
+    Returns:
+        Optional[str]: The binary media type to use or None for JSON
+    """
+    entries: List[Tuple[float, int, str]] = []
+    for position, entry in enumerate((accept or "").split(",")):
+        media, *params = entry.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, number = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            entries.append((-quality, position, media_type(media)))
+
+    for _, _, media in sorted(entries):
+        if media in BINARY_MEDIA_TYPES and can_encode(value, media):
+            return media
+        if media in (JSON, "application/*", "*/*"):
+            return None
+    return None
+
+
+def _msgpack_default(value: Any) -> Any:
+    msgpack = _require("msgpack")
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.tolist()
+        return msgpack.ExtType(_EXT_NDARRAY, encode(value, NPY))
+    if isinstance(value, pd.DataFrame):
+        frame = {
+            "columns": [str(column) for column in value.columns],
+            "index": value.index.to_numpy(),
+            "data": [value[column].to_numpy() for column in value.columns],
+        }
+        return msgpack.ExtType(_EXT_DATAFRAME, encode(frame, MSGPACK))
+    if isinstance(value, np.generic):
+        return value.item()
+    return jsonable_encoder(value)
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    msgpack = _require("msgpack")
+    if code == _EXT_NDARRAY:
+        return decode(data, NPY)
+    if code == _EXT_DATAFRAME:
+        frame = decode(data, MSGPACK)
+        return pd.DataFrame(
+            dict(zip(frame["columns"], frame["data"])), index=frame["index"]
+        )
+    return msgpack.ExtType(code, data)
+
+
+def encode(value: Any, media: str) -> bytes:
+    """Encode a value with a binary media type
+
+    Args:
+        value (Any): Value to encode
+        media (str): One of the binary media types
+
+    Raises:
+        ValueError: If the media type is not supported
+
+    Returns:
+        bytes: The encoded value
+    """
+    if media == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, value, allow_pickle=False)
+        return buffer.getvalue()
+    if media == ARROW:
+        pyarrow = _require("pyarrow")
+        table = pyarrow.Table.from_pandas(value)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    if media == MSGPACK:
+        msgpack = _require("msgpack")
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+    raise ValueError(f"Unsupported media type: {media}")
+
+
+def decode(data: bytes, media: str) -> Any:
+    """Decode a value from a binary media type
+
+    Args:
+        data (bytes): The encoded value
+        media (str): One of the binary media types
+
+    Raises:
+        ValueError: If the media type is not supported
+
+    Returns:
+        Any: The decoded value
+    """
+    if media == NPY:
+        return np.load(io.BytesIO(data), allow_pickle=False)
+    if media == ARROW:
+        pyarrow = _require("pyarrow")
+        return pyarrow.ipc.open_stream(data).read_all().to_pandas()
+    if media == MSGPACK:
+        msgpack = _require("msgpack")
+        return msgpack.unpackb(
+            data, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False
+        )
+    raise ValueError(f"Unsupported media type: {media}")
@@ -0,0 +1,148 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from daeploy.utilities import spawn_task
+
+logger = logging.getLogger(__name__)
+
+
+class _Batcher:  # pylint: disable=too-many-instance-attributes
+    """Merges concurrent calls to an entrypoint into a single call of the
+    underlying function.
+
+    Every call to :meth:`submit` is put in a pending batch. The batch is
+    dispatched when it reaches ``max_batch_size`` calls or when the oldest call
+    has waited ``max_wait_ms`` milliseconds, whichever comes first. The
+    function is then called with a list of values for each argument and is
+    expected to return a list with one result per call.
+    """
+
+    def __init__(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        """
+        Args:
+            call (Callable[..., Awaitable[Any]]): Awaitable that runs the
+                batched function with a list of values per keyword argument.
+            max_batch_size (int): Largest number of calls merged into one batch.
+            max_wait_ms (float): Longest time in milliseconds a call waits for
+                its batch to fill up before the batch is dispatched anyway.
+
+        Raises:
+            ValueError: If max_batch_size or max_wait_ms are out of range.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, not {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms can not be negative, not {max_wait_ms}")
+
+        self._call = call
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future, float]] = []
+        self._timer = None
+
+        # Statistics
+        self.batches = 0
+        self.calls = 0
+        self.batch_sizes = collections.Counter()
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for their batch to be dispatched"""
+        return len(self._pending)
+
+    async def submit(self, **kwargs) -> Any:
+        """Add a call to the pending batch and wait for its result.
+
+        Args:
+            **kwargs: The arguments of this single call.
+
+        Returns:
+            Any: The result belonging to this call.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((kwargs, future, time.monotonic()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Dispatch the pending calls as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            spawn_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], asyncio.Future, float]]):
+        """Run one batch and hand the results back to the waiting callers"""
+        now = time.monotonic()
+        for _, _, enqueued in batch:
+            wait = now - enqueued
+            self.total_wait += wait
+            self.max_observed_wait = max(self.max_observed_wait, wait)
+        self.batches += 1
+        self.calls += len(batch)
+        self.batch_sizes[len(batch)] += 1
+
+        arguments = collections.defaultdict(list)
+        for kwargs, _, _ in batch:
+            for name, value in kwargs.items():
+                arguments[name].append(value)
+
+        try:
+            results = list(await self._call(**arguments))
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Batched function returned {len(results)} results for a"
+                    f" batch of {len(batch)} inputs"
+                )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("Batched call failed")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            # The caller may have given up waiting (e.g. disconnected)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Batching statistics for this entrypoint
+
+        Returns:
+            dict: Queue depth, batch size distribution and waiting times.
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "calls": self.calls,
+            "batch_sizes": {
+                str(size): count for size, count in sorted(self.batch_sizes.items())
+            },
+            "mean_wait_ms": (
+                (self.total_wait / self.calls * 1000) if self.calls else 0.0
+            ),
+            "max_wait_observed_ms": self.max_observed_wait * 1000,
+        }
@@ -0,0 +1,223 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _canonical(value: Any) -> Any:
+    """Fallback for :func:`json.dumps` that turns values that are not JSON
+    serializable into a stable representation.
+
+    Args:
+        value (Any): Value to canonicalize.
+
+    Returns:
+        Any: A JSON serializable representation of value.
+    """
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return ["ndarray", str(value.dtype), list(value.shape), digest]
+    if isinstance(value, pd.DataFrame):
+        hashed = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        digest = hashlib.sha1(hashed.tobytes()).hexdigest()
+        return ["DataFrame", [str(col) for col in value.columns], digest]
+    if isinstance(value, np.generic):
+        return value.item()
+    return jsonable_encoder(value)
+
+
+def make_key(arguments: dict) -> str:
+    """Create a canonical cache key from the validated arguments of a call.
+
+    Args:
+        arguments (dict): Keyword arguments of the call.
+
+    Returns:
+        str: A key that is equal for equal arguments regardless of their order.
+    """
+    return json.dumps(
+        arguments, sort_keys=True, separators=(",", ":"), default=_canonical
+    )
+
+
+class _ResponseCache:  # pylint: disable=too-many-instance-attributes
+    """LRU cache with an optional time-to-live for the results of an
+    entrypoint."""
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: int = 1024):
+        """
+        Args:
+            ttl (Optional[float]): Seconds that a result is kept in the cache.
+                Defaults to None, in which case results never expire.
+            maxsize (int): Largest number of results kept in the cache. The
+                least recently used result is evicted when it is full.
+                Defaults to 1024.
+
+        Raises:
+            ValueError: If ttl or maxsize are out of range.
+        """
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"Cache ttl must be positive, not {ttl}")
+        if maxsize < 1:
+            raise ValueError(f"Cache maxsize must be at least 1, not {maxsize}")
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Look up a cached result.
+
+        Args:
+            key (str): Cache key of the call.
+
+        Returns:
+            Tuple[bool, Any]: If the key was found and, in that case, the result.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, result = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, result
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, result: Any):
+        """Store a result in the cache, evicting the least recently used
+        result if the cache is full.
+
+        Args:
+            key (str): Cache key of the call.
+            result (Any): Result of the call.
+        """
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all cached results"""
+        with self._lock:
+            self._entries.clear()
+
+    def wrap(self, call: Callable[..., Awaitable[Any]]) -> Callable:
+        """Put the cache in front of an awaitable call.
+
+        Args:
+            call (Callable[..., Awaitable[Any]]): The call to cache.
+
+        Returns:
+            Callable: Awaitable that answers from the cache when possible.
+        """
+
+        async def cached_call(**kwargs):
+            key = make_key(kwargs)
+            hit, result = self.get(key)
+            if hit:
+                return result
+            result = await call(**kwargs)
+            self.put(key, result)
+            return result
+
+        return cached_call
+
+    def stats(self) -> dict:
+        """Cache statistics
+
+        Returns:
+            dict: Configuration, size and hit/miss/eviction counters.
+        """
+        return {
+            "ttl": self.ttl,
+            "maxsize": self.maxsize,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class _SingleFlight:
+    """Coalesces identical concurrent calls of an entrypoint into a single
+    call, whose result all of the callers get. Unlike :class:`_ResponseCache`
+    nothing is kept once the call has finished."""
+
+    def __init__(self):
+        # Calls in flight, by cache key
+        self._calls: Dict[str, asyncio.Future] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+
+    def wrap(self, call: Callable[..., Awaitable[Any]]) -> Callable:
+        """Coalesce identical concurrent calls to an awaitable call.
+
+        Args:
+            call (Callable[..., Awaitable[Any]]): The call to coalesce.
+
+        Returns:
+            Callable: Awaitable that joins an identical call in flight when
+            there is one.
+        """
+
+        def finished(key: str, future: asyncio.Future):
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            # Nobody may be waiting any more if all callers were cancelled
+            if not future.cancelled() and future.exception() is not None:
+                logger.debug(f"Coalesced call failed: {future.exception()!r}")
+
+        async def coalesced_call(**kwargs):
+            key = make_key(kwargs)
+            future = self._calls.get(key)
+            if future is None:
+                self.calls += 1
+                # A task of its own, so that a caller that disconnects does
+                # not cancel the call for the others
+                future = asyncio.ensure_future(call(**kwargs))
+                self._calls[key] = future
+                future.add_done_callback(lambda done: finished(key, done))
+            else:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+
+        return coalesced_call
+
+    def stats(self) -> dict:
+        """Coalescing statistics
+
+        Returns:
+            dict: Calls in flight, calls made and calls that joined another call.
+        """
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
@@ -1,140 +1,704 @@
-# pylint: disable=global-statement
+# pylint: disable=global-statement,too-many-lines
 import queue
 import logging
+import collections
 import threading
 import datetime
+from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import Union, Type, List
-from contextlib import contextmanager
+from typing import Dict, Union, List, Optional, Tuple
 import json
+import base64
+import random
+import re
+import sqlite3
+import time
+import urllib.parse
 
-from sqlalchemy import create_engine, and_, MetaData
-from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, DateTime, Float, Text
+import numpy as np
+from sqlalchemy import create_engine, event, inspect, select, func, type_coerce, case
+from sqlalchemy import Column, Float, Integer, MetaData, Table, Text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.types import NullType, TypeDecorator
 
-from daeploy.utilities import get_db_table_limit
+from daeploy import _encoding
+from daeploy.utilities import (
+    get_db_table_limit,
+    get_db_rollup_limit_seconds,
+    get_db_batch_size,
+    get_db_batch_wait_seconds,
+    get_db_queue_policy,
+    get_db_queue_size,
+)
 
 LOGGER = logging.getLogger(__name__)
 
 SERVICE_DB_PATH = Path("service_db.db")
+# Both engines open the database in the working directory at import, also if
+# the working directory changes afterwards
+_DB_FILE = SERVICE_DB_PATH.absolute()
+
+# Milliseconds that a connection waits for a lock before it gives up
+BUSY_TIMEOUT_MS = 30000
+
+
+def _read_only_uri(path: Path) -> str:
+    """SQLite URI that opens the database at path read-only. The path is
+    quoted, since "?", "#" and "%" have a meaning in URIs."""
+    return f"file:{urllib.parse.quote(str(path))}?mode=ro"
+
+
+# Connections for writing, used by the writer thread and for cleaning
+ENGINE = create_engine(f"sqlite:///{_DB_FILE}")
+# Read-only connections, which in WAL mode neither wait for the writer nor
+# hold it up
+READ_ENGINE = create_engine(
+    f"sqlite:///{_read_only_uri(_DB_FILE)}&uri=true",
+    pool_size=8,
+    max_overflow=8,
+)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Kinds of variables
+VALUE = "value"
+CALL = "call"
+
+
+def to_epoch_ns(timestamp: datetime.datetime) -> int:
+    """Nanoseconds since the epoch of a UTC timestamp. Naive timestamps are
+    taken to be in UTC."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def from_epoch_ns(nanoseconds: int) -> datetime.datetime:
+    """Naive UTC timestamp of nanoseconds since the epoch"""
+    return EPOCH + datetime.timedelta(microseconds=nanoseconds // 1000)
+
+
+class EpochNanoseconds(TypeDecorator):  # pylint: disable=too-many-ancestors
+    """Timestamps stored as integer nanoseconds since the epoch, which are
+    smaller and faster to compare than the text of DateTime columns"""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_epoch_ns(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_epoch_ns(value)
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    @property
+    def python_type(self):
+        return datetime.datetime
+
+
+METADATA = MetaData()
+
+# Names and kinds of the stored variables
+VARIABLES_TABLE = Table(
+    "variables",
+    METADATA,
+    Column("id", Integer, primary_key=True),
+    Column("name", Text, nullable=False, unique=True),
+    Column("kind", Text, nullable=False),
+)
+
+# Values of all variables, clustered by variable and time, so that a range of
+# a variable is read from consecutive pages. Numbers and text are stored in
+# separate columns, one of which is set.
+SAMPLES = Table(
+    "samples",
+    METADATA,
+    Column("variable_id", Integer, primary_key=True),
+    Column("ts", EpochNanoseconds, primary_key=True),
+    Column("value_num", Float),
+    Column("value_text", Text),
+    sqlite_with_rowid=False,
+)
+
+# Calls to monitored entrypoints, clustered like the samples
+CALLS = Table(
+    "calls",
+    METADATA,
+    Column("variable_id", Integer, primary_key=True),
+    Column("ts", EpochNanoseconds, primary_key=True),
+    Column("request", Text),
+    Column("response", Text),
+    Column("latency", Float),
+    Column("status", Integer),
+    sqlite_with_rowid=False,
+)
+
+# Aggregates of the numeric values of each variable over buckets of time,
+# which are kept when old values are cleaned, for the longer retention of
+# their resolution. The resolution is the length of the buckets in seconds
+# and the bucket is the start of the bucket.
+ROLLUPS = Table(
+    "rollups",
+    METADATA,
+    Column("variable_id", Integer, primary_key=True),
+    Column("resolution", Integer, primary_key=True),
+    Column("bucket", EpochNanoseconds, primary_key=True),
+    Column("count", Integer, nullable=False),
+    Column("min", Float, nullable=False),
+    Column("max", Float, nullable=False),
+    Column("sum", Float, nullable=False),
+    Column("last", Float, nullable=False),
+    Column("last_ts", EpochNanoseconds, nullable=False),
+    sqlite_with_rowid=False,
+)
+
+# Seconds per bucket of the rollups, by resolution
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+# Aggregate functions apart from percentiles, which are written as p95 or p99.9
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+PERCENTILE_PATTERN = re.compile(r"p(100|\d{1,2}(\.\d+)?)")
+
+# Bounds of integer timestamps in SQLite
+MIN_NS = -(2**63)
+MAX_NS = 2**63 - 1
+
+TABLES = {VALUE: SAMPLES, CALL: CALLS}
+
+# Columns read for each kind of variable, apart from the timestamp
+COLUMNS = {
+    VALUE: [
+        type_coerce(
+            func.coalesce(SAMPLES.c.value_num, SAMPLES.c.value_text), NullType()
+        ).label("value")
+    ],
+    CALL: [CALLS.c.request, CALLS.c.response, CALLS.c.latency, CALLS.c.status],
+}
+
+_Variable = collections.namedtuple("_Variable", ["id", "kind"])
+
+# What happens to new values when the queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+SAMPLE = "sample"
+
+
+class _Counter:
+    """Counter of a single process, like a shared ``multiprocessing.Value``"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def get_lock(self) -> threading.Lock:
+        """The lock that guards the value"""
+        return self._lock
 
-ENGINE = create_engine(f"sqlite:///{str(SERVICE_DB_PATH)}")
-Base = declarative_base()
-Session = sessionmaker(bind=ENGINE)
 
 QUEUE = queue.Queue()
-TABLES = {}
+QUEUE_SIZE = 0
+QUEUE_POLICY = BLOCK
+# Values put in the queue and values that were dropped because it was full
+ENQUEUED = _Counter()
+DROPPED = _Counter()
+# Seconds between warnings about dropped values
+DROP_WARNING_INTERVAL = 10
+_LAST_DROP_WARNING = -DROP_WARNING_INTERVAL
+# Stored variables, by name
+VARIABLES: Dict[str, _Variable] = {}
 LOCK = threading.Lock()
+# Set in worker processes, where the database is written by the parent process
+IN_WORKER = False
 
+CallRecord = collections.namedtuple(
+    "CallRecord",
+    ["request", "response", "latency", "status", "request_type", "response_type"],
+    defaults=[None, None],
+)
 
-def create_new_ts_table(name: str, dtype: Type) -> Type:
-    """Create a new timeseries table in the db
 
-    Args:
-        name (str): Name of the variable to be stored in the table
-        dtype (Type): Type of the variable to be stored in the table,
-            can be any of float and str
+@event.listens_for(ENGINE, "connect")
+def _configure_writer(dbapi_connection, _):
+    """Write ahead logging lets readers and the writer work at the same time,
+    and with it commits only need to be synced at checkpoints"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
-    Raises:
-        TypeError: If dtype is not one of float or str
+
+@event.listens_for(READ_ENGINE, "connect")
+def _configure_reader(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # Map the database into memory for range scans, up to 256 MB
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
+def _create_variable(connection: Connection, name: str, kind: str) -> _Variable:
+    """Add a variable to the variable dictionary, if it is not there already
+
+    Args:
+        connection (Connection): Connection with an open transaction
+        name (str): Name of the variable
+        kind (str): What is stored for the variable, values or calls
 
     Returns:
-        Type: Newly created mapped type
+        _Variable: The id and the kind of the variable
     """
-    # Find correct SQL type to use
-    if dtype == float:
-        sql_type = Float
-    elif dtype == str:
-        sql_type = Text
-    else:
-        raise TypeError(
-            f"Monitored variable {name} is of an unacceptable type: {dtype} "
-            "and will not be stored! Has to be one of float|str."
-        )
+    created = connection.execute(
+        VARIABLES_TABLE.insert().prefix_with("OR IGNORE"), {"name": name, "kind": kind}
+    ).rowcount
+    variable = _Variable(
+        *connection.execute(
+            select(VARIABLES_TABLE.c.id, VARIABLES_TABLE.c.kind).where(
+                VARIABLES_TABLE.c.name == name
+            )
+        ).one()
+    )
+    if created:
+        LOGGER.info(f"Created new variable {name}")
+    return variable
+
+
+def _load_variables(engine=READ_ENGINE):
+    """Read the variable dictionary from the database"""
+    global VARIABLES
+    with engine.connect() as connection:
+        VARIABLES = {
+            name: _Variable(variable_id, kind)
+            for variable_id, name, kind in connection.execute(
+                select(
+                    VARIABLES_TABLE.c.id, VARIABLES_TABLE.c.name, VARIABLES_TABLE.c.kind
+                ).order_by(VARIABLES_TABLE.c.id)
+            )
+        }
+
+
+def _split_value(value) -> Tuple[Optional[float], Optional[str]]:
+    """The numeric and the text column of a value, one of which is None"""
+    if isinstance(value, (int, float)):
+        return float(value), None
+    return None, value
 
-    # Create table mapper class
-    MapperClass = type(  # pylint: disable=invalid-name
-        name.capitalize(),
-        (Base,),
-        {
-            "__tablename__": name,
-            "timestamp": Column(
-                DateTime, primary_key=True, index=True, default=datetime.datetime.utcnow
-            ),
-            "value": Column(sql_type),
-        },
+
+def _create_schema():
+    """Create the tables, and move the values of a database from an earlier
+    version of the SDK, with one table per variable, to them"""
+    inspector = inspect(ENGINE)
+    legacy = {}
+    for table in inspector.get_table_names():
+        columns = [column["name"] for column in inspector.get_columns(table)]
+        if "timestamp" in columns:
+            legacy[table] = CALL if "request" in columns else VALUE
+    new_rollups = ROLLUPS.name not in inspector.get_table_names() or (
+        ROLLUPS.name in legacy
     )
 
-    # Create the actual table
-    MapperClass.__table__.create(ENGINE, checkfirst=True)
+    with LOCK, ENGINE.begin() as connection:
+        quote = connection.dialect.identifier_preparer.quote
+        # Variables with the names of the new tables are moved out of the way
+        renamed = {}
+        for name in legacy:
+            renamed[name] = f"_legacy_{name}" if name in METADATA.tables else name
+            if renamed[name] != name:
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {quote(name)} RENAME TO {quote(renamed[name])}"
+                )
+        METADATA.create_all(connection)
 
-    LOGGER.info(f"Created new table for variable {name}")
+        for name, kind in legacy.items():
+            variable = _create_variable(connection, name, kind)
+            result = connection.exec_driver_sql(
+                f"SELECT * FROM {quote(renamed[name])}"
+            ).mappings()
+            for rows in result.partitions(10000):
+                connection.execute(
+                    TABLES[kind].insert().prefix_with("OR IGNORE"),
+                    [_legacy_row(variable.id, kind, row) for row in rows],
+                )
+            connection.exec_driver_sql(f"DROP TABLE {quote(renamed[name])}")
+            LOGGER.info(f"Migrated variable {name} to the long format")
 
-    return MapperClass
+        if new_rollups:
+            _backfill_rollups(connection)
 
+    if legacy:
+        # Give the space of the dropped tables back to the file system
+        with ENGINE.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.exec_driver_sql("VACUUM")
 
-# pylint: disable=no-member
-@contextmanager
-def session_scope() -> Session:
-    """Define a database session.
 
-    Raises:
-        Exception: Exception that occurs during the session.
+def _backfill_rollups(connection: Connection):
+    """Compute the rollups of the values that were stored before the rollups
+    were added"""
+    for seconds in RESOLUTIONS.values():
+        width = seconds * 10**9
+        connection.exec_driver_sql(
+            """
+            INSERT INTO rollups
+            SELECT variable_id, ?, bucket, COUNT(*), MIN(value_num),
+                MAX(value_num), SUM(value_num), last, MAX(ts)
+            FROM (
+                SELECT variable_id, ts - ts % ? AS bucket, ts, value_num,
+                    LAST_VALUE(value_num) OVER (
+                        PARTITION BY variable_id, ts - ts % ? ORDER BY ts
+                        ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                    ) AS last
+                FROM samples
+                WHERE value_num IS NOT NULL
+            )
+            GROUP BY variable_id, bucket
+            """,
+            (seconds, width, width),
+        )
+
+
+def _rollup_rows(samples: List[tuple]) -> List[dict]:
+    """Aggregate numeric values per variable and bucket of each resolution
 
-    Yields:
-        Session: Database session.
+    Args:
+        samples (List[tuple]): Variable id, timestamp in nanoseconds and
+            numeric value, or None, of each value
+
+    Returns:
+        List[dict]: Rows of the rollups table
     """
-    session = Session()
-    try:
-        yield session
-        session.commit()
-    except Exception as exc:
-        session.rollback()
-        raise exc
-    finally:
-        session.close()
+    rollups: Dict[tuple, dict] = {}
+    for variable_id, timestamp, value in samples:
+        if value is None:
+            continue
+        for seconds in RESOLUTIONS.values():
+            width = seconds * 10**9
+            key = (variable_id, seconds, timestamp - timestamp % width)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = {
+                    "variable_id": variable_id,
+                    "resolution": seconds,
+                    "bucket": key[2],
+                    "count": 1,
+                    "min": value,
+                    "max": value,
+                    "sum": value,
+                    "last": value,
+                    "last_ts": timestamp,
+                }
+                continue
+            rollup["count"] += 1
+            rollup["min"] = min(rollup["min"], value)
+            rollup["max"] = max(rollup["max"], value)
+            rollup["sum"] += value
+            if timestamp >= rollup["last_ts"]:
+                rollup["last"] = value
+                rollup["last_ts"] = timestamp
+    for rollup in rollups.values():
+        rollup["bucket"] = from_epoch_ns(rollup["bucket"])
+        rollup["last_ts"] = from_epoch_ns(rollup["last_ts"])
+    return list(rollups.values())
 
 
-# pylint: disable=no-member
-def _writer():
-    """Writer thread function"""
-    while True:
-        # Get next value from queue
-        item = QUEUE.get()
-        if not item:
-            # Time to shut down
+def _insert_samples(connection: Connection, rows: List[dict]):
+    """Insert rows into the samples table and add them to the rollups. Values
+    with the same timestamp as a stored value of the variable are skipped,
+    like single inserts that violate the primary key.
+
+    Args:
+        connection (Connection): Connection with an open transaction
+        rows (List[dict]): Rows of the samples table
+    """
+    inserted = connection.execute(
+        SAMPLES.insert()
+        .prefix_with("OR IGNORE")
+        .returning(
+            SAMPLES.c.variable_id,
+            type_coerce(SAMPLES.c.ts, Integer),
+            SAMPLES.c.value_num,
+        ),
+        rows,
+    ).all()
+    rollups = _rollup_rows(inserted)
+    if not rollups:
+        return
+    insert = sqlite_insert(ROLLUPS)
+    new = insert.excluded
+    connection.execute(
+        insert.on_conflict_do_update(
+            index_elements=[
+                ROLLUPS.c.variable_id,
+                ROLLUPS.c.resolution,
+                ROLLUPS.c.bucket,
+            ],
+            set_={
+                "count": ROLLUPS.c.count + new.count,
+                "min": func.min(ROLLUPS.c.min, new.min),
+                "max": func.max(ROLLUPS.c.max, new.max),
+                "sum": ROLLUPS.c.sum + new.sum,
+                "last": case(
+                    (new.last_ts >= ROLLUPS.c.last_ts, new.last), else_=ROLLUPS.c.last
+                ),
+                "last_ts": func.max(ROLLUPS.c.last_ts, new.last_ts),
+            },
+        ),
+        rollups,
+    )
+
+
+def _legacy_row(variable_id: int, kind: str, row) -> dict:
+    """Row of the long format for a row of a table of an earlier version"""
+    timestamp = row["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if kind == CALL:
+        return {
+            "variable_id": variable_id,
+            "ts": timestamp,
+            "request": row["request"],
+            "response": row["response"],
+            "latency": row["latency"],
+            "status": row["status"],
+        }
+    value_num, value_text = _split_value(row["value"])
+    return {
+        "variable_id": variable_id,
+        "ts": timestamp,
+        "value_num": value_num,
+        "value_text": value_text,
+    }
+
+
+def _next_batch(max_size: int, max_wait: float) -> list:
+    """Wait for the next value in the queue and take the values that follow it,
+    up to max_size values or until max_wait seconds have passed. A None in the
+    batch means that the writer should stop after writing the batch."""
+    batch = [QUEUE.get()]
+    deadline = time.monotonic() + max_wait
+    while batch[-1] is not None and len(batch) < max_size:
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                batch.append(QUEUE.get(timeout=remaining))
+            else:
+                batch.append(QUEUE.get_nowait())
+        except queue.Empty:
             break
+    return batch
 
-        name, value, timestamp = item
 
-        # Create table if not exists and get mapped class
+def _write_batch(batch: list):
+    """Write a batch of values with one bulk insert per table, in a single
+    transaction. If that fails, the values are written one by one, so that
+    only the values that can not be written are lost."""
+    rows: Dict[Tuple[str, str], List[dict]] = collections.defaultdict(list)
+    for name, value, timestamp in batch:
         try:
-            # Try to save as json strings if value is not a string or number
-            if not isinstance(value, (float, str)):
-                value = json.dumps(value)
-
-            if name not in TABLES:
-                with LOCK:
-                    TABLES[name] = create_new_ts_table(name, type(value))
-            item = TABLES[name](timestamp=timestamp, value=value)
+            if isinstance(value, CallRecord):
+                kind, row = CALL, _call_row(value)
+            else:
+                kind, row = VALUE, _value_row(value)
         except Exception as exc:  # pylint: disable=broad-except
             LOGGER.exception(str(exc))
             continue
+        row["ts"] = timestamp
+        rows[(name, kind)].append(row)
+
+    if not rows:
+        return
+    try:
+        _insert_rows(rows)
+        return
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.exception(f"Write of {len(batch)} values to db failed, retrying")
+
+    for (name, kind), variable_rows in rows.items():
+        for row in variable_rows:
+            try:
+                _insert_rows({(name, kind): [row]})
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception(f"Write of {name} at {row['ts']} to db failed!")
+
+
+def _insert_rows(rows: Dict[Tuple[str, str], List[dict]]):
+    """Insert rows of values and calls, by variable name and kind, in a single
+    transaction"""
+    new = {}
+    tables: Dict[str, list] = collections.defaultdict(list)
+    with LOCK, ENGINE.begin() as connection:
+        for (name, kind), variable_rows in rows.items():
+            variable = VARIABLES.get(name) or new.get(name)
+            if variable is None:
+                variable = new[name] = _create_variable(connection, name, kind)
+            if variable.kind != kind:
+                LOGGER.error(
+                    f"Can not store {kind}s in {name}, which stores {variable.kind}s"
+                )
+                continue
+            for row in variable_rows:
+                row["variable_id"] = variable.id
+            tables[kind].extend(variable_rows)
+        if tables[VALUE]:
+            _insert_samples(connection, tables[VALUE])
+        if tables[CALL]:
+            # Calls with the same timestamp as a stored call are skipped
+            insert = CALLS.insert().prefix_with("OR IGNORE")
+            connection.execute(insert, tables[CALL])
+    # Only variables that have been committed are known
+    VARIABLES.update(new)
+
+
+def _writer():
+    """Writer thread function. Values are taken from the queue in batches,
+    which are written in one transaction each."""
+    max_size = get_db_batch_size()
+    max_wait = get_db_batch_wait_seconds()
+    while True:
+        batch = _next_batch(max_size, max_wait)
+        stop = batch[-1] is None
+        if stop:
+            batch.pop()
+
+        _write_batch(batch)
+        for _ in batch:
+            QUEUE.task_done()
+
+        if stop:
+            # Time to shut down
+            break
 
-        # Write value to table!
-        try:
-            with LOCK, session_scope() as session:
-                session.add(item)
-        except Exception:  # pylint: disable=broad-except
-            LOGGER.exception("Write to db failed!")
 
-        QUEUE.task_done()
+def _value_row(value) -> dict:
+    """Create a row for a stored value"""
+    # Try to save as json strings if value is not a string or number
+    if not isinstance(value, (float, str)):
+        value = json.dumps(value)
+    value_num, value_text = _split_value(value)
+    return {"value_num": value_num, "value_text": value_text}
+
+
+def _call_row(record: CallRecord) -> dict:
+    """Create a row for an entrypoint call"""
+    # Decoding is done here, in the writer thread, to keep it off the
+    # request path.
+    return {
+        "request": _body_text(record.request, record.request_type),
+        "response": _body_text(record.response, record.response_type),
+        "latency": record.latency,
+        "status": record.status,
+    }
+
+
+def _body_text(body: bytes, content_type: str = None) -> str:
+    """Text to store for a request or response body. Binary bodies are
+    stored as base64 together with their media type, so that they can be
+    decoded again."""
+    media = _encoding.media_type(content_type)
+    if media in _encoding.BINARY_MEDIA_TYPES:
+        return json.dumps(
+            {"media_type": media, "base64": base64.b64encode(body).decode("ascii")}
+        )
+    return body.decode("utf-8", errors="replace")
 
 
 WRITER_THREAD = threading.Thread(target=_writer, daemon=True)
 
 
+def _count(counter: _Counter):
+    with counter.get_lock():
+        counter.value += 1
+
+
+def _drop(reason: str):
+    global _LAST_DROP_WARNING
+    _count(DROPPED)
+    now = time.monotonic()
+    if now - _LAST_DROP_WARNING >= DROP_WARNING_INTERVAL:
+        _LAST_DROP_WARNING = now
+        LOGGER.warning(
+            f"Monitoring queue is full, dropping the {reason} values."
+            f" {DROPPED.value} values have been dropped."
+        )
+
+
+def _enqueue(item: tuple):
+    """Put a value in the queue of the writer, applying the policy of the
+    queue when it is full"""
+    if QUEUE_POLICY == BLOCK:
+        QUEUE.put(item)
+        _count(ENQUEUED)
+        return
+
+    if QUEUE_POLICY == SAMPLE:
+        # From half full, new values are kept with a probability that falls
+        # to zero as the queue fills up
+        half = QUEUE_SIZE / 2
+        depth = QUEUE.qsize()
+        if depth > half and random.random() > (QUEUE_SIZE - depth) / half:
+            _drop("sampled")
+            return
+
+    try:
+        QUEUE.put_nowait(item)
+    except queue.Full:
+        if QUEUE_POLICY != DROP_OLDEST or not _drop_oldest():
+            _drop("newest")
+            return
+        try:
+            QUEUE.put_nowait(item)
+        except queue.Full:
+            # Another thread or process took the free place
+            _drop("newest")
+            return
+    _count(ENQUEUED)
+
+
+def _drop_oldest() -> bool:
+    """Remove the oldest value from the queue, unless it is the signal for the
+    writer to stop
+
+    Returns:
+        bool: If a value was removed.
+    """
+    try:
+        oldest = QUEUE.get_nowait()
+    except queue.Empty:
+        return True
+    QUEUE.task_done()
+    if oldest is None:
+        # The writer must still stop, after the values that are left
+        QUEUE.put(None)
+        return False
+    _drop("oldest")
+    return True
+
+
+def queue_stats() -> dict:
+    """Statistics of the queue of values waiting to be written
+
+    Returns:
+        dict: Size and policy of the queue, the number of waiting values and
+        the numbers of enqueued and dropped values.
+    """
+    return {
+        "max_size": QUEUE_SIZE,
+        "policy": QUEUE_POLICY,
+        "depth": queue_depth(),
+        "enqueued": ENQUEUED.value,
+        "dropped": DROPPED.value,
+    }
+
+
 def write_to_ts(name: str, value: Union[float, str], timestamp: datetime.datetime):
     """Write a value to the timeseries identified by name
 
@@ -143,22 +707,94 @@ def write_to_ts(name: str, value: Union[float, str], timestamp: datetime.datetim
         value (Union[float, str]): Value to be written
         timestamp (datetime.datetime): Timestamp for measurment
     """
-    QUEUE.put((name, value, timestamp))
+    _enqueue((name, value, timestamp))
+
+
+def write_call(
+    name: str,
+    request: bytes,
+    response: bytes,
+    latency: float,
+    status: int,
+    timestamp: datetime.datetime,
+    request_type: str = None,
+    response_type: str = None,
+):
+    """Write a call to a monitored entrypoint as one linked record
+
+    Args:
+        name (str): Identifier of the entrypoint calls
+        request (bytes): Raw request body
+        response (bytes): Raw response body
+        latency (float): Time in seconds to handle the request
+        status (int): HTTP status code of the response
+        timestamp (datetime.datetime): Timestamp of the call
+        request_type (str): Content type of the request. Defaults to None.
+        response_type (str): Content type of the response. Defaults to None.
+    """
+    record = CallRecord(request, response, latency, status, request_type, response_type)
+    _enqueue((name, record, timestamp))
+
+
+def queue_depth() -> int:
+    """Number of values waiting to be written to the database
+
+    Returns:
+        int: Approximate size of the write queue.
+    """
+    return QUEUE.qsize()
 
 
-def stored_variables() -> List[str]:
+def stored_variables(kind: Optional[str] = None) -> List[str]:
     """Returns a list of the variables that are currently being stored in the db
 
+    Args:
+        kind (Optional[str]): Only the variables that store values or calls.
+            Defaults to None, which gives all variables.
+
     Returns:
         List[str]: List of variables names.
     """
-    return list(TABLES.keys())
+    if IN_WORKER:
+        # Variables are created by the writer in the parent process
+        _load_variables()
+    return [
+        name
+        for name, variable in VARIABLES.items()
+        if kind is None or variable.kind == kind
+    ]
+
+
+def _get_variable(name: str) -> _Variable:
+    """Look up a variable, looking for new variables in worker processes"""
+    if name not in VARIABLES and IN_WORKER:
+        _load_variables()
+    try:
+        return VARIABLES[name]
+    except KeyError as exc:
+        raise ValueError(f"Timeseries with identifier {name} does not exist!") from exc
+
+
+def stored_columns(name: str) -> List[str]:
+    """Returns the names of the columns stored for a variable, apart from
+    the timestamp.
+
+    Args:
+        name (str): Identifier of timeseries
+
+    Raises:
+        ValueError: If a variable with identifier `name` can not
+             be found in the database
+
+    Returns:
+        List[str]: Column names, e.g. ``["value"]`` for stored variables.
+    """
+    return [column.name for column in COLUMNS[_get_variable(name).kind]]
 
 
-# pylint: disable=no-member
 def read_from_ts(
     name: str, from_time: datetime.datetime = None, to_time: datetime.datetime = None
-) -> List:
+) -> List[Row]:
     """Read from a specific timeseries
 
     Args:
@@ -173,62 +809,393 @@ def read_from_ts(
              be found in the database
 
     Returns:
-        List: A list of results
+        List[Row]: The records in order of time, with a ``timestamp`` and the
+        stored columns.
     """
-    if name not in TABLES:
-        raise ValueError(f"Timeseries with identifier {name} does not exist!")
+    variable = _get_variable(name)
+    table = TABLES[variable.kind]
+
+    query = select(table.c.ts.label("timestamp"), *COLUMNS[variable.kind]).where(
+        table.c.variable_id == variable.id,
+        table.c.ts <= (to_time or datetime.datetime.utcnow()),
+    )
+    if from_time is not None:
+        query = query.where(table.c.ts >= from_time)
+
+    with READ_ENGINE.connect() as connection:
+        return connection.execute(query.order_by(table.c.ts)).all()
 
-    from_time = from_time or datetime.datetime.min
-    to_time = to_time or datetime.datetime.utcnow()
 
-    Item = TABLES[name]  # pylint: disable=invalid-name
+def read_rollups(
+    name: str,
+    resolution: str,
+    from_time: datetime.datetime = None,
+    to_time: datetime.datetime = None,
+) -> List[Row]:
+    """Read the rollups of the numeric values of a variable
+
+    Args:
+        name (str): Identifier of timeseries to read from
+        resolution (str): Length of the buckets, one of "1m", "1h" and "1d"
+        from_time (datetime.datetime): Read buckets that end after this
+            point in time. Defaults to None.
+        to_time (datetime.datetime): Read buckets that start before this
+             point in time. Defaults to None.
+
+    Raises:
+        ValueError: If a variable with identifier `name` can not
+             be found in the database, it does not store values or the
+             resolution is not valid
+
+    Returns:
+        List[Row]: The buckets in order of time, with the ``timestamp`` of
+        the start of the bucket and the ``count``, ``min``, ``max``, ``mean``,
+        ``sum`` and ``last`` of the values in it.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(
+            f"Invalid resolution: {resolution}. Possible options: {list(RESOLUTIONS)}"
+        )
+    variable = _get_variable(name)
+    if variable.kind != VALUE:
+        raise ValueError(f"Timeseries with identifier {name} has no rollups!")
+    seconds = RESOLUTIONS[resolution]
 
-    with session_scope() as session:
-        records = (
-            session.query(Item)
-            .filter(and_(Item.timestamp >= from_time, Item.timestamp <= to_time))
-            .all()
+    query = select(
+        ROLLUPS.c.bucket.label("timestamp"),
+        ROLLUPS.c.count,
+        ROLLUPS.c.min,
+        ROLLUPS.c.max,
+        (ROLLUPS.c.sum / ROLLUPS.c.count).label("mean"),
+        ROLLUPS.c.sum,
+        ROLLUPS.c.last,
+    ).where(
+        ROLLUPS.c.variable_id == variable.id,
+        ROLLUPS.c.resolution == seconds,
+        ROLLUPS.c.bucket <= (to_time or datetime.datetime.utcnow()),
+    )
+    if from_time is not None:
+        query = query.where(
+            ROLLUPS.c.bucket > from_time - datetime.timedelta(seconds=seconds)
         )
-        session.expunge_all()  # Detach record(s) from session
-        return records
+
+    with READ_ENGINE.connect() as connection:
+        return connection.execute(query.order_by(ROLLUPS.c.bucket)).all()
+
+
+def parse_aggregates(functions: List[str]) -> Dict[str, float]:
+    """Check the names of aggregate functions
+
+    Args:
+        functions (List[str]): Aggregate functions: "count", "sum", "mean",
+            "min", "max" and percentiles such as "p95"
+
+    Raises:
+        ValueError: If one of the functions is not valid
+
+    Returns:
+        Dict[str, float]: The fraction of each percentile, by function name
+    """
+    percentiles = {}
+    for function in functions:
+        if PERCENTILE_PATTERN.fullmatch(function):
+            percentiles[function] = float(function[1:]) / 100
+        elif function not in AGGREGATES:
+            raise ValueError(
+                f"Invalid aggregate function: {function}. Possible options:"
+                f" {list(AGGREGATES)} and percentiles, e.g. p95"
+            )
+    return percentiles
+
+
+def aggregate_ts(
+    name: str,
+    bucket: int,
+    functions: List[str],
+    from_time: datetime.datetime = None,
+    to_time: datetime.datetime = None,
+) -> Dict[str, np.ndarray]:
+    """Aggregate the numeric values of a variable over buckets of time
+
+    Without percentiles the values are aggregated by SQLite. If the time range
+    and the buckets are aligned with the buckets of the rollups, the rollups
+    are aggregated instead, which include values that have been cleaned.
+    Percentiles are computed with numpy over the values in the time range.
+
+    Args:
+        name (str): Identifier of timeseries to aggregate
+        bucket (int): Length of the buckets in seconds, which start at
+            multiples of the length since the epoch
+        functions (List[str]): Aggregate functions: "count", "sum", "mean",
+            "min", "max" and percentiles such as "p95"
+        from_time (datetime.datetime): Aggregate values from this point in
+            time. Defaults to None.
+        to_time (datetime.datetime): Aggregate values before this point in
+            time. Defaults to None.
+
+    Raises:
+        ValueError: If a variable with identifier `name` can not be found in
+            the database, it does not store values, or the bucket or one of
+            the functions is not valid
+
+    Returns:
+        Dict[str, np.ndarray]: The ``timestamp`` of the start of each bucket
+        with values and the result of each function.
+    """
+    if bucket < 1:
+        raise ValueError(f"bucket must be at least one second, not {bucket}")
+    percentiles = parse_aggregates(functions)
+    variable = _get_variable(name)
+    if variable.kind != VALUE:
+        raise ValueError(f"Timeseries with identifier {name} has no numeric values!")
+
+    width = bucket * 10**9
+    start = MIN_NS if from_time is None else to_epoch_ns(from_time)
+    end = MAX_NS if to_time is None else to_epoch_ns(to_time)
+    if percentiles:
+        buckets, results = _aggregate_values(
+            variable.id, width, functions, percentiles, start, end
+        )
+    else:
+        buckets, results = _aggregate_in_sqlite(
+            variable.id, width, functions, start, end
+        )
+    return {"timestamp": buckets.astype("datetime64[ns]"), **results}
+
+
+def _rollup_resolution(width: int, start: int, end: int) -> Optional[int]:
+    """The longest resolution of the rollups that the buckets and the time
+    range are aligned with, if any"""
+    for seconds in sorted(RESOLUTIONS.values(), reverse=True):
+        resolution = seconds * 10**9
+        if width % resolution == 0 and all(
+            bound in (MIN_NS, MAX_NS) or bound % resolution == 0
+            for bound in (start, end)
+        ):
+            return seconds
+    return None
+
+
+def _aggregate_in_sqlite(
+    variable_id: int, width: int, functions: List[str], start: int, end: int
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Aggregate with GROUP BY, over the rollups if possible"""
+    resolution = _rollup_resolution(width, start, end)
+    if resolution is not None:
+        table = ROLLUPS
+        timestamp = type_coerce(ROLLUPS.c.bucket, Integer)
+        aggregates = {
+            "count": func.sum(ROLLUPS.c.count),
+            "sum": func.sum(ROLLUPS.c.sum),
+            "mean": func.sum(ROLLUPS.c.sum) / func.sum(ROLLUPS.c.count),
+            "min": func.min(ROLLUPS.c.min),
+            "max": func.max(ROLLUPS.c.max),
+        }
+        condition = ROLLUPS.c.resolution == resolution
+    else:
+        table = SAMPLES
+        timestamp = type_coerce(SAMPLES.c.ts, Integer)
+        aggregates = {
+            "count": func.count(SAMPLES.c.value_num),
+            "sum": func.sum(SAMPLES.c.value_num),
+            "mean": func.avg(SAMPLES.c.value_num),
+            "min": func.min(SAMPLES.c.value_num),
+            "max": func.max(SAMPLES.c.value_num),
+        }
+        condition = SAMPLES.c.value_num.isnot(None)
+
+    bucket = (timestamp - timestamp % width).label("bucket")
+    query = (
+        select(bucket, *(aggregates[function] for function in functions))
+        .where(
+            table.c.variable_id == variable_id,
+            condition,
+            timestamp >= start,
+            timestamp < end,
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    with READ_ENGINE.connect() as connection:
+        rows = connection.execute(query).all()
+
+    columns = list(zip(*rows)) or [()] * (len(functions) + 1)
+    return np.array(columns[0], dtype=np.int64), {
+        function: np.array(
+            column, dtype=np.int64 if function == "count" else np.float64
+        )
+        for function, column in zip(functions, columns[1:])
+    }
+
+
+def _aggregate_values(  # pylint: disable=too-many-locals
+    variable_id: int,
+    width: int,
+    functions: List[str],
+    percentiles: Dict[str, float],
+    start: int,
+    end: int,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Aggregate with numpy, which reads the values of the time range"""
+    connection = READ_ENGINE.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT ts, value_num FROM samples WHERE variable_id = ?"
+            " AND ts >= ? AND ts < ? AND value_num IS NOT NULL ORDER BY ts",
+            (variable_id, start, end),
+        )
+        rows = cursor.fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        return np.array([], dtype=np.int64), {
+            function: np.array([], dtype=np.int64 if function == "count" else None)
+            for function in functions
+        }
+    timestamps, values = (np.array(column) for column in zip(*rows))
+
+    # The values are in order of time, so each bucket is a slice of them
+    buckets = timestamps - timestamps % width
+    starts = np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1]))
+    counts = np.diff(np.append(starts, len(values)))
+    sums = np.add.reduceat(values, starts)
+    results = {
+        "count": counts,
+        "sum": sums,
+        "mean": sums / counts,
+        "min": np.minimum.reduceat(values, starts),
+        "max": np.maximum.reduceat(values, starts),
+    }
+
+    # Percentiles interpolate linearly between the sorted values of a bucket,
+    # like numpy.percentile
+    ordered = values[np.lexsort((values, buckets))]
+    for function, fraction in percentiles.items():
+        position = starts + (counts - 1) * fraction
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, starts + counts - 1)
+        results[function] = ordered[lower] + (ordered[upper] - ordered[lower]) * (
+            position - lower
+        )
+    return buckets[starts], {function: results[function] for function in functions}
+
+
+def backup_db(path: Union[str, Path]):
+    """Write a consistent copy of the database to a file, without stopping
+    the writer.
+
+    Args:
+        path (Union[str, Path]): File to write the copy to.
+    """
+    source = READ_ENGINE.raw_connection()
+    target = sqlite3.connect(str(path))
+    try:
+        # Copies the database as of the start of a read transaction, which
+        # includes the values that are still in the write ahead log
+        source.driver_connection.backup(target)
+    finally:
+        target.close()
+        source.close()
 
 
 def clean_database():
+    """Remove the values beyond the table limit and the rollups beyond the
+    retention of their resolution, which is longer. Only the process that
+    writes the database cleans it, so this does nothing in worker processes."""
+    if IN_WORKER:
+        return
     limit, limit_unit = get_db_table_limit()
-    with session_scope() as session:
-        for Item in TABLES.values():  # pylint: disable=invalid-name
+    with LOCK, ENGINE.begin() as connection:
+        variables = connection.execute(
+            select(VARIABLES_TABLE.c.id, VARIABLES_TABLE.c.kind)
+        ).all()
+        for variable_id, kind in variables:
+            table = TABLES[kind]
             if limit_unit == "rows":
                 # Get the limit:th largest timestamp
-                limit_date = (
-                    session.query(Item.timestamp)
-                    .order_by(Item.timestamp.desc())
+                limit_date = connection.execute(
+                    select(table.c.ts)
+                    .where(table.c.variable_id == variable_id)
+                    .order_by(table.c.ts.desc())
                     .offset(limit)
-                    .first()
-                )[0]
-                session.query(Item).filter(Item.timestamp <= limit_date).delete()
+                    .limit(1)
+                ).scalar()
+                if limit_date is None:
+                    continue
             else:
-                from_time = datetime.datetime.utcnow() - datetime.timedelta(
+                limit_date = datetime.datetime.utcnow() - datetime.timedelta(
                     **{limit_unit: limit}
                 )
-                session.query(Item).filter(Item.timestamp <= from_time).delete()
-
-
-def initialize_db():
-    """Initializes the database."""
-    global QUEUE
-    QUEUE = queue.Queue()
-    global TABLES
-    # Reflect any existing tables using automap
-    AutoBase = automap_base(metadata=MetaData())
-    AutoBase.prepare(autoload_with=ENGINE)
-    TABLES = dict(AutoBase.classes)
+            connection.execute(
+                table.delete().where(
+                    table.c.variable_id == variable_id, table.c.ts <= limit_date
+                )
+            )
+
+        # Rollups have their own retention, so that long-term trends remain
+        # after the values have been cleaned. Buckets are removed once they
+        # have ended before the retention of their resolution.
+        now = datetime.datetime.utcnow()
+        for resolution, seconds in RESOLUTIONS.items():
+            retention = datetime.timedelta(
+                seconds=get_db_rollup_limit_seconds(resolution)
+            )
+            connection.execute(
+                ROLLUPS.delete().where(
+                    ROLLUPS.c.resolution == seconds,
+                    ROLLUPS.c.bucket
+                    <= now - retention - datetime.timedelta(seconds=seconds),
+                )
+            )
+
+
+def initialize_db(context: Optional[BaseContext] = None):
+    """Initializes the database.
+
+    In worker processes, only the variables are read, since values are
+    written through the queue of the parent process.
+
+    Args:
+        context (Optional[BaseContext]): Multiprocessing context of the write
+            queue and its counters, which lets processes that are forked
+            afterwards write through the writer thread of this process.
+            Defaults to None, for a queue within this process.
+    """
+    global QUEUE, QUEUE_SIZE, QUEUE_POLICY, ENQUEUED, DROPPED
+    if IN_WORKER:
+        # Connections must not be shared with the parent process
+        ENGINE.dispose(close=False)
+        READ_ENGINE.dispose(close=False)
+        _load_variables()
+        return
+    QUEUE_SIZE = get_db_queue_size()
+    QUEUE_POLICY = get_db_queue_policy()
+    if context is None:
+        QUEUE = queue.Queue(QUEUE_SIZE)
+        ENQUEUED, DROPPED = _Counter(), _Counter()
+    else:
+        QUEUE = context.JoinableQueue(QUEUE_SIZE)
+        ENQUEUED, DROPPED = context.Value("q", 0), context.Value("q", 0)
+    _create_schema()
+    _load_variables(ENGINE)
     WRITER_THREAD.start()
     LOGGER.info("DB started!")
 
 
+def as_worker():
+    """Mark this process as a worker, forked from the process that writes
+    the database."""
+    global IN_WORKER
+    IN_WORKER = True
+
+
 def remove_db():
     """Remove db"""
-    global WRITER_THREAD, Base
+    global WRITER_THREAD, VARIABLES
+    if IN_WORKER:
+        # The parent process owns the database
+        return
 
     # Stop and join writer thread if alive
     if WRITER_THREAD.is_alive():
@@ -238,16 +1205,15 @@ def remove_db():
     # Reset it
     WRITER_THREAD = threading.Thread(target=_writer, daemon=True)
 
-    # Reset tables tracking
-    TABLES.clear()
+    # Reset variables tracking
+    VARIABLES = {}
 
-    # Remove db
+    # Remove db, with its write ahead log and shared memory index
+    READ_ENGINE.dispose()
     ENGINE.dispose()
-    try:
-        SERVICE_DB_PATH.unlink()
-    except FileNotFoundError:
-        pass
-
-    # Reset base so new tables get fresh mappers
-    Base = declarative_base()
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            Path(f"{_DB_FILE}{suffix}").unlink()
+        except FileNotFoundError:
+            pass
     LOGGER.info("DB has been shut down!")
@@ -0,0 +1,346 @@
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import anyio
+import anyio.to_thread
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Workers are forked, so that they inherit the entrypoint function and
+# everything it uses, like a model loaded by a warm-up hook
+CONTEXT = multiprocessing.get_context("fork")
+
+# Arrays smaller than this are pickled, since setting up shared memory costs
+# more than copying them through the pipe
+SHARED_MEMORY_MIN_BYTES = 64 * 1024
+
+
+class _SharedArray:
+    """Reference to a numpy array in shared memory, sent instead of the array"""
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _share(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    """Move a large numpy array to shared memory, other values are left as
+    they are. The shared memory block is appended to ``blocks``."""
+    if (
+        not isinstance(value, np.ndarray)
+        or value.dtype.hasobject
+        or value.nbytes < SHARED_MEMORY_MIN_BYTES
+    ):
+        return value
+    block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+    blocks.append(block)
+    np.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+    return _SharedArray(block.name, value.shape, value.dtype.str)
+
+
+def _attach(
+    value: Any, blocks: List[shared_memory.SharedMemory], copy: bool = False
+) -> Any:
+    """Get the numpy array of a value in shared memory, other values are
+    returned as they are. Without ``copy`` the array is a view of the shared
+    memory, which is only valid until the attached block is closed."""
+    if not isinstance(value, _SharedArray):
+        return value
+    block = shared_memory.SharedMemory(name=value.name)
+    blocks.append(block)
+    array = np.ndarray(value.shape, np.dtype(value.dtype), buffer=block.buf)
+    return array.copy() if copy else array
+
+
+def _release(blocks: List[shared_memory.SharedMemory], unlink: bool = False):
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # Still used by an array that was kept, for example in a global
+            # variable. The memory is unmapped when that array is deleted.
+            logger.warning(f"Shared memory {block.name} is still in use")
+        if unlink:
+            block.unlink()
+
+
+def _memory_usage() -> int:
+    """Resident memory of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak instead of current usage where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_loop(func: Callable, conn, max_memory: Optional[int]):
+    """Entry point of a worker process: call func for each request received
+    on conn, until the pipe is closed or the memory limit is exceeded."""
+    # Interrupts are handled by the service, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        try:
+            kwargs = conn.recv()
+        except EOFError:
+            break
+        if kwargs is None:
+            break
+
+        attached = []
+        created = []
+        try:
+            kwargs = {key: _attach(value, attached) for key, value in kwargs.items()}
+            reply = ("result", _share(func(**kwargs), created))
+        except Exception as exc:  # pylint: disable=broad-except
+            reply = ("error", exc)
+
+        # The reply is sent before the arguments are released, since the
+        # result may be a view of an argument in shared memory
+        recycle = max_memory is not None and _memory_usage() > max_memory
+        try:
+            conn.send((reply, recycle))
+        except Exception as exc:  # pylint: disable=broad-except
+            # The result or exception could not be pickled
+            _release(created, unlink=True)
+            conn.send((("error", RuntimeError(repr(exc))), recycle))
+        else:
+            # The service unlinks the block when it has read the result
+            _release(created)
+        finally:
+            del kwargs, reply
+            _release(attached)
+        if recycle:
+            break
+
+
+class _Worker:
+    """A worker process and the pipe to it"""
+
+    def __init__(self, name: str, func: Callable, max_memory: Optional[int]):
+        self.conn, child_conn = CONTEXT.Pipe()
+        self.process = CONTEXT.Process(
+            target=_worker_loop,
+            args=(func, child_conn, max_memory),
+            name=name,
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, timeout: float = 5):
+        """Ask the worker to exit and wait for it"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class _ProcessPool:  # pylint: disable=too-many-instance-attributes
+    """Runs an entrypoint function in a pool of forked worker processes, to
+    use more than one core for code that holds the GIL.
+
+    Arguments and results are sent through pipes, except for large numpy
+    arrays, which are copied once to shared memory and read from there without
+    pickling. Workers that die are restarted and, with ``max_memory_mb``,
+    workers that use more memory than that after a call are replaced by a new
+    worker, which is forked by a supervisor thread of the pool instead of the
+    thread that made the call. The workers are forked from the service
+    process, so they start with everything that was loaded before, for
+    example by warm-up hooks.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        workers: Optional[int] = None,
+        max_memory_mb: Optional[float] = None,
+    ):
+        """
+        Args:
+            func (Callable): The entrypoint function, without ``async``.
+            workers (Optional[int]): Number of worker processes. Defaults to
+                None, in which case the number of CPUs is used.
+            max_memory_mb (Optional[float]): Memory in megabytes that a worker
+                may use before it is replaced. Defaults to None, which means no
+                limit.
+
+        Raises:
+            ValueError: If workers or max_memory_mb is out of range.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, not {workers}")
+        if max_memory_mb is not None and max_memory_mb <= 0:
+            raise ValueError(f"max_memory_mb must be positive, not {max_memory_mb}")
+
+        self.func = func
+        self.name = getattr(func, "__name__", repr(func))
+        self.workers = workers
+        self.max_memory = (
+            int(max_memory_mb * 1024 * 1024) if max_memory_mb is not None else None
+        )
+        self._idle: queue.Queue = queue.Queue()
+        # Workers that died or exceeded the memory limit, to be replaced by
+        # the supervisor thread. None stops the supervisor.
+        self._retired: queue.Queue = queue.Queue()
+        self._all: List[_Worker] = []
+        self._threads = anyio.CapacityLimiter(workers)
+        self._lock = threading.Lock()
+        self.started = False
+
+        # Statistics, updated under the lock
+        self.busy = 0
+        self.restarts = 0
+        self.recycled = 0
+
+    def start(self):
+        """Fork the worker processes, unless they are already running"""
+        with self._lock:
+            if self.started:
+                return
+            # Share one resource tracker with the workers, which then hand
+            # over the shared memory of their results to this process
+            resource_tracker.ensure_running()
+            for _ in range(self.workers):
+                worker = self._new_worker()
+                self._all.append(worker)
+                self._idle.put(worker)
+            threading.Thread(
+                target=self._supervise, name=f"{self.name}-supervisor", daemon=True
+            ).start()
+            self.started = True
+        logger.info(f"Started {self.workers} worker processes for {self.name}")
+
+    def stop(self):
+        """Stop all worker processes"""
+        with self._lock:
+            workers, self._all = self._all, []
+            self._idle = queue.Queue()
+            self.started = False
+        self._retired.put(None)
+        for worker in workers:
+            worker.stop()
+
+    def _new_worker(self) -> _Worker:
+        return _Worker(f"{self.name}-worker", self.func, self.max_memory)
+
+    def _supervise(self):
+        """Replace retired workers until the pool is stopped. Replacements are
+        only forked by this thread, never by the threads that run calls."""
+        while True:
+            worker = self._retired.get()
+            if worker is None:
+                break
+            worker.stop()
+            with self._lock:
+                if worker not in self._all:
+                    # The pool has been stopped
+                    continue
+                self._all.remove(worker)
+                replacement = self._new_worker()
+                self._all.append(replacement)
+                self._idle.put(replacement)
+
+    def _take(self) -> _Worker:
+        while True:
+            worker = self._idle.get()
+            if worker.process.is_alive():
+                return worker
+            logger.warning(
+                f"Worker process of {self.name} exited with code"
+                f" {worker.process.exitcode}, restarting it"
+            )
+            with self._lock:
+                self.restarts += 1
+            self._retired.put(worker)
+
+    def _call(self, kwargs: Dict[str, Any]) -> Any:
+        """Run a call in an idle worker, blocking until it is done"""
+        if not self.started:
+            self.start()
+        created = []
+        worker = self._take()
+        retire = False
+        with self._lock:
+            self.busy += 1
+        try:
+            try:
+                worker.conn.send(
+                    {key: _share(value, created) for key, value in kwargs.items()}
+                )
+                (kind, value), recycle = worker.conn.recv()
+            except (EOFError, OSError):
+                retire = True
+                with self._lock:
+                    self.restarts += 1
+                raise RuntimeError(
+                    f"Worker process of {self.name} died during the call"
+                ) from None
+            if recycle:
+                logger.info(
+                    f"Replacing worker process of {self.name} above memory limit"
+                )
+                retire = True
+                with self._lock:
+                    self.recycled += 1
+        finally:
+            with self._lock:
+                self.busy -= 1
+            _release(created, unlink=True)
+            if retire:
+                self._retired.put(worker)
+            else:
+                self._idle.put(worker)
+
+        if kind == "error":
+            raise value
+        received = []
+        try:
+            return _attach(value, received, copy=True)
+        finally:
+            _release(received, unlink=True)
+
+    async def call(self, **kwargs) -> Any:
+        """Run the function in one of the worker processes
+
+        Args:
+            **kwargs: Arguments of the function
+
+        Returns:
+            Any: The result of the function
+        """
+        return await anyio.to_thread.run_sync(
+            self._call, kwargs, abandon_on_cancel=True, limiter=self._threads
+        )
+
+    def stats(self) -> dict:
+        """Process pool statistics
+
+        Returns:
+            dict: Number of workers, busy workers, restarted workers and workers
+                replaced because of the memory limit.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "restarts": self.restarts,
+                "recycled": self.recycled,
+            }
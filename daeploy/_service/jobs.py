@@ -0,0 +1,253 @@
+import datetime
+import functools
+import heapq
+import inspect
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import anyio
+import anyio.to_thread
+from fastapi import HTTPException
+
+from daeploy.utilities import spawn_task
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class _Job:  # pylint: disable=too-many-instance-attributes
+    """A single call to a job entrypoint"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = QUEUED
+        self.submitted = datetime.datetime.utcnow()
+        self.started: Optional[datetime.datetime] = None
+        self.finished: Optional[datetime.datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+    def as_dict(self, result: bool = True) -> dict:
+        """The job as a dictionary
+
+        Args:
+            result (bool): Include the result. Defaults to True.
+
+        Returns:
+            dict: Id, entrypoint, status, timestamps and, when finished, the
+            result or the error.
+        """
+        job = {
+            "id": self.id,
+            "entrypoint": self.name,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.status == FAILED:
+            job["error"] = self.error
+        elif result and self.status == SUCCEEDED:
+            job["result"] = self.result
+        return job
+
+
+class _JobStore:
+    """Jobs of all job entrypoints of a service. Finished jobs, with their
+    results, are removed when they have been kept for their time-to-live."""
+
+    def __init__(self):
+        self._jobs: Dict[str, _Job] = {}
+        # Heap of the expiry times and ids of finished jobs, entrypoints may
+        # have different time-to-live
+        self._expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self.expirations = 0
+
+    def add(self, job: _Job):
+        """Add a new job
+
+        Args:
+            job (_Job): The job
+        """
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+
+    def finish(self, job: _Job, ttl: float):
+        """Start the time-to-live of a finished job
+
+        Args:
+            job (_Job): The finished job
+            ttl (float): Seconds to keep the job
+        """
+        with self._lock:
+            heapq.heappush(self._expiry, (time.monotonic() + ttl, job.id))
+
+    def get(self, job_id: str) -> Optional[_Job]:
+        """Look up a job
+
+        Args:
+            job_id (str): Id of the job
+
+        Returns:
+            Optional[_Job]: The job, or None if it does not exist or has expired.
+        """
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def all(self) -> List[_Job]:
+        """All jobs that have not expired, oldest first
+
+        Returns:
+            List[_Job]: The jobs
+        """
+        with self._lock:
+            self._evict()
+            return list(self._jobs.values())
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, job_id = heapq.heappop(self._expiry)
+            del self._jobs[job_id]
+            self.expirations += 1
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+class _JobQueue:  # pylint: disable=too-many-instance-attributes
+    """Runs the calls to a job entrypoint in the background, on a bounded
+    number of workers, and keeps their results in a :class:`_JobStore`."""
+
+    def __init__(
+        self,
+        func: Callable,
+        store: _JobStore,
+        workers: int = 1,
+        max_queue: Optional[int] = None,
+        ttl: float = 3600,
+    ):
+        """
+        Args:
+            func (Callable): The job function, with or without ``async``.
+            store (_JobStore): Where the jobs are kept.
+            workers (int): Largest number of jobs that run at the same time.
+                Defaults to 1.
+            max_queue (Optional[int]): Largest number of jobs waiting for a
+                worker. Defaults to None, in which case the queue is unbounded.
+            ttl (float): Seconds that a finished job and its result are kept.
+                Defaults to 3600.
+
+        Raises:
+            ValueError: If any of the options is out of range.
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, not {workers}")
+        if max_queue is not None and max_queue < 0:
+            raise ValueError(f"max_queue can not be negative, not {max_queue}")
+        if ttl <= 0:
+            raise ValueError(f"ttl must be positive, not {ttl}")
+
+        self.func = func
+        self.name = func.__name__
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self._is_coroutine = inspect.iscoroutinefunction(func)
+        # Workers and the threads reserved for synchronous jobs
+        self._workers = anyio.CapacityLimiter(workers)
+        self._threads = anyio.CapacityLimiter(workers)
+
+        # Statistics
+        self.queue_depth = 0
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, **kwargs) -> _Job:
+        """Queue a job. Must be called from the event loop.
+
+        Args:
+            **kwargs: Arguments of the job function
+
+        Raises:
+            HTTPException: With status 503 if the queue is full.
+
+        Returns:
+            _Job: The queued job
+        """
+        if self.max_queue is not None and self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many queued jobs, try again later",
+                headers={"Retry-After": "1"},
+            )
+        job = _Job(self.name)
+        self.store.add(job)
+        self.queue_depth += 1
+        spawn_task(self._run(job, kwargs))
+        return job
+
+    async def _run(self, job: _Job, kwargs: dict):
+        try:
+            try:
+                await self._workers.acquire()
+            finally:
+                self.queue_depth -= 1
+            job.status = RUNNING
+            job.started = datetime.datetime.utcnow()
+            self.running += 1
+            try:
+                job.result = await self._call(kwargs)
+                job.status = SUCCEEDED
+                self.succeeded += 1
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(f"Job {job.id} of {self.name} failed")
+                job.error = f"{type(exc).__name__}: {exc}"
+                job.status = FAILED
+                self.failed += 1
+            finally:
+                self.running -= 1
+                self._workers.release()
+        finally:
+            job.finished = datetime.datetime.utcnow()
+            self.store.finish(job, self.ttl)
+
+    async def _call(self, kwargs: dict) -> Any:
+        if self._is_coroutine:
+            return await self.func(**kwargs)
+        return await anyio.to_thread.run_sync(
+            functools.partial(self.func, **kwargs), limiter=self._threads
+        )
+
+    def stats(self) -> dict:
+        """Job statistics
+
+        Returns:
+            dict: Configuration, queued and running jobs and the number of
+            succeeded, failed and rejected jobs.
+        """
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "ttl": self.ttl,
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+import anyio
+import anyio.to_thread
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class _Bulkhead:  # pylint: disable=too-many-instance-attributes
+    """Isolates the calls to one entrypoint from the rest of the service.
+
+    At most ``max_concurrency`` calls run at the same time, in threads that
+    are reserved for this entrypoint instead of the thread pool shared by all
+    entrypoints. Further calls wait in an admission queue of at most
+    ``max_queue`` calls and calls beyond that are rejected right away with
+    status 503. A call that has not finished within ``timeout`` seconds,
+    including the time spent in the queue, is answered with status 504. A
+    synchronous call that timed out still holds its slot until it returns.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            max_concurrency (Optional[int]): Largest number of concurrent calls.
+                Defaults to None, in which case calls are not limited and
+                synchronous functions use the shared thread pool.
+            max_queue (Optional[int]): Largest number of calls waiting for a
+                free slot. Requires ``max_concurrency``. Defaults to None, in
+                which case the queue is unbounded.
+            timeout (Optional[float]): Deadline in seconds for a call.
+                Defaults to None, in which case calls never time out.
+
+        Raises:
+            ValueError: If any of the limits is out of range.
+        """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(
+                f"max_concurrency must be at least 1, not {max_concurrency}"
+            )
+        if max_queue is not None:
+            if max_concurrency is None:
+                raise ValueError("max_queue can only be used with max_concurrency")
+            if max_queue < 0:
+                raise ValueError(f"max_queue can not be negative, not {max_queue}")
+        if timeout is not None and timeout <= 0:
+            raise ValueError(f"timeout must be positive, not {timeout}")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._slots = None
+        self._threads = None
+        if max_concurrency is not None:
+            # Admission to the entrypoint and the threads reserved for it.
+            # Synchronous calls that time out keep their slot until their
+            # thread has finished, since the thread can not be stopped.
+            self._slots = anyio.CapacityLimiter(max_concurrency)
+            self._threads = ThreadPoolExecutor(
+                max_workers=max_concurrency, thread_name_prefix="daeploy-bulkhead"
+            )
+
+        # Statistics
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def wrap(self, func: Callable) -> Callable[..., Awaitable[Any]]:
+        """Run a function within the limits of this bulkhead.
+
+        Args:
+            func (Callable): The entrypoint function, with or without ``async``.
+
+        Returns:
+            Callable[..., Awaitable[Any]]: Awaitable that runs func.
+
+        Raises:
+            HTTPException: When awaited, with status 503 if the admission queue
+                is full and with status 504 if the call times out.
+        """
+        is_coroutine = inspect.iscoroutinefunction(func)
+
+        async def run(**kwargs):
+            if is_coroutine:
+                return await func(**kwargs)
+            return await anyio.to_thread.run_sync(
+                functools.partial(func, **kwargs), abandon_on_cancel=True
+            )
+
+        async def run_reserved(token, **kwargs):
+            # The slot is given back by the future, when the thread is done,
+            # and not by the caller, which may have timed out long before.
+            future = asyncio.get_running_loop().run_in_executor(
+                self._threads, functools.partial(func, **kwargs)
+            )
+            future.add_done_callback(lambda _: release(token))
+            return await asyncio.shield(future)
+
+        def release(token):
+            self.in_flight -= 1
+            self._slots.release_on_behalf_of(token)
+
+        async def admitted(**kwargs):
+            if self._slots is None:
+                return await run(**kwargs)
+            token = object()
+            self.queue_depth += 1
+            try:
+                await self._slots.acquire_on_behalf_of(token)
+            finally:
+                self.queue_depth -= 1
+            self.in_flight += 1
+            if not is_coroutine:
+                return await run_reserved(token, **kwargs)
+            try:
+                return await func(**kwargs)
+            finally:
+                release(token)
+
+        async def limited_call(**kwargs):
+            if self.max_queue is not None and self._slots.available_tokens == 0:
+                if self.queue_depth >= self.max_queue:
+                    self.rejected += 1
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Too many concurrent requests, try again later",
+                        headers={"Retry-After": "1"},
+                    )
+
+            if self.timeout is None:
+                return await admitted(**kwargs)
+            try:
+                with anyio.fail_after(self.timeout):
+                    return await admitted(**kwargs)
+            except TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Call to {func.__name__} timed out")
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Request did not finish within {self.timeout} seconds",
+                )
+
+        return limited_call
+
+    def stats(self) -> dict:
+        """Concurrency statistics
+
+        Returns:
+            dict: Configuration, queue depth, running calls and the number of
+                rejected and timed out calls.
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,226 @@
+import bisect
+import collections
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A metric family: name, type, help text and samples of (labels, value)
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class _Histogram:
+    """Cumulative histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Add an observation to the histogram"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, labels: Dict[str, str]) -> List[Tuple[str, Dict, float]]:
+        """Bucket, sum and count samples of the histogram
+
+        Args:
+            labels (Dict[str, str]): Labels of the histogram
+
+        Returns:
+            List[Tuple[str, Dict, float]]: Name suffix, labels and value of
+            each sample.
+        """
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append(("_bucket", dict(labels, le=_format(bound)), cumulative))
+        samples.append(("_sum", labels, self.sum))
+        samples.append(("_count", labels, self.count))
+        return samples
+
+
+class _EntrypointMetrics:
+    """Request metrics of a single entrypoint.
+
+    Only updated from the event loop, so no locking is needed.
+    """
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = _Histogram()
+
+    def observe(self, status: int, seconds: float):
+        """Record a finished request
+
+        Args:
+            status (int): Status code of the response
+            seconds (float): Time to produce the response
+        """
+        self.requests[status] += 1
+        if status >= 500:
+            self.errors += 1
+        self.latency.observe(seconds)
+
+
+class _Metrics:
+    """Collection of the metrics of a service, rendered in the Prometheus text
+    exposition format.
+
+    The counters are plain attributes that are updated from the event loop,
+    which keeps the instrumentation of the request path down to a few
+    additions. Metrics that describe state elsewhere, like the depth of a
+    queue, are read by collectors when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.entrypoints: Dict[str, _EntrypointMetrics] = {}
+        self.task_lateness: Dict[str, _Histogram] = {}
+        self.task_duration: Dict[str, _Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def entrypoint(self, name: str) -> _EntrypointMetrics:
+        """Get the metrics of an entrypoint, creating them if needed
+
+        Args:
+            name (str): Name of the entrypoint
+
+        Returns:
+            _EntrypointMetrics: The metrics of the entrypoint
+        """
+        if name not in self.entrypoints:
+            self.entrypoints[name] = _EntrypointMetrics()
+        return self.entrypoints[name]
+
+    def observe_lateness(self, task: str, seconds: float):
+        """Record how late a scheduled task started
+
+        Args:
+            task (str): Name of the task
+            seconds (float): Time between the planned and the actual start
+        """
+        if task not in self.task_lateness:
+            self.task_lateness[task] = _Histogram()
+        self.task_lateness[task].observe(max(seconds, 0.0))
+
+    def observe_task_duration(self, task: str, seconds: float):
+        """Record how long a run of a scheduled task took
+
+        Args:
+            task (str): Name of the task
+            seconds (float): Duration of the run
+        """
+        if task not in self.task_duration:
+            self.task_duration[task] = _Histogram()
+        self.task_duration[task].observe(seconds)
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a function that returns metric families when metrics are rendered
+
+        Args:
+            collector (Callable[[], Iterable[Family]]): Returns tuples of name,
+                type, help text and a list of samples of (labels, value).
+        """
+        self._collectors.append(collector)
+
+    def families(self) -> Iterable[Family]:
+        """All metric families, except histograms"""
+        entrypoints = self.entrypoints.items()
+        yield (
+            "daeploy_entrypoint_requests_total",
+            "counter",
+            "Number of requests to an entrypoint, by status code",
+            [
+                ({"entrypoint": name, "status": str(status)}, count)
+                for name, metrics in entrypoints
+                for status, count in sorted(metrics.requests.items())
+            ],
+        )
+        yield (
+            "daeploy_entrypoint_errors_total",
+            "counter",
+            "Number of requests to an entrypoint that failed with a server error",
+            [({"entrypoint": name}, metrics.errors) for name, metrics in entrypoints],
+        )
+        yield (
+            "daeploy_entrypoint_in_flight",
+            "gauge",
+            "Number of requests to an entrypoint that are being processed",
+            [
+                ({"entrypoint": name}, metrics.in_flight)
+                for name, metrics in entrypoints
+            ],
+        )
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: The metrics
+        """
+        lines = []
+        for name, kind, description, samples in self.families():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(
+                f"{name}{_labels(labels)} {_format(value)}" for labels, value in samples
+            )
+
+        histograms = (
+            (
+                "daeploy_entrypoint_request_duration_seconds",
+                "Time to produce the response of an entrypoint",
+                "entrypoint",
+                {name: metrics.latency for name, metrics in self.entrypoints.items()},
+            ),
+            (
+                "daeploy_call_every_lateness_seconds",
+                "Delay between the planned and the actual start of a call_every task",
+                "task",
+                self.task_lateness,
+            ),
+            (
+                "daeploy_call_every_duration_seconds",
+                "Time to run a call_every task",
+                "task",
+                self.task_duration,
+            ),
+        )
+        for name, description, label, values in histograms:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in values.items():
+                for suffix, labels, value in histogram.samples({label: key}):
+                    lines.append(f"{name}{suffix}{_labels(labels)} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -1,24 +1,42 @@
 import csv
+import os
+import re
 import tempfile
 import shutil
 import datetime
 import logging
 
-from pathlib import Path
-from typing import List, Optional
-from fastapi.responses import FileResponse
+from typing import List, Literal, Optional
 from fastapi import HTTPException, Query
-from daeploy._service.db import read_from_ts, stored_variables, LOCK, SERVICE_DB_PATH
-
-SERVICE_DB_COPY_PATH = Path("service_copy_db.db")
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from daeploy._service.db import (
+    aggregate_ts,
+    backup_db,
+    parse_aggregates,
+    read_from_ts,
+    read_rollups,
+    VALUE,
+    stored_variables,
+    stored_columns,
+    SERVICE_DB_PATH,
+)
+from daeploy._service.serialization import FastJSONResponse
 
 logger = logging.getLogger(__name__)
 
+Resolution = Literal["1m", "1h", "1d"]
+
+# Length of a bucket, such as "30s", "5m" or "1h"
+BUCKET_PATTERN = re.compile(r"(\d+)([smhdw])")
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
 
 def get_monitored_data_json(
     start: Optional[datetime.datetime] = Query(None),
     end: Optional[datetime.datetime] = Query(None),
     variables: Optional[List[str]] = Query(None),
+    resolution: Optional[Resolution] = Query(None),
 ) -> dict:
     """Get time-series data for monitored variables in json format.
 
@@ -33,6 +51,11 @@ def get_monitored_data_json(
         variables (Optional[List[str]], optional): List of the names of the
             variables to get timeseries data for. Defaults to None which
             corresponds to all monitored variables.
+        resolution (Optional[Resolution], optional): Get the count, min, max,
+            mean, sum and last value of the numeric values in buckets of a
+            minute ("1m"), an hour ("1h") or a day ("1d") instead of the stored
+            values. The timestamps are the starts of the buckets. Defaults to
+            None.
 
     Raises:
         HTTPException: If variable in 'variables' does not exists.
@@ -40,26 +63,89 @@ def get_monitored_data_json(
     Returns:
         dict: The timeseries data for 'variables' as a dictionary.
     """
-    variables = variables or stored_variables()
+    variables = variables or stored_variables(VALUE if resolution else None)
     output = {}
 
     for variable in variables:
         try:
-            entries = read_from_ts(variable, start, end)
+            if resolution:
+                entries = read_rollups(variable, resolution, start, end)
+                columns = ["count", "min", "max", "mean", "sum", "last"]
+            else:
+                entries = read_from_ts(variable, start, end)
+                columns = stored_columns(variable)
         except ValueError as exp:
             raise HTTPException(status_code=412, detail=str(exp))
 
-        output[variable] = {
-            "timestamp": [str(entry.timestamp) for entry in entries],
-            "value": [entry.value for entry in entries],
-        }
+        output[variable] = {"timestamp": [str(entry.timestamp) for entry in entries]}
+        for column in columns:
+            output[variable][column] = [getattr(entry, column) for entry in entries]
     return output
 
 
+def get_monitored_data_aggregate(
+    start: Optional[datetime.datetime] = Query(None),
+    end: Optional[datetime.datetime] = Query(None),
+    variables: Optional[List[str]] = Query(None),
+    bucket: str = Query("5m"),
+    fn: str = Query("mean"),
+) -> FastJSONResponse:
+    """Get aggregates of the numeric values of monitored variables over buckets
+    of time in json format.
+
+    \f
+    Args:
+        start (Optional[datetime.datetime], optional): Aggregate the values from
+            this time. Defaults to None which corresponds to the begining of the
+            monitoring.
+        end (Optional[datetime.datetime], optional): Aggregate the values before
+            this time. Defaults to None which corresponds to the end of the
+            monitoring.
+        variables (Optional[List[str]], optional): List of the names of the
+            variables to aggregate. Defaults to None which corresponds to all
+            monitored variables with values.
+        bucket (str, optional): Length of the buckets as a number and a unit:
+            "s", "m", "h", "d" or "w", e.g. "30s" or "1h". The buckets start at
+            multiples of the length since the epoch. Defaults to "5m".
+        fn (str, optional): Comma separated aggregate functions: "count", "sum",
+            "mean", "min", "max" and percentiles such as "p95". Defaults to
+            "mean".
+
+    Raises:
+        HTTPException: If the bucket or a function is not valid, or a variable
+            in 'variables' does not exists or has no numeric values.
+
+    Returns:
+        FastJSONResponse: Per variable, the timestamps of the starts of the
+        buckets with values and an array with the result of each function.
+    """
+    match = BUCKET_PATTERN.fullmatch(bucket)
+    if not match or int(match.group(1)) < 1:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid bucket: {bucket}. Use a length and a unit, e.g. 5m",
+        )
+    seconds = int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+    functions = [function.strip() for function in fn.split(",")]
+    try:
+        parse_aggregates(functions)
+    except ValueError as exp:
+        raise HTTPException(status_code=422, detail=str(exp))
+
+    output = {}
+    for variable in variables or stored_variables(VALUE):
+        try:
+            output[variable] = aggregate_ts(variable, seconds, functions, start, end)
+        except ValueError as exp:
+            raise HTTPException(status_code=412, detail=str(exp))
+    return FastJSONResponse(output)
+
+
 def get_monitored_data_csv(
     start: Optional[datetime.datetime] = Query(None),
     end: Optional[datetime.datetime] = Query(None),
     variables: Optional[List[str]] = Query(None),
+    resolution: Optional[Resolution] = Query(None),
 ) -> FileResponse:
     """Get time-series data for monitored variables as csv files in zip archive.
 
@@ -74,6 +160,11 @@ def get_monitored_data_csv(
         variables (Optional[List[str]], optional): List of the names of the
             variables to get timeseries data for. Defaults to None which
             corresponds to all monitored variables.
+        resolution (Optional[Resolution], optional): Get the count, min, max,
+            mean, sum and last value of the numeric values in buckets of a
+            minute ("1m"), an hour ("1h") or a day ("1d") instead of the stored
+            values. The timestamps are the starts of the buckets. Defaults to
+            None.
 
     Raises:
         HTTPException: If no monitored variables exists.
@@ -82,22 +173,21 @@ def get_monitored_data_csv(
         FileResponse: Response containing zip archive with one csv file per variable
             in 'variables'.
     """
-    variables = variables or stored_variables()
+    variables = variables or stored_variables(VALUE if resolution else None)
     if not variables:
         raise HTTPException(status_code=412, detail="No monitored variables exists")
     with tempfile.TemporaryDirectory() as tmpdirname:
         for variable in variables:
             csv_file_name = f"{tmpdirname}/{variable}.csv"
             variable_data = get_monitored_data_json(
-                start=start, end=end, variables=[variable]
+                start=start, end=end, variables=[variable], resolution=resolution
             )[variable]
 
             # Create one csv file per variable.
             with open(csv_file_name, "w", newline="") as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=["timestamp", "value"])
-                writer.writeheader()
-                for timestamp, value in zip(*variable_data.values()):
-                    writer.writerow({"timestamp": timestamp, "value": value})
+                writer = csv.writer(csvfile)
+                writer.writerow(variable_data.keys())
+                writer.writerows(zip(*variable_data.values()))
                 logger.info(
                     f"Created temp csv file of timeseries data for variable {variable}"
                 )
@@ -118,15 +208,19 @@ def get_monitored_data_db() -> FileResponse:
     Returns:
         FileResponse: Response containing the database file.
     """
+    # A consistent copy, made without holding up the writer, that is removed
+    # once it has been sent
+    handle, copy_path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
     try:
-        with LOCK:
-            # As of now we make a copy of the db file which we don't remove.
-            # FileResponse cannot handle temp files.
-            shutil.copy(SERVICE_DB_PATH, SERVICE_DB_COPY_PATH)
-            logger.info(
-                f"Copied content from {SERVICE_DB_COPY_PATH} to {SERVICE_DB_COPY_PATH}"
-            )
-            return FileResponse(path=SERVICE_DB_COPY_PATH, filename="database.db")
+        backup_db(copy_path)
     except Exception as exp:
+        os.unlink(copy_path)
         logger.exception("Failed to copy content from db to copy file.")
         raise HTTPException(status_code=412, detail=str(exp))
+    logger.info(f"Copied content from {SERVICE_DB_PATH} to {copy_path}")
+    return FileResponse(
+        path=copy_path,
+        filename="database.db",
+        background=BackgroundTask(os.unlink, copy_path),
+    )
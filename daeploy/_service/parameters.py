@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _ParameterStore:
+    """Values of the parameters of a service with a version, which increases
+    with every update. Several parameters are updated at once, under a single
+    version, and watchers are woken up when a newer version is available."""
+
+    def __init__(self, parameters: Dict[str, dict]):
+        """
+        Args:
+            parameters (Dict[str, dict]): The parameters of the service, by name.
+                The ``"value"`` of each parameter is updated in place.
+        """
+        self.parameters = parameters
+        self.version = 0
+        # Gives out the versions of new updates, shared by all worker processes
+        # of a service. None uses the version of this store.
+        self.counter: Optional[Callable[[], int]] = None
+        # Version of the latest update of each parameter
+        self._versions: Dict[str, int] = {}
+        self._waiters: Dict[asyncio.Future, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+
+    def update(self, values: Dict[str, Any], version: Optional[int] = None) -> int:
+        """Set the values of one or more parameters as one update
+
+        Args:
+            values (Dict[str, Any]): The new values, by parameter name. The
+                values must already be validated.
+            version (Optional[int]): Version of the update. Defaults to None,
+                in which case the next version is used. Parameters that have
+                a newer version already are left as they are.
+
+        Returns:
+            int: The version of the update, or the current version if there
+            are no values
+        """
+        with self._lock:
+            if not values:
+                return self.version
+            if version is None:
+                version = self.counter() if self.counter else self.version + 1
+            for name, value in values.items():
+                if self._versions.get(name, 0) < version:
+                    self.parameters[name]["value"] = value
+                    self._versions[name] = version
+            self.version = max(self.version, version)
+            waiters, self._waiters = self._waiters, {}
+        for future, loop in waiters.items():
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The event loop of the watcher has been closed
+                pass
+        return version
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The current values of all parameters and their version
+
+        Returns:
+            Dict[str, Any]: The version and the values, by parameter name.
+        """
+        with self._lock:
+            return self._changes(-1)
+
+    def _changes(self, since: int) -> Dict[str, Any]:
+        # A client that has seen a newer version than this store talked to an
+        # earlier run of the service, and gets all values again
+        if since > self.version:
+            since = -1
+        return {
+            "version": self.version,
+            "parameters": {
+                name: parameter["value"]
+                for name, parameter in self.parameters.items()
+                if self._versions.get(name, 0) > since
+            },
+        }
+
+    async def watch(self, since: int, timeout: float) -> Dict[str, Any]:
+        """Wait until there is a newer version than ``since``
+
+        Args:
+            since (int): The latest version the caller has seen.
+            timeout (float): Seconds to wait at most.
+
+        Returns:
+            Dict[str, Any]: The current version and the values of the parameters
+            that have been updated after ``since``, which is empty if the
+            timeout passed without an update.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if since != self.version:
+                return self._changes(since)
+            self._waiters[future] = loop
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.pop(future, None)
+        with self._lock:
+            return self._changes(since)
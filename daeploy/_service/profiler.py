@@ -0,0 +1,121 @@
+import collections
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Counter, Dict, List, Tuple
+
+# A frame of a call stack: function name, file name and first line number
+Frame = Tuple[str, str, int]
+# A sampled call stack: the name of the thread and its frames, outermost first
+Stack = Tuple[str, Tuple[Frame, ...]]
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class _Profile:
+    """Call stacks of all threads, sampled at a fixed interval"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[Stack] = collections.Counter()
+        self.duration = 0.0
+
+    def collapsed(self) -> str:
+        """The profile in the collapsed stack format of flamegraph.pl and
+        most other flame graph tools
+
+        Returns:
+            str: One line per distinct stack with the thread name and the
+            frames separated by semicolons, followed by the number of samples.
+        """
+        lines = []
+        for (thread, frames), count in sorted(self.stacks.items()):
+            names = [thread] + [
+                f"{name} ({file}:{line})" for name, file, line in frames
+            ]
+            stack = ";".join(name.replace(";", ":") for name in names)
+            lines.append(f"{stack} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "profile") -> dict:
+        """The profile in the speedscope file format, with one sampled profile
+        per thread
+
+        Args:
+            name (str): Name of the profile. Defaults to "profile".
+
+        Returns:
+            dict: JSON serializable speedscope file.
+        """
+        frames: Dict[Frame, int] = {}
+        profiles: Dict[str, dict] = {}
+        for (thread, stack), count in sorted(self.stacks.items()):
+            indices = [frames.setdefault(frame, len(frames)) for frame in stack]
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append(indices)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "daeploy",
+            "shared": {
+                "frames": [
+                    {"name": func, "file": file, "line": line}
+                    for func, file, line in frames
+                ]
+            },
+            "profiles": list(profiles.values()),
+        }
+
+
+def _frames(frame: FrameType) -> Tuple[Frame, ...]:
+    stack: List[Frame] = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def sample(seconds: float, interval: float = 0.01) -> _Profile:
+    """Sample the call stacks of all threads of this process, except the
+    calling thread, for a number of seconds. Nothing is sampled or changed
+    outside of this call.
+
+    Args:
+        seconds (float): How long to sample.
+        interval (float): Seconds between samples. Defaults to 0.01.
+
+    Returns:
+        _Profile: The sampled call stacks.
+    """
+    profile = _Profile(interval)
+    own = threading.get_ident()
+    start = time.perf_counter()
+    deadline = start + seconds
+    next_sample = start
+    while next_sample < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, frame in frames.items():
+            if ident != own:
+                thread = names.get(ident, f"thread-{ident}")
+                profile.stacks[(thread, _frames(frame))] += 1
+        next_sample += interval
+        time.sleep(max(next_sample - time.perf_counter(), 0))
+    profile.duration = time.perf_counter() - start
+    return profile
@@ -0,0 +1,234 @@
+import datetime
+import json
+import time
+from typing import Callable, Optional, Type, Union
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+from daeploy import _encoding
+from daeploy._service.db import write_call
+from daeploy._service.metrics import _EntrypointMetrics
+
+
+def _detail(detail) -> bytes:
+    """Render an error detail the way FastAPI sends it"""
+    return json.dumps({"detail": detail}, default=str).encode()
+
+
+class _DecodedRequest(Request):
+    """Request with an already decoded binary body, presented to FastAPI as a
+    JSON request so that the arguments are validated like any other request.
+
+    FastAPI reads JSON bodies with :meth:`Request.json` when the content type
+    is ``application/json``, which is the only behaviour this relies on. The
+    original request, and its headers, are left untouched.
+    """
+
+    def __init__(self, request: Request, body: bytes, arguments: dict):
+        """
+        Args:
+            request (Request): The incoming request
+            body (bytes): The raw body of the request
+            arguments (dict): The decoded arguments
+        """
+        scope = dict(request.scope)
+        scope["headers"] = [
+            (key, value) for key, value in scope["headers"] if key != b"content-type"
+        ] + [(b"content-type", _encoding.JSON.encode())]
+        super().__init__(scope, request.receive)
+        self._raw_body = body
+        self._arguments = arguments
+
+    async def body(self) -> bytes:
+        return self._raw_body
+
+    async def json(self) -> dict:
+        return self._arguments
+
+
+def entrypoint_route_class(  # pylint: disable=too-many-statements
+    monitor_name: Optional[str] = None,
+    decode_binary: bool = False,
+    metrics: Optional[_EntrypointMetrics] = None,
+) -> Type[APIRoute]:
+    """Create a route class for an entrypoint.
+
+    With ``monitor_name``, every call to the route is saved as one linked
+    record of request, response, latency and status code in the service's
+    monitoring database. The raw request body and the response body that is
+    actually sent are reused as they are, so monitoring adds no extra
+    serialization. For streamed responses, a summary of the number of items,
+    bytes and the duration of the stream is saved as the response.
+
+    With ``decode_binary``, request bodies in any of the binary formats of
+    :mod:`daeploy._encoding` are decoded before FastAPI validates them.
+
+    With ``metrics``, the number of requests by status code, the latency and
+    the number of requests in flight are counted.
+
+    Args:
+        monitor_name (Optional[str]): Identifier to save the calls under.
+            Defaults to None, in which case calls are not saved.
+        decode_binary (bool): Accept binary request bodies. Defaults to False.
+        metrics (Optional[_EntrypointMetrics]): Request metrics of the
+            entrypoint. Defaults to None, in which case nothing is counted.
+
+    Returns:
+        Type[APIRoute]: Route class to use for the entrypoint.
+    """
+
+    class EntrypointRoute(APIRoute):
+        def get_route_handler(self) -> Callable:
+            handler = super().get_route_handler()
+            if decode_binary:
+                handler = self._binary_handler(handler)
+            if monitor_name:
+                handler = self._monitored_handler(handler)
+            if metrics:
+                handler = self._measured_handler(handler)
+            return handler
+
+        @staticmethod
+        def _measured_handler(handler: Callable) -> Callable:
+            async def measured_handler(request: Request) -> Response:
+                start = time.perf_counter()
+                status = 500
+                metrics.in_flight += 1
+                try:
+                    response = await handler(request)
+                    status = response.status_code
+                    return response
+                except HTTPException as exc:
+                    status = exc.status_code
+                    raise
+                except RequestValidationError:
+                    status = 422
+                    raise
+                finally:
+                    metrics.in_flight -= 1
+                    metrics.observe(status, time.perf_counter() - start)
+
+            return measured_handler
+
+        def _binary_handler(self, handler: Callable) -> Callable:
+            names = [field.name for field in self.dependant.body_params]
+
+            async def binary_handler(request: Request) -> Response:
+                media = _encoding.media_type(request.headers.get("content-type"))
+                if media not in _encoding.BINARY_MEDIA_TYPES:
+                    return await handler(request)
+
+                body = await request.body()
+                try:
+                    decoded = _encoding.decode(body, media)
+                except ImportError as exc:
+                    raise HTTPException(status_code=415, detail=str(exc))
+                except Exception as exc:  # pylint: disable=broad-except
+                    raise HTTPException(
+                        status_code=400, detail=f"Could not decode {media}: {exc}"
+                    )
+
+                if media == _encoding.MSGPACK and isinstance(decoded, dict):
+                    arguments = decoded
+                elif len(names) == 1:
+                    arguments = {names[0]: decoded}
+                else:
+                    raise HTTPException(
+                        status_code=415,
+                        detail=f"A {media} body can only be used for entrypoints"
+                        " with a single argument",
+                    )
+
+                return await handler(_DecodedRequest(request, body, arguments))
+
+            return binary_handler
+
+        @staticmethod
+        def _monitored_handler(handler: Callable) -> Callable:
+            async def monitored_handler(request: Request) -> Response:
+                start = time.perf_counter()
+                try:
+                    response = await handler(request)
+                except HTTPException as exc:
+                    await record(request, start, exc.status_code, _detail(exc.detail))
+                    raise
+                except RequestValidationError as exc:
+                    await record(request, start, 422, _detail(exc.errors()))
+                    raise
+                except Exception:
+                    await record(request, start, 500, b"")
+                    raise
+
+                if isinstance(response, StreamingResponse):
+                    # Record a summary once the whole stream has been sent
+                    response.body_iterator = summarized(
+                        request, start, response.status_code, response.body_iterator
+                    )
+                    return response
+
+                body = getattr(response, "body", b"")
+                await record(
+                    request,
+                    start,
+                    response.status_code,
+                    body,
+                    response.headers.get("content-type"),
+                )
+                return response
+
+            async def summarized(request: Request, start: float, status: int, chunks):
+                request_body = await request.body()
+                items = size = 0
+                try:
+                    async for chunk in chunks:
+                        items += 1
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    # Runs as soon as the stream is drained, or if it is closed
+                    # early, e.g. when the client disconnects
+                    summary = {
+                        "items": items,
+                        "bytes": size,
+                        "duration": time.perf_counter() - start,
+                    }
+                    save(request, request_body, start, status, json.dumps(summary))
+
+            async def record(
+                request: Request,
+                start: float,
+                status: int,
+                body: bytes,
+                response_type: Optional[str] = None,
+            ):
+                # The body is cached on the request once the handler has read it
+                request_body = await request.body()
+                save(request, request_body, start, status, body, response_type)
+
+            def save(
+                request: Request,
+                request_body: bytes,
+                start: float,
+                status: int,
+                body: Union[bytes, str],
+                response_type: Optional[str] = None,
+            ):
+                if isinstance(body, str):
+                    body = body.encode()
+                write_call(
+                    monitor_name,
+                    request=request_body,
+                    response=body,
+                    latency=time.perf_counter() - start,
+                    status=status,
+                    timestamp=datetime.datetime.utcnow(),
+                    request_type=request.headers.get("content-type"),
+                    response_type=response_type,
+                )
+
+            return monitored_handler
+
+    return EntrypointRoute
@@ -0,0 +1,380 @@
+import asyncio
+import datetime
+import functools
+import heapq
+import inspect
+import itertools
+import logging
+import random
+import time
+import warnings
+from typing import Callable, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from daeploy._service.metrics import _Metrics
+from daeploy.communication import notify, Severity
+from daeploy.utilities import spawn_task
+
+logger = logging.getLogger(__name__)
+
+FIXED_RATE = "fixed_rate"
+FIXED_DELAY = "fixed_delay"
+MODES = (FIXED_RATE, FIXED_DELAY)
+
+SKIP = "skip"
+QUEUE = "queue"
+CONCURRENT = "concurrent"
+OVERLAP_POLICIES = (SKIP, QUEUE, CONCURRENT)
+
+# Range of each field of a cron expression
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 6),
+)
+
+
+def _cron_field(field: str, name: str, low: int, high: int) -> Set[int]:
+    """Values matched by one field of a cron expression"""
+    values = set()
+    for part in field.split(","):
+        value_range, _, step = part.partition("/")
+        if value_range == "*":
+            first, last = low, high
+        elif "-" in value_range:
+            first, last = (int(value) for value in value_range.split("-", 1))
+        else:
+            first = last = int(value_range)
+            if step:
+                last = high
+        step = int(step) if step else 1
+        if first < low or last > high or first > last or step < 1:
+            raise ValueError(f"Invalid {name} in cron expression: {part}")
+        values.update(range(first, last + 1, step))
+    return values
+
+
+class _Cron:
+    """Schedule given by a cron expression of the five fields minute, hour,
+    day of month, month and day of week (0 is Sunday), in local time."""
+
+    def __init__(self, expression: str):
+        """
+        Args:
+            expression (str): The cron expression, e.g. ``"*/15 8-17 * * 1-5"``.
+
+        Raises:
+            ValueError: If the expression is not valid.
+        """
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(
+                f"Cron expression {expression!r} must have five fields:"
+                " minute, hour, day of month, month and day of week"
+            )
+        try:
+            parsed = [
+                _cron_field(field, *spec) for field, spec in zip(fields, CRON_FIELDS)
+            ]
+        except ValueError as exc:
+            raise ValueError(f"Invalid cron expression {expression!r}: {exc}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # Like cron, days match on either field if both are restricted
+        self._any_day = fields[2] == "*" or fields[4] == "*"
+
+    def _day_matches(self, day: datetime.datetime) -> bool:
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, now: datetime.datetime) -> datetime.datetime:
+        """The first time after now that matches the expression
+
+        Args:
+            now (datetime.datetime): The time to start from
+
+        Returns:
+            datetime.datetime: The next matching time, at whole minutes.
+        """
+        candidate = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # Every combination of days repeats within a few years
+        for _ in range(366 * 5):
+            if candidate.month in self.months and self._day_matches(candidate):
+                for hour in sorted(self.hours):
+                    if hour < candidate.hour:
+                        continue
+                    for minute in sorted(self.minutes):
+                        if hour == candidate.hour and minute < candidate.minute:
+                            continue
+                        return candidate.replace(hour=hour, minute=minute)
+            candidate = (candidate + datetime.timedelta(days=1)).replace(
+                hour=0, minute=0
+            )
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+
+class _Task:  # pylint: disable=too-many-instance-attributes
+    """A function that the scheduler runs repeatedly"""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        func: Callable,
+        name: str,
+        seconds: Optional[float] = None,
+        cron: Optional[str] = None,
+        mode: str = FIXED_RATE,
+        jitter: float = 0,
+        overlap: str = SKIP,
+        wait_first: bool = False,
+    ):
+        if (seconds is None) == (cron is None):
+            raise ValueError("Give either seconds or a cron expression")
+        if seconds is not None and seconds <= 0:
+            raise ValueError(f"seconds must be positive, not {seconds}")
+        if mode not in MODES:
+            raise ValueError(f"Invalid mode: {mode}. Possible options: {MODES}")
+        if cron is not None and mode != FIXED_RATE:
+            raise ValueError("Cron schedules can only be used with fixed_rate")
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(
+                f"Invalid overlap: {overlap}. Possible options: {OVERLAP_POLICIES}"
+            )
+        if jitter < 0:
+            raise ValueError(f"jitter can not be negative, not {jitter}")
+
+        self.func = func
+        self.name = name
+        self.is_coroutine = inspect.iscoroutinefunction(func)
+        self.seconds = seconds
+        self.cron = _Cron(cron) if cron is not None else None
+        self.mode = mode
+        self.jitter = jitter
+        self.overlap = overlap
+        self.wait_first = wait_first
+
+        # State
+        self.active = 0
+        self.queued = 0
+        # Planned time of the latest run, before jitter
+        self._base = 0.0
+
+        # Statistics
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def first_run(self, now: float) -> float:
+        """Monotonic time of the first run, when the scheduler starts at now"""
+        if self.cron is not None:
+            return self._next_cron(now)
+        self._base = now + (self.seconds if self.wait_first else 0)
+        return self._base + self._jitter()
+
+    def next_run(self, now: float) -> float:
+        """Monotonic time of the next run for the fixed rate and cron
+        schedules. Runs that were missed because the scheduler fell behind
+        are skipped and the jitter does not add up over the runs."""
+        if self.cron is not None:
+            return self._next_cron(now)
+        missed = max(int((now - self._base) // self.seconds), 0)
+        self._base += (missed + 1) * self.seconds
+        return self._base + self._jitter()
+
+    def delayed_run(self, now: float) -> float:
+        """Monotonic time of the next run for the fixed delay schedule, when
+        the previous run finished at now"""
+        return now + self.seconds + self._jitter()
+
+    def _next_cron(self, now: float) -> float:
+        wall = datetime.datetime.now()
+        delay = (self.cron.next_after(wall) - wall).total_seconds()
+        return now + delay + self._jitter()
+
+    def _jitter(self) -> float:
+        return random.uniform(0, self.jitter) if self.jitter else 0.0
+
+    def stats(self) -> dict:
+        """Task statistics
+
+        Returns:
+            dict: Schedule, number of runs, failures, skipped runs and overruns,
+            and the lateness and duration of the runs in seconds.
+        """
+        return {
+            "seconds": self.seconds,
+            "cron": self.cron.expression if self.cron is not None else None,
+            "mode": self.mode,
+            "overlap": self.overlap,
+            "running": self.active,
+            "queued": self.queued,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "last_lateness": self.last_lateness,
+            "max_lateness": self.max_lateness,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "mean_duration": self.total_duration / self.runs if self.runs else None,
+        }
+
+
+class _Scheduler:
+    """Runs all repeated tasks of a service from a single coroutine, which
+    sleeps until the task that is due first, on a heap ordered by monotonic
+    time."""
+
+    def __init__(self, metrics: Optional[_Metrics] = None):
+        """
+        Args:
+            metrics (Optional[_Metrics]): Where to record the lateness and the
+                duration of the runs. Defaults to None.
+        """
+        self.tasks: List[_Task] = []
+        self.metrics = metrics
+        self._heap: List[Tuple[float, int, _Task]] = []
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._runs: Set[asyncio.Task] = set()
+
+    def add(self, task: _Task):
+        """Add a task, which starts when the scheduler starts, or right away
+        if it is already running
+
+        Args:
+            task (_Task): The task
+        """
+        names = {existing.name for existing in self.tasks}
+        for number in itertools.count(2):
+            if task.name not in names:
+                break
+            task.name = f"{task.name.rsplit('#', 1)[0]}#{number}"
+        self.tasks.append(task)
+        if self._loop_task is not None:
+            self._push(task, task.first_run(time.monotonic()))
+
+    async def start(self):
+        """Start running the tasks on the current event loop"""
+        now = time.monotonic()
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        for task in self.tasks:
+            task.active = task.queued = 0
+            self._push(task, task.first_run(now))
+        self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop running the tasks"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        for run in list(self._runs):
+            run.cancel()
+
+    def _push(self, task: _Task, when: float):
+        heapq.heappush(self._heap, (when, next(self._order), task))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                planned, _, task = heapq.heappop(self._heap)
+                self._dispatch(task, planned, now)
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, task: _Task, planned: float, now: float):
+        lateness = now - planned
+        task.last_lateness = lateness
+        task.max_lateness = max(task.max_lateness, lateness)
+        if self.metrics is not None:
+            self.metrics.observe_lateness(task.name, lateness)
+
+        if task.mode == FIXED_RATE:
+            self._push(task, task.next_run(now))
+
+        # At most one run is queued, so that a task that is always slower
+        # than its interval does not build up a backlog
+        if task.active and (task.overlap == SKIP or task.queued):
+            task.skipped += 1
+        elif task.active and task.overlap == QUEUE:
+            task.queued = 1
+        else:
+            spawn_task(self._execute(task), self._runs)
+
+    async def _execute(self, task: _Task):
+        task.active += 1
+        try:
+            while True:
+                await self._run_once(task)
+                if not task.queued:
+                    break
+                task.queued = 0
+        finally:
+            task.active -= 1
+            if task.mode == FIXED_DELAY:
+                self._push(task, task.delayed_run(time.monotonic()))
+
+    async def _run_once(self, task: _Task):
+        start = time.monotonic()
+        try:
+            if task.is_coroutine:
+                # Non-blocking code, defined by `async def`
+                await task.func()
+            else:
+                # Blocking code, defined by `def`
+                await run_in_threadpool(task.func)
+        except Exception:  # pylint: disable=broad-except
+            task.failures += 1
+            logger.exception(f"Exception in {task.func}")
+
+        duration = time.monotonic() - start
+        task.runs += 1
+        task.last_duration = duration
+        task.max_duration = max(task.max_duration, duration)
+        task.total_duration += duration
+        if self.metrics is not None:
+            self.metrics.observe_task_duration(task.name, duration)
+
+        if task.seconds is not None and duration > task.seconds:
+            task.overruns += 1
+            msg = (
+                f"Function {task.func} has an execution time the exceeds"
+                f" the requested execution interval of {task.seconds}s!"
+            )
+            warnings.warn(msg, UserWarning)
+            _notify_in_background(msg)
+
+
+def _notify_in_background(msg: str):
+    """Send a warning notification from a thread, so that the event loop does
+    not wait for the manager"""
+
+    def log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Could not send notification: {future.exception()}")
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        None, functools.partial(notify, msg, Severity.WARNING)
+    )
+    future.add_done_callback(log_failure)
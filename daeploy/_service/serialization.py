@@ -0,0 +1,135 @@
+import datetime
+import json
+from typing import Any, AsyncIterator, Iterable, Union
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+# Array dtypes that orjson serializes natively, in native byte order. Other
+# dtypes are cast to float64 or converted to lists.
+_ORJSON_DTYPES = {
+    np.dtype(dtype)
+    for dtype in (
+        np.bool_,
+        np.int8,
+        np.int16,
+        np.int32,
+        np.int64,
+        np.uint8,
+        np.uint16,
+        np.uint32,
+        np.uint64,
+        np.float32,
+        np.float64,
+    )
+}
+
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+
+def _pandas_dumps(value: Union[pd.DataFrame, pd.Series]) -> str:
+    """Serialize a pandas object with ISO formatted timestamps, both in the
+    index and in the values."""
+    return value.to_json(date_format="iso")
+
+
+def _default(value: Any) -> Any:  # pylint: disable=too-many-return-statements
+    """Fallback for values that orjson can not serialize on its own.
+
+    Args:
+        value (Any): Value to convert.
+
+    Returns:
+        Any: A representation of value that orjson can serialize.
+    """
+    if isinstance(value, np.ndarray):
+        # Non-contiguous arrays and arrays of unsupported dtypes end up here
+        if value.dtype in _ORJSON_DTYPES:
+            return np.ascontiguousarray(value)
+        if value.dtype.kind == "f" and value.dtype.itemsize == 2:
+            # float16 is not supported by older orjson versions. As float64
+            # the values are written like the default JSON encoding does.
+            return np.ascontiguousarray(value, dtype=np.float64)
+        return value.tolist()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        # Same encoding as for a top level dataframe, see fast_dumps
+        return json.loads(_pandas_dumps(value))
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return jsonable_encoder(value)
+
+
+def fast_dumps(content: Any) -> bytes:
+    """Serialize content to JSON, encoding numpy and pandas objects natively
+    instead of first converting them to python lists and dicts.
+
+    The output has the same layout as the default FastAPI serialization of the
+    :mod:`daeploy.data_types`: arrays become (nested) lists and dataframes
+    become ``{column: {index: value}}`` objects.
+
+    Args:
+        content (Any): Content to serialize.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if isinstance(content, (pd.DataFrame, pd.Series)):
+        return _pandas_dumps(content).encode("utf-8")
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that is rendered with :func:`fast_dumps`"""
+
+    def render(self, content: Any) -> bytes:
+        return fast_dumps(content)
+
+
+def streaming_response(
+    items: Union[Iterable, AsyncIterator],
+    event_stream: bool = False,
+    status_code: int = 200,
+) -> StreamingResponse:
+    """Stream the items of a (async) generator as they are produced, either
+    as newline delimited JSON or as server-sent events.
+
+    Synchronous generators are advanced in the thread pool so that they do not
+    block the event loop.
+
+    Args:
+        items (Union[Iterable, AsyncIterator]): The items to stream.
+        event_stream (bool): Send the items as server-sent events instead of
+            newline delimited JSON. Defaults to False.
+        status_code (int): Status code of the response. Defaults to 200.
+
+    Returns:
+        StreamingResponse: Chunked response with one chunk per item.
+    """
+    if not hasattr(items, "__aiter__"):
+        items = iterate_in_threadpool(iter(items))
+
+    async def chunks():
+        async for item in items:
+            if event_stream:
+                yield b"data: " + fast_dumps(item) + b"\n\n"
+            else:
+                yield fast_dumps(item) + b"\n"
+
+    return StreamingResponse(
+        chunks(),
+        media_type=EVENT_STREAM if event_stream else NDJSON,
+        status_code=status_code,
+    )
@@ -1,27 +1,53 @@
+# pylint: disable=too-many-lines
 import os
 import asyncio
 import datetime
 import functools
+import importlib.util
 import inspect
 from inspect import Parameter
 import logging
+import threading
 import time
-import warnings
-from typing import Callable, Any
-import json
+from typing import Awaitable, Callable, Any, List, Optional, Tuple
 from numbers import Number
+import anyio.to_thread
 import uvicorn
-from fastapi import Body, Request, FastAPI
-from fastapi.encoders import jsonable_encoder
+from fastapi import Body, Query, Request, Response, FastAPI, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import create_model, validate_call
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError, create_model, validate_call
 
 from daeploy._service.logger import setup_logging
-from daeploy._service.db import clean_database, initialize_db, remove_db, write_to_ts
+from daeploy._service.batching import _Batcher
+from daeploy._service.cache import _ResponseCache, _SingleFlight
+from daeploy._service.executor import _ProcessPool
+from daeploy._service.jobs import _JobQueue, _JobStore
+from daeploy._service.parameters import _ParameterStore
+from daeploy._service.scheduler import _Scheduler, _Task
+from daeploy._service import profiler
+from daeploy._service.limits import _Bulkhead
+from daeploy._service.routing import entrypoint_route_class
+from daeploy._service.serialization import (
+    EVENT_STREAM,
+    FastJSONResponse,
+    streaming_response,
+)
+from daeploy._service.db import (
+    clean_database,
+    initialize_db,
+    queue_depth,
+    queue_stats,
+    remove_db,
+    write_to_ts,
+)
+from daeploy._service.metrics import CONTENT_TYPE, _Metrics
+from daeploy._service.workers import _ParameterBroadcast, _WorkerPool
 from daeploy._service.monitoring_api import (
     get_monitored_data_json,
     get_monitored_data_db,
+    get_monitored_data_aggregate,
     get_monitored_data_csv,
 )
 from daeploy.utilities import (
@@ -30,12 +56,60 @@ from daeploy.utilities import (
     get_service_root_path,
     HTTP_METHODS,
     get_db_clean_interval_seconds,
+    get_thread_pool_size,
+    get_service_workers,
+    get_service_uds,
+    get_service_loop,
+    get_service_http,
+    get_service_backlog,
+    get_service_keep_alive,
+    get_service_limit_concurrency,
+    EVENT_LOOPS,
+    HTTP_PARSERS,
 )
-from daeploy.communication import notify, Severity
+from daeploy.data_types import ArrayInput, ArrayOutput, DataFrameInput, DataFrameOutput
+from daeploy import _encoding
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Longest profile that can be taken with /~profile
+MAX_PROFILE_SECONDS = 60
+
+# Longest wait of /~parameters/watch
+MAX_WATCH_SECONDS = 300
+
+
+def _uses_data_types(signature: inspect.Signature) -> bool:
+    """Check if any argument or the return value of a function is annotated
+    with one of the array or dataframe types in :mod:`daeploy.data_types`"""
+    data_types = (ArrayInput, ArrayOutput, DataFrameInput, DataFrameOutput)
+    annotations = [param.annotation for param in signature.parameters.values()]
+    annotations.append(signature.return_annotation)
+    return any(
+        inspect.isclass(annotation) and issubclass(annotation, data_types)
+        for annotation in annotations
+    )
+
+
+def _endpoint_signature(signature: inspect.Signature) -> inspect.Signature:
+    """Signature of the API endpoint for an entrypoint, with the request as
+    first argument and all arguments of the entrypoint in a JSON body"""
+    # Update default values to fastapi Body parameters to force all parameters
+    # in a json body for the resulting HTTP method
+    new_params = []
+    request_sig = inspect.Parameter(
+        "_request", Parameter.POSITIONAL_OR_KEYWORD, annotation=Request
+    )
+    new_params.append(request_sig)
+    for parameter in signature.parameters.values():
+        if parameter.default == inspect._empty:  # pylint: disable=protected-access
+            default = Ellipsis
+        else:
+            default = parameter.default
+        new_params.append(parameter.replace(default=Body(default, embed=True)))
+    return signature.replace(parameters=new_params)
+
 
 def _disable_http_logs(path: str):
     logging.getLogger("uvicorn.access").addFilter(
@@ -65,7 +139,7 @@ def get_cors_config():
     return cors_config
 
 
-class _Service:
+class _Service:  # pylint: disable=too-many-instance-attributes
     def __init__(self):
         cors_config = get_cors_config()
 
@@ -77,6 +151,9 @@ class _Service:
                 {"name": "Entrypoints"},
                 {"name": "Monitoring"},
                 {"name": "Parameters"},
+                {"name": "Cache"},
+                {"name": "Health"},
+                {"name": "Jobs"},
             ],
         )
 
@@ -85,40 +162,610 @@ class _Service:
             self.app.add_middleware(CORSMiddleware, **cors_config)
 
         self.parameters = {}
+        self._parameter_store = _ParameterStore(self.parameters)
+        self._batchers = {}
+        self._caches = {}
+        self._single_flights = {}
+        self._bulkheads = {}
+        self._process_pools = {}
+        self._jobs = _JobStore()
+        self._job_queues = {}
+        self._profiling = threading.Lock()
+        self.thread_pool_size = get_thread_pool_size()
+        self.fast_json = False
+        self.metrics = _Metrics()
+        self._parameter_broadcast = None
+        self.metrics.add_collector(self._collect_metrics)
+        self._scheduler = _Scheduler(self.metrics)
+        self._warmup_hooks = []
+        self._warmup_task = None
+        self._warmup_error = None
+        self.ready = False
 
         # daeploy-specific setup
         self.app.on_event("startup")(initialize_db)
+        self.app.on_event("startup")(self._configure_thread_pool)
+        self.app.on_event("startup")(self._start_warmup)
+        self.app.on_event("startup")(self._scheduler.start)
+        self.app.on_event("shutdown")(self._scheduler.stop)
+        self.app.on_event("shutdown")(self._stop_process_pools)
         self.app.on_event("shutdown")(service_shutdown)
 
+        # Does nothing in worker processes, the database is cleaned by the
+        # process that writes it
         interval = get_db_clean_interval_seconds()
         self.call_every(interval, True)(clean_database)
 
-        # Monitoring API
+        self._add_monitoring_api()
+        self._add_stats_api()
+
+        async def get_metrics() -> Response:
+            """Get service metrics in the Prometheus text format
+
+            \f
+            Returns:
+                Response: Request counts, latency histograms and requests in
+                    flight per entrypoint, thread pool usage, queue depths and
+                    the lateness of ``call_every`` tasks
+            """
+            return Response(self.metrics.render(), media_type=CONTENT_TYPE)
+
+        self.app.get("/~metrics", tags=["Monitoring"])(get_metrics)
+        self._add_profile_api()
+
+        # Health API
+        self._add_health_api()
+
+        # Jobs API
+        self._add_jobs_api()
+
+        # Parameters API
+        self._add_parameters_api()
+
+        # Cache API
+        def get_cache_stats() -> dict:
+            """Get statistics for all cached entrypoints
+
+            \f
+            Returns:
+                dict: Size and hit/miss/eviction counters per entrypoint
+            """
+            return {name: cache.stats() for name, cache in self._caches.items()}
+
+        def clear_all_caches() -> str:
+            """Clear the caches of all cached entrypoints
+
+            \f
+            Returns:
+                str: "OK" on success
+            """
+            for cache in self._caches.values():
+                cache.clear()
+            return "OK"
+
+        def clear_cache(entrypoint: str) -> str:
+            """Clear the cache of a single entrypoint
+
+            \f
+            Args:
+                entrypoint (str): Name of the cached entrypoint
+
+            Raises:
+                HTTPException: If the entrypoint is not cached
+
+            Returns:
+                str: "OK" on success
+            """
+            if entrypoint not in self._caches:
+                raise HTTPException(
+                    status_code=404, detail=f"No cache for entrypoint {entrypoint}"
+                )
+            self._caches[entrypoint].clear()
+            return "OK"
+
+        self.app.get("/~cache", tags=["Cache"])(get_cache_stats)
+        self.app.delete("/~cache", tags=["Cache"])(clear_all_caches)
+        self.app.delete("/~cache/{entrypoint}", tags=["Cache"])(clear_cache)
+
+    def _add_parameters_api(self):
+        """Add the endpoints for all parameters at once"""
+
+        def get_all_parameters(response: Response) -> dict:
+            """Get all registered parameter endpoints
+
+            \f
+            Returns:
+                dict: The registered parameters and their current value. The
+                    version of the values is in the ``X-Parameters-Version``
+                    header.
+            """
+            snapshot = self._parameter_store.snapshot()
+            response.headers["X-Parameters-Version"] = str(snapshot["version"])
+            return snapshot["parameters"]
+
+        self.app.get("/~parameters", tags=["Parameters"])(get_all_parameters)
+
+        def update_parameters(values: dict = Body(...)) -> dict:
+            """Update several parameters at once. Either all or none of the
+            parameters are updated.
+
+            \f
+            Args:
+                values (dict): New values, by parameter name.
+
+            Raises:
+                HTTPException: If a parameter does not exist, can not be updated
+                    through the API or if a value is not valid.
+
+            Returns:
+                dict: The version of the update and the new values
+            """
+            for name in values:
+                if name not in self.parameters:
+                    raise HTTPException(
+                        status_code=404, detail=f"Parameter {name} does not exist"
+                    )
+                if not self.parameters[name].get("expose", True):
+                    raise HTTPException(
+                        status_code=403,
+                        detail=f"Parameter {name} can not be updated through the API",
+                    )
+            try:
+                values, version = self._update_parameters(values)
+            except ValidationError as exc:
+                raise HTTPException(status_code=422, detail=str(exc)) from None
+            return {"version": version, "parameters": values}
+
+        self.app.post("/~parameters", tags=["Parameters"])(update_parameters)
+
+        async def watch_parameters(
+            since: int = Query(0, ge=0),
+            timeout: float = Query(30, gt=0, le=MAX_WATCH_SECONDS),
+        ) -> dict:
+            """Wait for parameter updates after a version
+
+            \f
+            Args:
+                since (int): The latest version the caller has seen. Defaults
+                    to 0.
+                timeout (float): Seconds to wait at most. Defaults to 30.
+
+            Returns:
+                dict: The current version and the parameters that have been
+                    updated after ``since``, which is empty if nothing changed
+                    before the timeout. If ``since`` is newer than the current
+                    version, the service has been restarted and all parameters
+                    are returned.
+            """
+            return await self._parameter_store.watch(since, timeout)
+
+        self.app.get("/~parameters/watch", tags=["Parameters"])(watch_parameters)
+
+    def _add_health_api(self):
+        """Register the endpoints for health and readiness checks"""
+
+        def get_health() -> str:
+            """Check that the service is running
+
+            \f
+            Returns:
+                str: "OK" as long as the service responds
+            """
+            return "OK"
+
+        def get_ready() -> str:
+            """Check that the service is ready to receive traffic, which is
+            when all warm-up hooks have finished
+
+            \f
+            Raises:
+                HTTPException: With status 503 while warming up or if a
+                    warm-up hook failed
+
+            Returns:
+                str: "OK" when the service is ready
+            """
+            if self._warmup_error is not None:
+                raise HTTPException(
+                    status_code=503, detail=f"Warm-up failed: {self._warmup_error}"
+                )
+            if not self.ready:
+                raise HTTPException(status_code=503, detail="Warming up")
+            return "OK"
+
+        self.app.get("/~health", tags=["Health"])(get_health)
+        self.app.get("/~ready", tags=["Health"])(get_ready)
+
+    def _add_jobs_api(self):
+        """Register the endpoints for the status and results of jobs"""
+
+        def get_jobs() -> Response:
+            """Get the status of all jobs that have not expired
+
+            \f
+            Returns:
+                Response: Id, entrypoint, status and timestamps of each job,
+                    oldest first
+            """
+            return FastJSONResponse(
+                [job.as_dict(result=False) for job in self._jobs.all()]
+            )
+
+        def get_job(job_id: str) -> Response:
+            """Get the status of a job and, once it has finished, its result
+
+            \f
+            Args:
+                job_id (str): Id of the job
+
+            Raises:
+                HTTPException: If the job does not exist or has expired
+
+            Returns:
+                Response: Id, entrypoint, status, timestamps and the result or
+                    the error of the job
+            """
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail=f"No job with id {job_id}")
+            return FastJSONResponse(job.as_dict())
+
+        self.app.get("/~jobs", tags=["Jobs"])(get_jobs)
+        self.app.get("/~jobs/{job_id}", tags=["Jobs"])(get_job)
+
+    def _add_monitoring_api(self):
+        """Add the endpoints for the monitored data"""
         self.app.get("/~monitor", tags=["Monitoring"])(get_monitored_data_json)
         self.app.get("/~monitor/csv", tags=["Monitoring"])(get_monitored_data_csv)
+        self.app.get("/~monitor/aggregate", tags=["Monitoring"])(
+            get_monitored_data_aggregate
+        )
         self.app.get("/~monitor/db", tags=["Monitoring"])(get_monitored_data_db)
 
-        # Parameters API
-        def get_all_parameters() -> dict:
-            """Get all registered parameter endpoints
+    def _add_stats_api(self):
+        """Add the endpoints with statistics of the entrypoints and tasks"""
+
+        def get_batching_stats() -> dict:
+            """Get batching statistics for all batched entrypoints
+
+            \f
+            Returns:
+                dict: Queue depth, batch size distribution and time spent waiting
+                    for a batch, per entrypoint
+            """
+            return {name: batcher.stats() for name, batcher in self._batchers.items()}
+
+        self.app.get("/~monitor/batching", tags=["Monitoring"])(get_batching_stats)
+
+        def get_concurrency_stats() -> dict:
+            """Get concurrency statistics for all entrypoints with concurrency
+            limits or timeouts
 
             \f
             Returns:
-                dict: The registered parameters and their current value
+                dict: Queue depth, running calls and the number of rejected and
+                    timed out calls, per entrypoint
+            """
+            return {name: limits.stats() for name, limits in self._bulkheads.items()}
+
+        self.app.get("/~monitor/concurrency", tags=["Monitoring"])(
+            get_concurrency_stats
+        )
+
+        def get_process_stats() -> dict:
+            """Get statistics for all entrypoints that run in worker processes
+
+            \f
+            Returns:
+                dict: Number of workers, busy workers and the number of restarted
+                    and recycled workers, per entrypoint
+            """
+            return {name: pool.stats() for name, pool in self._process_pools.items()}
+
+        self.app.get("/~monitor/processes", tags=["Monitoring"])(get_process_stats)
+
+        def get_job_stats() -> dict:
+            """Get statistics for all job entrypoints
+
+            \f
+            Returns:
+                dict: Queued and running jobs and the number of succeeded, failed
+                    and rejected jobs, per entrypoint
+            """
+            return {name: jobs.stats() for name, jobs in self._job_queues.items()}
+
+        self.app.get("/~monitor/jobs", tags=["Monitoring"])(get_job_stats)
+
+        def get_coalescing_stats() -> dict:
+            """Get statistics for all entrypoints that coalesce identical
+            concurrent requests
+
+            \f
+            Returns:
+                dict: Calls in flight, calls made and requests that joined a call
+                    in flight, per entrypoint
             """
             return {
-                param: param_dict["value"]
-                for param, param_dict in self.parameters.items()
+                name: single_flight.stats()
+                for name, single_flight in self._single_flights.items()
             }
 
-        self.app.get("/~parameters", tags=["Parameters"])(get_all_parameters)
+        self.app.get("/~monitor/coalescing", tags=["Monitoring"])(get_coalescing_stats)
+
+        def get_task_stats() -> dict:
+            """Get statistics for all call_every tasks
+
+            \f
+            Returns:
+                dict: Schedule, number of runs, failures, skipped runs and
+                    overruns, and the lateness and duration of the runs, per task
+            """
+            return {task.name: task.stats() for task in self._scheduler.tasks}
+
+        self.app.get("/~monitor/tasks", tags=["Monitoring"])(get_task_stats)
+
+        def get_queue_stats() -> dict:
+            """Get statistics of the queue of values waiting to be written to
+            the monitoring database
+
+            \f
+            Returns:
+                dict: Size and policy of the queue, the number of waiting values
+                    and the numbers of enqueued and dropped values
+            """
+            return queue_stats()
+
+        self.app.get("/~monitor/queue", tags=["Monitoring"])(get_queue_stats)
+
+    def _add_profile_api(self):
+        """Register the endpoint for profiling the service"""
+
+        def get_profile(
+            seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+            format: str = Query(  # pylint: disable=redefined-builtin
+                "speedscope", pattern="^(speedscope|collapsed)$"
+            ),
+        ) -> Response:
+            """Profile the service by sampling the call stacks of all its threads
+
+            Only one profile can be taken at a time. Open the result in
+            https://www.speedscope.app or any flame graph tool that reads the
+            collapsed stack format.
 
-    def entrypoint(
+            \f
+            Args:
+                seconds (float): How long to profile. At most 60 seconds.
+                format (str): "speedscope" for a speedscope JSON file or
+                    "collapsed" for collapsed stacks.
+
+            Raises:
+                HTTPException: With status 409 if a profile is already being
+                    taken
+
+            Returns:
+                Response: The sampled call stacks
+            """
+            if not self._profiling.acquire(blocking=False):
+                raise HTTPException(
+                    status_code=409, detail="A profile is already being taken"
+                )
+            try:
+                profile = profiler.sample(seconds)
+            finally:
+                self._profiling.release()
+            if format == "collapsed":
+                return Response(profile.collapsed(), media_type="text/plain")
+            name = f"{get_service_name()} {get_service_version()}"
+            return JSONResponse(profile.speedscope(name))
+
+        self.app.get("/~profile", tags=["Monitoring"])(get_profile)
+
+    def _collect_metrics(self):
+        """Metric families that are read from the state of the service when
+        the metrics are rendered"""
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        yield (
+            "daeploy_thread_pool_size",
+            "gauge",
+            "Number of threads for synchronous entrypoints",
+            [({}, limiter.total_tokens)],
+        )
+        yield (
+            "daeploy_thread_pool_in_use",
+            "gauge",
+            "Number of threads that are busy with synchronous entrypoints",
+            [({}, limiter.borrowed_tokens)],
+        )
+        yield (
+            "daeploy_monitoring_queue_depth",
+            "gauge",
+            "Number of values waiting to be written to the monitoring database",
+            [({}, queue_depth())],
+        )
+        monitoring_queue = queue_stats()
+        yield (
+            "daeploy_monitoring_enqueued_total",
+            "counter",
+            "Number of values put in the queue to the monitoring database",
+            [({}, monitoring_queue["enqueued"])],
+        )
+        yield (
+            "daeploy_monitoring_dropped_total",
+            "counter",
+            "Number of values dropped because the monitoring queue was full",
+            [({}, monitoring_queue["dropped"])],
+        )
+        queues = (
+            [
+                ({"entrypoint": name, "kind": "batch"}, batcher.queue_depth)
+                for name, batcher in self._batchers.items()
+            ]
+            + [
+                ({"entrypoint": name, "kind": "concurrency"}, bulkhead.queue_depth)
+                for name, bulkhead in self._bulkheads.items()
+            ]
+            + [
+                ({"entrypoint": name, "kind": "job"}, jobs.queue_depth)
+                for name, jobs in self._job_queues.items()
+            ]
+        )
+        yield (
+            "daeploy_entrypoint_queue_depth",
+            "gauge",
+            "Number of requests waiting for a batch, a free slot or a job worker",
+            queues,
+        )
+        yield (
+            "daeploy_entrypoint_rejected_total",
+            "counter",
+            "Number of requests rejected because the admission queue was full",
+            [
+                ({"entrypoint": name}, bulkhead.rejected)
+                for name, bulkhead in self._bulkheads.items()
+            ],
+        )
+        yield (
+            "daeploy_entrypoint_coalesced_total",
+            "counter",
+            "Number of requests that shared the call of an identical request",
+            [
+                ({"entrypoint": name}, single_flight.coalesced)
+                for name, single_flight in self._single_flights.items()
+            ],
+        )
+        yield (
+            "daeploy_process_pool_busy",
+            "gauge",
+            "Number of worker processes that are busy with a call",
+            [
+                ({"entrypoint": name}, pool.busy)
+                for name, pool in self._process_pools.items()
+            ],
+        )
+        yield (
+            "daeploy_process_pool_restarts_total",
+            "counter",
+            "Number of worker processes that were replaced, by reason",
+            [
+                ({"entrypoint": name, "reason": reason}, count)
+                for name, pool in self._process_pools.items()
+                for reason, count in (
+                    ("died", pool.restarts),
+                    ("memory", pool.recycled),
+                )
+            ],
+        )
+        tasks = self._scheduler.tasks
+        for counter, description in (
+            ("runs", "Number of runs of a call_every task"),
+            ("failures", "Number of runs of a call_every task that raised"),
+            ("skipped", "Number of runs of a call_every task skipped by overlap"),
+            (
+                "overruns",
+                "Number of runs of a call_every task longer than its interval",
+            ),
+        ):
+            yield (
+                f"daeploy_call_every_{counter}_total",
+                "counter",
+                description,
+                [({"task": task.name}, getattr(task, counter)) for task in tasks],
+            )
+        yield (
+            "daeploy_entrypoint_timeouts_total",
+            "counter",
+            "Number of requests that did not finish within their timeout",
+            [
+                ({"entrypoint": name}, bulkhead.timeouts)
+                for name, bulkhead in self._bulkheads.items()
+            ],
+        )
+
+    def _configure_thread_pool(self):
+        """Apply the configured thread pool size to the thread limiter used
+        for synchronous entrypoints."""
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = self.thread_pool_size
+        logger.info(f"Thread pool size set to {self.thread_pool_size}")
+
+    def on_warmup(self, func: Callable) -> Callable:
+        """Registers a function to run when the service starts, before the
+        service reports that it is ready at ``/~ready``.
+
+        Use warm-up hooks to load models and fill caches, or to make a few
+        synthetic calls so that the first real requests do not pay for lazy
+        initialization::
+
+            @service.on_warmup
+            def warmup():
+                model.predict(example_input)
+
+        The hooks run in the order they were registered, in the background so
+        that ``/~health`` responds in the meantime. Hooks defined with
+        ``async def`` are awaited and other hooks are run in a thread. If a hook
+        raises an exception, the service is never reported as ready.
+
+        Args:
+            func (Callable): The function to run, without arguments.
+
+        Raises:
+            TypeError: If :obj:`func` is not callable.
+
+        Returns:
+            Callable: The decorated function: :obj:`func`.
+        """
+        if not callable(func):
+            raise TypeError(f"{func} is not callable.")
+        self._warmup_hooks.append(func)
+        return func
+
+    async def _start_warmup(self):
+        """Run the warm-up hooks in the background on service startup"""
+        self._warmup_task = asyncio.ensure_future(self._warmup())
+
+    def _stop_process_pools(self):
+        """Stop the worker processes of all entrypoints"""
+        for pool in self._process_pools.values():
+            pool.stop()
+
+    async def _warmup(self):
+        """Run all warm-up hooks and mark the service as ready"""
+        start = time.monotonic()
+        for hook in self._warmup_hooks:
+            try:
+                if inspect.iscoroutinefunction(hook):
+                    await hook()
+                else:
+                    await run_in_threadpool(hook)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(f"Warm-up hook {hook} failed")
+                self._warmup_error = repr(exc)
+                return
+        # Worker processes are forked after the hooks, to inherit what they load
+        for pool in self._process_pools.values():
+            await run_in_threadpool(pool.start)
+        self.ready = True
+        if self._warmup_hooks:
+            logger.info(f"Warm-up finished in {time.monotonic() - start:.2f}s")
+
+    def entrypoint(  # pylint: disable=too-many-locals
         self,
         func: Callable = None,
         method: str = "POST",
         monitor: bool = False,
         disable_http_logs: bool = False,
+        batch: bool = False,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10,
+        cache: Optional[dict] = None,
+        coalesce: bool = False,
+        fast_json: Optional[bool] = None,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = None,
+        executor: str = "thread",
+        workers: Optional[int] = None,
+        max_worker_memory_mb: Optional[float] = None,
         **fastapi_kwargs,
     ) -> Callable:
         """Registers a function as an entrypoint, which will make it reachable
@@ -133,6 +780,96 @@ class _Service:
         It is strongly recommended to include types of the arguments and return
         objects for the decorated function.
 
+        Functions defined with ``async def`` are awaited directly on the event
+        loop, while regular functions are run in a thread pool. The size of the
+        thread pool is set by :attr:`thread_pool_size` or the environment variable
+        ``DAEPLOY_SERVICE_THREAD_POOL_SIZE``.
+
+        With ``batch=True``, concurrent requests are merged into a single call
+        of the decorated function. The function then receives a list of values
+        for each argument, one per request, and must return a list with one
+        result per request. The type hints should describe a single request::
+
+            @entrypoint(batch=True, max_batch_size=64, max_wait_ms=5)
+            def predict(features: List[float]) -> int:
+                # features is a list of List[float], one per request
+                return model.predict(features).tolist()
+
+        Statistics for batched entrypoints are available at ``/~monitor/batching``.
+
+        With ``cache``, results are cached using the validated arguments as key,
+        so that repeated identical requests are answered without calling the
+        decorated function::
+
+            @entrypoint(cache={"ttl": 30, "maxsize": 10000})
+            def lookup(key: str) -> dict:
+                ...
+
+        Cache statistics are available at ``/~cache`` and caches can be cleared
+        with ``DELETE /~cache`` or ``DELETE /~cache/<entrypoint>``.
+
+        With ``coalesce=True``, identical requests that arrive while a call with
+        the same arguments is in flight wait for that call and get its result,
+        instead of calling the decorated function again. Nothing is kept once
+        the call has finished, so this only suits functions that give the same
+        result for the same arguments at the same time. Combined with ``cache``,
+        it keeps a burst of cache misses from calling the function more than
+        once. The number of coalesced requests is available at
+        ``/~monitor/coalescing``.
+
+        With ``fast_json=True``, or :attr:`fast_json` set to True for the whole
+        service, the result is encoded directly with a fast JSON serializer that
+        handles numpy arrays and scalars, datetimes and pandas objects natively.
+        This skips FastAPI's ``jsonable_encoder`` and the validation of the result
+        against the return type, which for large arrays and dataframes is often
+        more expensive than computing the result.
+
+        Entrypoints that use the array and dataframe types from
+        :mod:`daeploy.data_types` also accept and return compact binary
+        encodings, selected with the ``Content-Type`` and ``Accept`` headers:
+        ``application/x-npy`` (a single numpy array),
+        ``application/vnd.apache.arrow.stream`` (a single DataFrame, requires
+        ``pyarrow``) and ``application/msgpack`` (requires ``msgpack``). JSON
+        remains the default.
+
+        With ``max_concurrency``, at most that many calls to the entrypoint run at
+        the same time, in threads reserved for it, so that a slow entrypoint can
+        not starve the others of the shared thread pool. Calls beyond that wait
+        in a queue of at most ``max_queue`` calls, and further calls are rejected
+        right away with status 503. Calls that take longer than ``timeout``
+        seconds are answered with status 504::
+
+            @entrypoint(max_concurrency=2, max_queue=10, timeout=30)
+            def retrain(data: DataFrameInput) -> str:
+                ...
+
+        Concurrency statistics are available at ``/~monitor/concurrency``.
+
+        With ``executor="process"``, calls run in a pool of ``workers`` processes,
+        so that CPU-bound Python code that holds the GIL can use more than one
+        core. Large numpy arrays among the arguments and as result are passed
+        through shared memory instead of being pickled. The worker processes are
+        forked once the warm-up hooks have finished and therefore start with
+        whatever the hooks have loaded. Workers that die are restarted and,
+        with ``max_worker_memory_mb``, workers that use more memory than that
+        after a call are replaced::
+
+            @entrypoint(executor="process", workers=4, max_worker_memory_mb=2000)
+            def features(data: ArrayInput) -> ArrayOutput:
+                ...
+
+        Process statistics are available at ``/~monitor/processes``.
+
+        Generator functions, with ``def`` or ``async def``, stream their items
+        to the client as they are produced instead of collecting them first. The
+        items are sent as newline delimited JSON (``application/x-ndjson``), or as
+        server-sent events if the request has ``Accept: text/event-stream``::
+
+            @entrypoint
+            def predictions(count: int):
+                for _ in range(count):
+                    yield model.predict_next()
+
         Args:
             func (Callable): The decorated function to make an entrypoint for.
             method (str): HTTP method for entrypoint. Defauts to "POST"
@@ -143,80 +880,178 @@ class _Service:
                 These logs are genereated from uvicorn. Defaults to False.
                 Example of http entry log:
                 ``"POST /services/service_1.0.0/entrypoint_name HTTP/1.1" 200 OK``
+            batch (bool): Set if concurrent requests should be merged into a single
+                call of the decorated function. Defaults to False.
+            max_batch_size (int): The largest number of requests in one batch.
+                Only used if ``batch=True``. Defaults to 32.
+            max_wait_ms (float): The longest time in milliseconds that a request
+                waits for its batch to fill up before it is processed anyway.
+                Only used if ``batch=True``. Defaults to 10.
+            cache (Optional[dict]): Cache the results of this entrypoint. Accepts
+                the keys ``ttl``, seconds to keep a result (no expiry if not
+                given), and ``maxsize``, the number of results to keep (default
+                1024). Defaults to None, in which case nothing is cached.
+            coalesce (bool): Let identical concurrent requests share a single
+                call of the decorated function. Defaults to False.
+            fast_json (Optional[bool]): Encode the result with the fast JSON
+                serializer. Defaults to None, in which case the service-wide
+                :attr:`fast_json` setting is used.
+            max_concurrency (Optional[int]): The largest number of concurrent calls
+                to this entrypoint. Defaults to None, which means no limit.
+            max_queue (Optional[int]): The largest number of calls waiting for
+                one of the ``max_concurrency`` slots. Defaults to None, which means
+                no limit.
+            timeout (Optional[float]): Seconds before a call is answered with
+                status 504. Defaults to None, which means no timeout.
+            executor (str): Where calls to a function defined with ``def`` run,
+                ``"thread"`` for the thread pool or ``"process"`` for worker
+                processes. Defaults to "thread".
+            workers (Optional[int]): Number of worker processes for
+                ``executor="process"``. Defaults to None, which means one per CPU.
+            max_worker_memory_mb (Optional[float]): Memory in megabytes that a
+                worker process may use before it is replaced. Defaults to None,
+                which means no limit.
             **fastapi_kwargs: Keyword arguments for the resulting API endpoint.
                 See FastAPI for keyword arguments of the ``FastAPI.api_route()``
                 function.
 
         Raises:
             TypeError: If :obj:`func` is not callable.
-            ValueError: If method is not a valid HTTP method.
+            ValueError: If method is not a valid HTTP method, if the concurrency
+                limits are out of range, if a generator function is combined
+                with ``batch``, ``cache``, ``coalesce`` or concurrency limits or if
+                ``executor="process"`` is used for an ``async def`` function or
+                a generator function.
 
         Returns:
-            Callable: The decorated function: :obj:`func`
+            Callable: The decorated function: :obj:`func`. Batched entrypoints
+            are returned without pydantic validation, since their arguments are
+            lists of the annotated types.
         """
         method = method.upper()
         if method not in HTTP_METHODS:
             raise ValueError(
                 f"Invalid HTTP method: {method}." f" Possible options: {HTTP_METHODS}"
             )
+        if executor not in ("thread", "process"):
+            raise ValueError(
+                f"Invalid executor: {executor}. Possible options: thread, process"
+            )
 
         # pylint: disable=protected-access
         def entrypoint_decorator(deco_func):
             funcname = deco_func.__name__
             path = f"/{funcname}"
             signature = inspect.signature(deco_func)
-
-            # Update default values to fastapi Body parameters to force all parameters
-            # in a json body for the resulting HTTP method
-            new_params = []
-            request_sig = inspect.Parameter(
-                "_request", Parameter.POSITIONAL_OR_KEYWORD, annotation=Request
+            binary = _uses_data_types(signature)
+            streaming = inspect.isgeneratorfunction(
+                deco_func
+            ) or inspect.isasyncgenfunction(deco_func)
+            limited = any(
+                option is not None for option in (max_concurrency, max_queue, timeout)
+            )
+            if streaming and (batch or cache is not None or coalesce or limited):
+                raise ValueError(
+                    f"Generator entrypoint {funcname} can not be batched, cached,"
+                    " coalesced or have concurrency limits"
+                )
+            if executor == "process" and (
+                streaming or inspect.iscoroutinefunction(deco_func)
+            ):
+                raise ValueError(
+                    f"Entrypoint {funcname} can not run in worker processes, only"
+                    " regular functions defined with def can"
+                )
+
+            call = self._entrypoint_call(
+                deco_func,
+                batch=(
+                    dict(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+                    if batch
+                    else None
+                ),
+                cache=cache,
+                coalesce=coalesce,
+                limits=(
+                    dict(
+                        max_concurrency=max_concurrency,
+                        max_queue=max_queue,
+                        timeout=timeout,
+                    )
+                    if limited
+                    else None
+                ),
+                processes=(
+                    dict(workers=workers, max_memory_mb=max_worker_memory_mb)
+                    if executor == "process"
+                    else None
+                ),
             )
-            new_params.append(request_sig)
-            for parameter in signature.parameters.values():
-                if parameter.default == inspect._empty:
-                    default = Ellipsis
-                else:
-                    default = parameter.default
-                new_params.append(parameter.replace(default=Body(default, embed=True)))
 
-            @functools.wraps(deco_func)
-            # async is required for the request.body() method.
+            status_code = fastapi_kwargs.get("status_code") or 200
+
             async def wrapper(_request: Request, *args, **kwargs):
-                result = await run_in_threadpool(deco_func, *args, **kwargs)
-
-                if monitor:
-                    request_body = await _request.body()
-                    json_response = json.dumps(jsonable_encoder(result))
-                    self.store(
-                        **{
-                            f"{funcname}_request": request_body.decode("utf-8"),
-                            f"{funcname}_response": json_response,
-                        }
+                if streaming:
+                    event_stream = EVENT_STREAM in _request.headers.get("accept", "")
+                    return streaming_response(
+                        deco_func(*args, **kwargs), event_stream, status_code
                     )
+                result = await call(*args, **kwargs)
+                if isinstance(result, Response):
+                    return result
+                if binary:
+                    media = _encoding.negotiate(_request.headers.get("accept"), result)
+                    if media:
+                        return Response(
+                            _encoding.encode(result, media),
+                            media_type=media,
+                            status_code=status_code,
+                        )
+                if fast_json or (fast_json is None and self.fast_json):
+                    # Returning a response skips FastAPI's own serialization
+                    return FastJSONResponse(result, status_code=status_code)
                 return result
 
+            # Not functools.wraps, since FastAPI would then see the original
+            # function and treat generator functions as its own streaming routes
+            wrapper.__name__ = deco_func.__name__
+            wrapper.__qualname__ = deco_func.__qualname__
+            wrapper.__doc__ = deco_func.__doc__
+
             # Update the signature
-            signature = signature.replace(parameters=new_params)
+            signature = _endpoint_signature(signature)
             wrapper.__signature__ = signature
 
             # Get response_model from return type hint
             return_type = signature.return_annotation
-            if return_type == inspect._empty:
+            if return_type == inspect._empty or streaming:
                 return_type = None
 
             # Give priority to explicitly given response_model
             kwargs = dict(response_model=return_type)
             kwargs.update(fastapi_kwargs)
 
+            # Monitored entrypoints save each call from the route itself, where
+            # the raw request and the serialized response are both available.
+            # Binary request bodies are decoded there, before validation, and
+            # the request metrics are counted there as well.
+            kwargs["route_class_override"] = entrypoint_route_class(
+                monitor_name=f"{funcname}_calls" if monitor else None,
+                decode_binary=binary,
+                metrics=self.metrics.entrypoint(funcname),
+            )
+
             # Create API endpoint
-            self.app.api_route(path, methods=[method], tags=["Entrypoints"], **kwargs)(
-                wrapper
+            self.app.router.add_api_route(
+                path, wrapper, methods=[method], tags=["Entrypoints"], **kwargs
             )
 
             if disable_http_logs:
                 _disable_http_logs(path)
 
+            if batch or streaming:
+                return deco_func
+
             # Wrap the original func in a pydantic validation wrapper and return that
             return validate_call(deco_func)
 
@@ -225,11 +1060,188 @@ class _Service:
             raise TypeError(f"{func} is not callable.")
         return entrypoint_decorator(func) if callable(func) else entrypoint_decorator
 
+    def _entrypoint_call(
+        self,
+        func: Callable,
+        batch: Optional[dict] = None,
+        cache: Optional[dict] = None,
+        coalesce: bool = False,
+        limits: Optional[dict] = None,
+        processes: Optional[dict] = None,
+    ) -> Callable[..., Awaitable[Any]]:
+        """Create the awaitable that calls an entrypoint function, with the
+        batching, caching, coalescing and concurrency limits of the entrypoint.
+
+        Args:
+            func (Callable): The entrypoint function.
+            batch (Optional[dict]): Arguments for :class:`_Batcher`, if the
+                entrypoint is batched. Defaults to None.
+            cache (Optional[dict]): Arguments for :class:`_ResponseCache`, if the
+                entrypoint is cached. Defaults to None.
+            coalesce (bool): If identical concurrent calls share a single call.
+                Defaults to False.
+            limits (Optional[dict]): Arguments for :class:`_Bulkhead`, if the
+                entrypoint has concurrency limits or a timeout. Defaults to None.
+            processes (Optional[dict]): Arguments for :class:`_ProcessPool`, if
+                the entrypoint runs in worker processes. Defaults to None.
+
+        Returns:
+            Callable[..., Awaitable[Any]]: Awaitable that takes the arguments of
+            the entrypoint as keyword arguments.
+        """
+        funcname = func.__name__
+        if processes is not None:
+            # Calls become awaitables that run in a worker process
+            pool = _ProcessPool(func, **processes)
+            self._process_pools[funcname] = pool
+            func = pool.call
+
+        if limits is not None:
+            # Runs in its own threads, with its own admission queue
+            bulkhead = _Bulkhead(**limits)
+            self._bulkheads[funcname] = bulkhead
+            call = bulkhead.wrap(func)
+        elif inspect.iscoroutinefunction(func):
+            # Non-blocking code, defined by `async def`
+            call = func
+        else:
+            # Blocking code, defined by `def`
+            call = functools.partial(run_in_threadpool, func)
+
+        if batch is not None:
+            batcher = _Batcher(call, **batch)
+            self._batchers[funcname] = batcher
+            call = batcher.submit
+
+        if coalesce:
+            # Behind the cache, so that concurrent cache misses share a call
+            single_flight = _SingleFlight()
+            self._single_flights[funcname] = single_flight
+            call = single_flight.wrap(call)
+
+        if cache is not None:
+            response_cache = _ResponseCache(**cache)
+            self._caches[funcname] = response_cache
+            call = response_cache.wrap(call)
+
+        return call
+
+    def job(
+        self,
+        func: Callable = None,
+        method: str = "POST",
+        workers: int = 1,
+        max_queue: Optional[int] = None,
+        ttl: float = 3600,
+        disable_http_logs: bool = False,
+        **fastapi_kwargs,
+    ) -> Callable:
+        """Registers a function as a job entrypoint, which runs in the
+        background instead of while the client waits for the response.
+
+        Decorate a function with this method to create a job entrypoint::
+
+            @service.job(workers=2, ttl=600)
+            def retrain(data: DataFrameInput) -> dict:
+                ...
+
+        A request to the job entrypoint is answered right away with status 202
+        and the id of the job, which is also in the ``Location`` header. The
+        status of the job, and its result or error once it has finished, is
+        available at ``/~jobs/<id>`` until ``ttl`` seconds after it finished.
+        At most ``workers`` jobs of the entrypoint run at the same time, in
+        threads reserved for them or on the event loop for ``async def``
+        functions, and further jobs are queued. Job statistics are available at
+        ``/~monitor/jobs``.
+
+        Args:
+            func (Callable): The decorated function to make a job entrypoint for.
+            method (str): HTTP method for entrypoint. Defauts to "POST"
+            workers (int): Largest number of jobs of this entrypoint that run at
+                the same time. Defaults to 1.
+            max_queue (Optional[int]): Largest number of jobs waiting for a
+                worker, further requests are rejected with status 503. Defaults
+                to None, which means no limit.
+            ttl (float): Seconds that a finished job and its result are kept.
+                Defaults to 3600.
+            disable_http_logs (bool): Set if the http entry logs should be disabled
+                for this entrypoint. Defaults to False.
+            **fastapi_kwargs: Keyword arguments for the resulting API endpoint.
+                See FastAPI for keyword arguments of the ``FastAPI.api_route()``
+                function.
+
+        Raises:
+            TypeError: If :obj:`func` is not callable.
+            ValueError: If method is not a valid HTTP method, if the options are
+                out of range or if :obj:`func` is a generator function.
+
+        Returns:
+            Callable: The decorated function: :obj:`func`, with pydantic
+            validation.
+        """
+        method = method.upper()
+        if method not in HTTP_METHODS:
+            raise ValueError(
+                f"Invalid HTTP method: {method}." f" Possible options: {HTTP_METHODS}"
+            )
+
+        def job_decorator(deco_func):
+            funcname = deco_func.__name__
+            path = f"/{funcname}"
+            if inspect.isgeneratorfunction(deco_func) or inspect.isasyncgenfunction(
+                deco_func
+            ):
+                raise ValueError(f"Generator function {funcname} can not be a job")
+            signature = inspect.signature(deco_func)
+            jobs = _JobQueue(
+                deco_func, self._jobs, workers=workers, max_queue=max_queue, ttl=ttl
+            )
+            self._job_queues[funcname] = jobs
+
+            async def wrapper(_request: Request, **kwargs):
+                job = jobs.submit(**kwargs)
+                root_path = _request.scope.get("root_path", "")
+                return FastJSONResponse(
+                    job.as_dict(),
+                    status_code=202,
+                    headers={"Location": f"{root_path}/~jobs/{job.id}"},
+                )
+
+            wrapper.__name__ = deco_func.__name__
+            wrapper.__qualname__ = deco_func.__qualname__
+            wrapper.__doc__ = deco_func.__doc__
+            wrapper.__signature__ = _endpoint_signature(signature)
+
+            kwargs = dict(response_model=None, status_code=202)
+            kwargs.update(fastapi_kwargs)
+            kwargs["route_class_override"] = entrypoint_route_class(
+                decode_binary=_uses_data_types(signature),
+                metrics=self.metrics.entrypoint(funcname),
+            )
+            self.app.router.add_api_route(
+                path, wrapper, methods=[method], tags=["Entrypoints"], **kwargs
+            )
+
+            if disable_http_logs:
+                _disable_http_logs(path)
+
+            return validate_call(deco_func)
+
+        if not (callable(func) or func is None):
+            raise TypeError(f"{func} is not callable.")
+        return job_decorator(func) if callable(func) else job_decorator
+
     def store(self, **variables):  # pylint: disable=no-self-use
         """Saves variables to the service's monitoring database. Supports
         numbers and strings. If a variable is not a number or string it store
         will try to coerce it into a string before storing.
 
+        Values are written by a background thread. When they are stored faster
+        than they can be written, values are dropped once the queue to the
+        writer is full, as set by DAEPLOY_SERVICE_DB_QUEUE_SIZE and
+        DAEPLOY_SERVICE_DB_QUEUE_POLICY. Queue statistics are available at
+        ``/~monitor/queue``.
+
         Args:
             **variables: Variables to save to the database. Non-numeric
                 variables will be saved as JSON with :func:`json.dumps`
@@ -242,11 +1254,15 @@ class _Service:
 
     def call_every(
         self,
-        seconds: float,
+        seconds: Optional[float] = None,
         wait_first: bool = False,
+        cron: Optional[str] = None,
+        mode: str = "fixed_rate",
+        jitter: float = 0,
+        overlap: str = "skip",
     ):
-        """Returns a decorator that converts a function to an awaitable that runs
-        every `seconds`.
+        """Returns a decorator that makes a function run repeatedly, every
+        `seconds` or on a cron schedule.
 
         Decorate a function with this method to make it run repeatedly::
 
@@ -254,17 +1270,48 @@ class _Service:
             def my_function():
                 ....
 
+        All repeated functions are run by a single scheduler, which uses a
+        monotonic clock. With ``mode="fixed_rate"`` the runs start every
+        `seconds`, regardless of how long they take, and with
+        ``mode="fixed_delay"`` the next run starts `seconds` after the previous
+        run has finished. A cron expression of the five fields minute, hour, day
+        of month, month and day of week, in the local time of the service, can
+        be used instead of `seconds`::
+
+            @call_every(cron="0 3 * * *")
+            def nightly_retrain():
+                ....
+
+        The ``overlap`` policy decides what happens when a run is due while the
+        previous run has not finished yet: ``"skip"`` the run, ``"queue"`` it
+        until the previous run has finished or run both ``"concurrent"``-ly.
+        Runs that take longer than `seconds` emit a warning and a notification.
+        Statistics of all tasks are available at ``/~monitor/tasks``.
+
         Args:
-            seconds (float): Interval between calls in seconds
+            seconds (Optional[float]): Interval between calls in seconds.
+                Defaults to None, in which case ``cron`` must be given.
             wait_first (bool): If we should skip the first execution. Defaults to False.
+            cron (Optional[str]): Cron expression for when to run the function.
+                Defaults to None.
+            mode (str): "fixed_rate" or "fixed_delay". Defaults to "fixed_rate".
+            jitter (float): Largest random delay in seconds added to each run, to
+                spread out tasks of many services. Defaults to 0.
+            overlap (str): "skip", "queue" or "concurrent". Defaults to "skip".
+
+        Raises:
+            ValueError: If neither or both of seconds and cron are given, or if
+                any of the options is not valid.
 
         Returns:
             Callable: The decorator
         """
+        # Validate the options when the decorator is created
+        _Task(lambda: None, "", seconds, cron, mode, jitter, overlap)
 
         def timed_task_decorator(func: Callable) -> Callable:
-            """Puts the decorated `func` in a timed asynchronous loop and
-            returns the unwrapped `func` again.
+            """Adds the decorated `func` to the scheduler and returns the
+            unwrapped `func` again.
 
             Args:
                 func (Callable): The function to be called repeatedly
@@ -272,48 +1319,10 @@ class _Service:
             Returns:
                 Callable: The same function that was inputted
             """
-            is_coroutine = asyncio.iscoroutinefunction(func)
-
-            async def timer():
-
-                # Sleep before first call if required
-                if wait_first:
-                    await asyncio.sleep(seconds)
-
-                # Run forever
-                while True:
-                    # For timing purposes
-                    t_0 = time.time()
-
-                    # Await `func` and log any exceptions
-                    try:
-                        if is_coroutine:
-                            # Non-blocking code, defined by `async def`
-                            await func()
-                        else:
-                            # Blocking code, defined by `def`
-                            await run_in_threadpool(func)
-                    except Exception:  # pylint: disable=broad-except
-                        logger.exception(f"Exception in {func}")
-
-                    # Timing check
-                    remainder = seconds - (time.time() - t_0)
-                    if remainder < 0:
-                        msg = (
-                            f"Function {func} has an execution time the exceeds"
-                            f" the requested execution interval of {seconds}s!"
-                        )
-                        warnings.warn(msg, UserWarning)
-                        notify(msg, Severity.WARNING)
-
-                    # Sleep until next time
-                    await asyncio.sleep(max(remainder, 0))
-
-            # Put `timer` on the event loop on service startup
-            @self.app.on_event("startup")
-            async def _starter():
-                asyncio.ensure_future(timer())
-
+            name = getattr(func, "__name__", repr(func))
+            self._scheduler.add(
+                _Task(func, name, seconds, cron, mode, jitter, overlap, wait_first)
+            )
             return func
 
         return timed_task_decorator
@@ -340,8 +1349,43 @@ class _Service:
         Returns:
             Any: The value of the parameter
         """
-        setter = self.parameters[parameter]["setter"]
-        return setter(value)
+        values, _ = self._update_parameters({parameter: value})
+        return values[parameter]
+
+    def _update_parameters(self, values: dict) -> Tuple[dict, int]:
+        """Validate and set one or more parameters as a single update, store
+        the monitored ones and propagate the update to the other worker processes
+
+        Raises:
+            KeyError: If a parameter does not exist.
+            ValidationError: If a value is not valid, in which case no
+                parameter is updated.
+
+        Returns:
+            Tuple[dict, int]: The validated values and the version of the
+            update, which is the current version if there are no values
+        """
+        if not values:
+            return values, self._parameter_store.version
+        values = {
+            name: self.parameters[name]["validator"](value)
+            for name, value in values.items()
+        }
+        version = self._parameter_store.update(values)
+        for name, value in values.items():
+            logger.info(f"Parameter {name} changed to {value}")
+            if self.parameters[name]["monitor"]:
+                self.store(**{name: value})
+        if self._parameter_broadcast is not None:
+            self._parameter_broadcast.publish(values, version)
+        return values, version
+
+    def _apply_parameters(self, values: dict, version: int):
+        """Set parameters that were updated in another worker process"""
+        logger.info(
+            f"Parameters {values} changed to version {version} by another worker"
+        )
+        self._parameter_store.update(values, version)
 
     def add_parameter(
         self,
@@ -353,6 +1397,14 @@ class _Service:
     ):
         """Adds a parameter to the parameter endpoints.
 
+        Every update of the parameters gets a new version. Several parameters
+        can be updated at once, as a single update, with ``POST /~parameters``
+        and ``GET /~parameters/watch?since=<version>`` waits until there are
+        updates after a version.
+
+        The name ``watch`` can not be used, since ``/~parameters/watch`` is
+        the path of the long-poll endpoint.
+
         Args:
             parameter (str): The name of the parameter
             value (Any): The value of the parameter
@@ -363,18 +1415,21 @@ class _Service:
                 string. Defaults to False.
             disable_http_logs (bool): Disable logs when getting and
                 setting paramter with API. Defaults to False
+
+        Raises:
+            ValueError: If the name of the parameter is reserved.
         """
+        if parameter == "watch":
+            raise ValueError(
+                "The parameter name watch is reserved for GET /~parameters/watch"
+            )
         path = f"/~parameters/{parameter}"
 
         if isinstance(value, Number):
             value = float(value)
 
         @validate_call()
-        def update_parameter(value: value.__class__) -> Any:
-            logger.info(f"Parameter {parameter} changed to {value}")
-            self.parameters[parameter]["value"] = value
-            if monitor:
-                self.store(**{parameter: value})
+        def validate(value: value.__class__) -> Any:
             return value
 
         if disable_http_logs:
@@ -383,9 +1438,13 @@ class _Service:
         # Set initial value
         self.parameters[parameter] = {
             "value": None,
-            "setter": update_parameter,
+            # Kept for code that sets parameters through the dictionary
+            "setter": functools.partial(self.set_parameter, parameter),
+            "validator": validate,
+            "expose": expose,
+            "monitor": monitor,
         }
-        update_parameter(value)
+        self._update_parameters({parameter: value})
 
         # Register GET endpoint for the new parameter
         def get_parameter():
@@ -400,19 +1459,115 @@ class _Service:
             )
 
             def post_update_parameter(model: update_request_model):
-                update_parameter(model.value)
+                self._update_parameters({parameter: model.value})
                 return "OK"
 
             self.app.post(path, tags=["Parameters"])(post_update_parameter)
 
-    def run(self):
+    def run(  # pylint: disable=too-many-arguments
+        self,
+        workers: Optional[int] = None,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        uds: Optional[str] = None,
+        loop: Optional[str] = None,
+        http: Optional[str] = None,
+        backlog: Optional[int] = None,
+        timeout_keep_alive: Optional[int] = None,
+        limit_concurrency: Optional[int] = None,
+    ):
         """Runs the service
 
         This method is usually called at the end of the module when all
         entrypoints etc for the service has been specified
+
+        With more than one worker, the service is served by that many processes
+        that share the port of the service. The processes are forked after the
+        service has been set up, so everything defined at import time, like a
+        loaded model, is shared with the workers. The monitoring database is
+        written by the parent process for all workers and parameter updates are
+        propagated to all workers. Note that each worker runs the
+        :meth:`call_every` tasks and keeps its own caches and metrics. Services
+        with :meth:`job` entrypoints can only be run in a single process, since
+        a job is kept by the worker that runs it.
+
+        The server transport can be tuned with the remaining arguments, or with
+        the corresponding environment variables, for example to serve sidecars
+        on the same host over a Unix domain socket or to use uvloop and
+        httptools. ``benchmarks/transport_benchmark.py`` compares the options.
+        Note that the manager reaches services over TCP on port 8000.
+
+        Args:
+            workers (Optional[int]): Number of worker processes. Defaults to None,
+                in which case the environment variable ``DAEPLOY_SERVICE_WORKERS``
+                is used, or a single process if it is not set.
+            host (str): Address to listen on. Defaults to "0.0.0.0".
+            port (int): Port to listen on. Defaults to 8000.
+            uds (Optional[str]): Path of a Unix domain socket to listen on instead
+                of ``host`` and ``port``. Defaults to ``DAEPLOY_SERVICE_UDS``.
+            loop (Optional[str]): Event loop, "auto", "asyncio" or "uvloop".
+                Defaults to ``DAEPLOY_SERVICE_LOOP`` or "auto".
+            http (Optional[str]): HTTP parser, "auto", "h11" or "httptools".
+                Defaults to ``DAEPLOY_SERVICE_HTTP`` or "auto".
+            backlog (Optional[int]): Largest number of connections waiting to be
+                accepted. Defaults to ``DAEPLOY_SERVICE_BACKLOG`` or 2048.
+            timeout_keep_alive (Optional[int]): Seconds to keep idle connections
+                open. Defaults to ``DAEPLOY_SERVICE_KEEP_ALIVE`` or 5.
+            limit_concurrency (Optional[int]): Largest number of concurrent
+                connections and tasks, beyond which requests are answered with
+                status 503. Defaults to ``DAEPLOY_SERVICE_LIMIT_CONCURRENCY`` or
+                no limit.
+
+        Raises:
+            ValueError: If ``loop`` or ``http`` is not a valid option or the
+                implementation is not installed, or if a service with job
+                entrypoints is run with more than one worker.
         """
+        workers = workers or get_service_workers()
+        if workers > 1 and self._job_queues:
+            raise ValueError(
+                f"Job entrypoints {list(self._job_queues)} can not be served by"
+                f" {workers} workers, since the status of a job is only known by"
+                " the worker that runs it. Run the service with a single worker."
+            )
+        server_config = dict(
+            host=host,
+            port=port,
+            uds=uds or get_service_uds(),
+            loop=loop or get_service_loop(),
+            http=http or get_service_http(),
+            backlog=backlog or get_service_backlog(),
+            timeout_keep_alive=timeout_keep_alive or get_service_keep_alive(),
+            limit_concurrency=limit_concurrency or get_service_limit_concurrency(),
+        )
+        _check_server_option("loop", server_config["loop"], EVENT_LOOPS)
+        _check_server_option("http", server_config["http"], HTTP_PARSERS)
         logger.info(f"Service started at: {datetime.datetime.utcnow()}")
-        uvicorn.run(self.app, host="0.0.0.0", port=8000)
+        logger.info(f"Server configuration: {server_config}")
+        if workers == 1:
+            uvicorn.run(self.app, **server_config)
+            return
+
+        logger.info(f"Starting {workers} worker processes")
+        self._parameter_broadcast = _ParameterBroadcast(
+            workers, self._parameter_store.version
+        )
+        self._parameter_store.counter = self._parameter_broadcast.next_version
+        config = uvicorn.Config(self.app, **server_config)
+        _WorkerPool(
+            config, workers, self._parameter_broadcast, self._apply_parameters
+        ).run()
+
+
+def _check_server_option(option: str, value: str, choices: List[str]):
+    """Check that an event loop or HTTP parser option is valid and, if it names
+    an implementation rather than "auto", that it is installed"""
+    if value not in choices:
+        raise ValueError(f"Invalid {option}: {value}. Possible options: {choices}")
+    if value not in ("auto", "asyncio", "h11") and not importlib.util.find_spec(value):
+        raise ValueError(
+            f"{option}={value} requires the {value} package: pip install {value}"
+        )
 
 
 def service_shutdown():
@@ -0,0 +1,200 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+
+from daeploy._service import db
+from daeploy.utilities import get_db_clean_interval_seconds
+
+logger = logging.getLogger(__name__)
+
+# Workers are forked, so that they inherit the service with all its entrypoints
+# instead of importing it again
+CONTEXT = multiprocessing.get_context("fork")
+
+
+class _ParameterBroadcast:
+    """Propagates parameter updates from the worker process where they are made
+    to all the other worker processes, through the parent process. The versions
+    of the updates are given out by a counter shared by all workers."""
+
+    def __init__(self, workers: int, version: int = 0):
+        """
+        Args:
+            workers (int): Number of worker processes.
+            version (int): Latest version of the parameters. Defaults to 0.
+        """
+        self._inbox = CONTEXT.Queue()
+        self._outboxes = [CONTEXT.Queue() for _ in range(workers)]
+        self._version = CONTEXT.Value("q", version)
+        # Index of the worker that this process is, None in the parent
+        self.worker: Optional[int] = None
+
+    def next_version(self) -> int:
+        """Version for a new update, unique across all workers
+
+        Returns:
+            int: The version
+        """
+        with self._version.get_lock():
+            self._version.value += 1
+            return self._version.value
+
+    def publish(self, values: Dict[str, Any], version: int):
+        """Send an update, made in this worker, to the other workers
+
+        Args:
+            values (Dict[str, Any]): The new values, by parameter name
+            version (int): Version of the update
+        """
+        if self.worker is not None:
+            self._inbox.put((self.worker, values, version))
+
+    def relay(self, apply: Callable[[Dict[str, Any], int], None]):
+        """Forward updates to all workers but the sender, until stopped. Runs
+        in the parent process, which applies the updates as well, so that
+        workers that are restarted are forked with the latest values.
+
+        Args:
+            apply (Callable[[Dict[str, Any], int], None]): Sets parameters in
+                the parent process.
+        """
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                break
+            sender, values, version = item
+            try:
+                apply(values, version)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Could not apply update {version} of parameters")
+            for worker, outbox in enumerate(self._outboxes):
+                if worker != sender:
+                    outbox.put((values, version))
+
+    def listen(self, apply: Callable[[Dict[str, Any], int], None]):
+        """Apply updates from other workers, forever. Runs in a worker process.
+
+        Args:
+            apply (Callable[[Dict[str, Any], int], None]): Sets parameters in
+                this worker.
+        """
+        outbox = self._outboxes[self.worker]
+        while True:
+            values, version = outbox.get()
+            try:
+                apply(values, version)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Could not apply update {version} of parameters")
+
+    def stop(self):
+        """Stop relaying updates"""
+        self._inbox.put(None)
+
+
+class _WorkerPool:
+    """Serves an app from several forked processes that share one socket.
+
+    The parent process owns the monitoring database, writes the values of all
+    workers and cleans it, relays parameter updates between the workers and
+    restarts workers that exit unexpectedly.
+    """
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        broadcast: _ParameterBroadcast,
+        apply_parameters: Callable[[Dict[str, Any], int], None],
+    ):
+        """
+        Args:
+            config (uvicorn.Config): Server configuration of each worker.
+            workers (int): Number of worker processes.
+            broadcast (_ParameterBroadcast): Parameter updates between workers.
+            apply_parameters (Callable[[Dict[str, Any], int], None]): Sets
+                parameters in a worker, without publishing them again.
+        """
+        self.config = config
+        self.workers = workers
+        self.broadcast = broadcast
+        self.apply_parameters = apply_parameters
+        self.processes: List[multiprocessing.Process] = []
+        self._stopping = threading.Event()
+
+    def _serve(self, worker: int, sock: socket.socket):
+        """Entry point of a worker process"""
+        db.as_worker()
+        self.broadcast.worker = worker
+        threading.Thread(
+            target=self.broadcast.listen, args=(self.apply_parameters,), daemon=True
+        ).start()
+        uvicorn.Server(self.config).run(sockets=[sock])
+
+    def _start(self, worker: int, sock: socket.socket) -> multiprocessing.Process:
+        process = CONTEXT.Process(
+            target=self._serve, args=(worker, sock), name=f"worker-{worker}"
+        )
+        process.start()
+        logger.info(f"Started worker {worker} with pid {process.pid}")
+        return process
+
+    def _stop(self, *_):
+        self._stopping.set()
+
+    def _clean(self, interval: float):
+        """Clean the monitoring database every interval seconds, until the
+        service is stopped"""
+        while not self._stopping.wait(interval):
+            try:
+                db.clean_database()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Could not clean the database")
+
+    def run(self):
+        """Start the workers and supervise them until the service is stopped"""
+        self.config.load()
+        sock = self.config.bind_socket()
+        # Values from all workers are written by this process
+        db.initialize_db(CONTEXT)
+        relay = threading.Thread(
+            target=self.broadcast.relay, args=(self.apply_parameters,), daemon=True
+        )
+        relay.start()
+        threading.Thread(
+            target=self._clean, args=(get_db_clean_interval_seconds(),), daemon=True
+        ).start()
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        self.processes = [self._start(worker, sock) for worker in range(self.workers)]
+        try:
+            while not self._stopping.wait(0.5):
+                for worker, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        logger.warning(
+                            f"Worker {worker} exited with code {process.exitcode},"
+                            " restarting it"
+                        )
+                        self.processes[worker] = self._start(worker, sock)
+        finally:
+            self._shutdown(sock)
+
+    def _shutdown(self, sock: socket.socket):
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + 30
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+        self.broadcast.stop()
+        sock.close()
+        db.remove_db()
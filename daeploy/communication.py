@@ -6,6 +6,7 @@ import warnings
 
 import requests
 
+from daeploy import _encoding
 from daeploy.utilities import (
     get_daeploy_manager_url,
     get_service_name,
@@ -165,6 +166,7 @@ def call_service(
     arguments: dict = None,
     service_version: str = None,
     entrypoint_method: str = "POST",
+    encoding: str = "json",
     **request_kwargs,
 ) -> Any:
     """Call an entrypoint in a different service.
@@ -190,10 +192,18 @@ def call_service(
         entrypoint_method (str): HTTP method of the entrypoint to call. You only need
             to change this if you have created an entrypoint with a non-default HTTP
             method. Defaults to "POST".
+        encoding (str): Encoding of the request and, if the entrypoint supports
+            it, the response. One of "json", "msgpack", "npy" and "arrow". "npy"
+            and "arrow" can only be used with a single argument, which should be a
+            numpy array or a pandas DataFrame respectively. Binary encodings are
+            only supported by entrypoints that use the array and dataframe types
+            of :mod:`daeploy.data_types`. Defaults to "json".
         **request_kwargs: Keyword arguments to pass on to :func:``requests.post``.
 
     Raises:
-        ValueError: If entrypoint_method is not a valid HTTP method
+        ValueError: If entrypoint_method is not a valid HTTP method, if the
+            encoding is not supported or if more than one argument is given
+            for the "npy" or "arrow" encodings.
 
     Returns:
         Any: The output from the entrypoint in the other service.
@@ -213,6 +223,12 @@ def call_service(
             f" Possible options: {HTTP_METHODS}"
         )
 
+    if encoding not in _encoding.MEDIA_TYPES:
+        raise ValueError(
+            f"Invalid encoding: {encoding}."
+            f" Possible options: {list(_encoding.MEDIA_TYPES)}"
+        )
+
     arguments = arguments if arguments else {}
 
     logger_msg = f"Calling entrypoint: {entrypoint_name} in service: {service_name}"
@@ -223,15 +239,37 @@ def call_service(
     logger.debug(f"Arguments: {arguments}")
     logger.info(f"Sending {entrypoint_method} request to: {url}")
 
+    if encoding == "json":
+        body_kwargs = {"headers": get_headers(), "json": arguments}
+    else:
+        media = _encoding.MEDIA_TYPES[encoding]
+        headers = get_headers()
+        headers["Content-Type"] = media
+        headers["Accept"] = f"{media}, {_encoding.JSON};q=0.5"
+        if media == _encoding.MSGPACK:
+            payload = arguments
+        elif len(arguments) == 1:
+            payload = next(iter(arguments.values()))
+        else:
+            raise ValueError(f"The {encoding} encoding requires exactly one argument")
+        body_kwargs = {"headers": headers, "data": _encoding.encode(payload, media)}
+
     response = request(
         entrypoint_method,
         url=url,
         auth_domains=get_authorized_domains(),
-        headers=get_headers(),
-        json=arguments,
+        **body_kwargs,
         **request_kwargs,
     )
 
+    media = _encoding.media_type(response.headers.get("content-type"))
+    if media in _encoding.BINARY_MEDIA_TYPES:
+        logger.info(
+            f"Response from entrypoint: {len(response.content)} bytes of {media},"
+            f" code: {response.status_code}"
+        )
+        return _encoding.decode(response.content, media)
+
     logger.info(
         f"Response from entrypoint: {response.text}, code: {response.status_code}"
     )
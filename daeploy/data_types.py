@@ -22,6 +22,9 @@ class ArrayInput(np.ndarray):
 
     @classmethod
     def validate(cls, value: List) -> np.ndarray:
+        # Binary request bodies are already decoded to ndarrays
+        if isinstance(value, np.ndarray):
+            return value
         # Transform input to ndarray
         return np.array(value)
 
@@ -60,6 +63,9 @@ class DataFrameInput(pd.DataFrame):
 
     @classmethod
     def validate(cls, value: Dict[str, Any]) -> pd.DataFrame:
+        # Binary request bodies are already decoded to DataFrames
+        if isinstance(value, pd.DataFrame):
+            return value
         # Transform input to DataFrame
         return pd.DataFrame.from_dict(value)
 
@@ -1,7 +1,8 @@
+import asyncio
 import logging
 import os
 import re
-from typing import List, Tuple
+from typing import Awaitable, List, Optional, Set, Tuple
 from datetime import timedelta
 
 LOGGER = logging.getLogger(__name__)
@@ -9,6 +10,13 @@ LOGGER = logging.getLogger(__name__)
 UNKNOWN_NAME = "unknown"
 UNKNOWN_VERSION = "0.0.0"
 HTTP_METHODS = ["GET", "POST", "PUT", "DELETE", "HEAD", "OPTIONS", "TRACE", "PATCH"]
+EVENT_LOOPS = ["auto", "asyncio", "uvloop"]
+HTTP_PARSERS = ["auto", "h11", "httptools"]
+DB_QUEUE_POLICIES = ["block", "drop_oldest", "drop_newest", "sample"]
+# Default days to keep the rollups of each resolution
+DB_ROLLUP_LIMIT_DAYS = {"1m": 365, "1h": 5 * 365, "1d": 10 * 365}
+
+_RUNNING_TASKS: Set[asyncio.Task] = set()
 
 
 def get_daeploy_manager_url() -> str:
@@ -170,3 +178,237 @@ def get_db_clean_interval_seconds() -> float:
         interval, unit = default_interval, default_unit
 
     return timedelta(**{unit: interval}).total_seconds()
+
+
+def get_db_rollup_limit_seconds(resolution: str) -> float:
+    """How long to keep the rollups of a resolution in the service database,
+    in seconds. Reads from the environment variables
+    DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_1M, DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_1H and
+    DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_1D, which are independent of
+    DAEPLOY_SERVICE_DB_TABLE_LIMIT.
+
+    Args:
+        resolution (str): One of "1m", "1h" and "1d".
+
+    Returns:
+        float: Seconds to keep rollups. Defaults to 365 days for "1m", 5 years
+        for "1h" and 10 years for "1d".
+    """
+    default_limit = DB_ROLLUP_LIMIT_DAYS[resolution]
+    default_unit = "days"
+    env_var = f"DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_{resolution.upper()}"
+
+    rollup_limit = os.environ.get(env_var, f"{default_limit}{default_unit}")
+    try:
+        limit, unit = match_limit_and_unit(
+            rollup_limit, ["days", "hours", "minutes", "seconds"]
+        )
+    except ValueError as exc:
+        msg = str(exc).format(
+            env_var=env_var, default_limit=default_limit, default_unit=default_unit
+        )
+        LOGGER.error(msg)
+        limit, unit = default_limit, default_unit
+
+    return timedelta(**{unit: limit}).total_seconds()
+
+
+def _positive_int_from_env(env_var: str, default: int) -> int:
+    """Read a positive integer from an environment variable, falling back to
+    the default if it is not set or invalid."""
+    value = os.environ.get(env_var, str(default))
+    try:
+        value = int(value)
+        if value < 1:
+            raise ValueError
+    except ValueError:
+        LOGGER.error(
+            f"Invalid format of environment variable {env_var}."
+            f" It should be a positive integer. Using standard value {default}."
+        )
+        value = default
+    return value
+
+
+def get_thread_pool_size() -> int:
+    """Number of threads available for running synchronous entrypoints
+    concurrently. Reads from the environment variable
+    DAEPLOY_SERVICE_THREAD_POOL_SIZE.
+
+    Returns:
+        int: Size of the thread pool. Defaults to 40
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_THREAD_POOL_SIZE", 40)
+
+
+def get_service_workers() -> int:
+    """Number of worker processes that serve requests. Reads from the
+    environment variable DAEPLOY_SERVICE_WORKERS.
+
+    Returns:
+        int: Number of worker processes. Defaults to 1
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_WORKERS", 1)
+
+
+def _choice_from_env(env_var: str, choices: List[str], default: str) -> str:
+    """Read one of a fixed set of options from an environment variable,
+    falling back to the default if it is not set or invalid."""
+    value = os.environ.get(env_var, default)
+    if value not in choices:
+        LOGGER.error(
+            f"Invalid value of environment variable {env_var}."
+            f" Possible options: {choices}. Using standard value {default}."
+        )
+        value = default
+    return value
+
+
+def get_service_uds() -> Optional[str]:
+    """Path of the Unix domain socket that the service listens on instead of
+    TCP. Reads from the environment variable DAEPLOY_SERVICE_UDS.
+
+    Returns:
+        Optional[str]: Path of the socket. Defaults to None, which means TCP.
+    """
+    return os.environ.get("DAEPLOY_SERVICE_UDS") or None
+
+
+def get_service_loop() -> str:
+    """Event loop implementation of the server. Reads from the environment
+    variable DAEPLOY_SERVICE_LOOP.
+
+    Returns:
+        str: "auto", "asyncio" or "uvloop". Defaults to "auto", which uses
+        uvloop if it is installed.
+    """
+    return _choice_from_env("DAEPLOY_SERVICE_LOOP", EVENT_LOOPS, "auto")
+
+
+def get_service_http() -> str:
+    """HTTP parser implementation of the server. Reads from the environment
+    variable DAEPLOY_SERVICE_HTTP.
+
+    Returns:
+        str: "auto", "h11" or "httptools". Defaults to "auto", which uses
+        httptools if it is installed.
+    """
+    return _choice_from_env("DAEPLOY_SERVICE_HTTP", HTTP_PARSERS, "auto")
+
+
+def get_service_backlog() -> int:
+    """Largest number of connections waiting to be accepted by the server.
+    Reads from the environment variable DAEPLOY_SERVICE_BACKLOG.
+
+    Returns:
+        int: Size of the backlog. Defaults to 2048
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_BACKLOG", 2048)
+
+
+def get_service_keep_alive() -> int:
+    """Seconds that the server keeps idle connections open. Reads from the
+    environment variable DAEPLOY_SERVICE_KEEP_ALIVE.
+
+    Returns:
+        int: Keep-alive timeout in seconds. Defaults to 5
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_KEEP_ALIVE", 5)
+
+
+def get_service_limit_concurrency() -> Optional[int]:
+    """Largest number of concurrent connections and tasks of the server, beyond
+    which requests are answered with status 503. Reads from the environment
+    variable DAEPLOY_SERVICE_LIMIT_CONCURRENCY.
+
+    Returns:
+        Optional[int]: The limit. Defaults to None, which means no limit.
+    """
+    if not os.environ.get("DAEPLOY_SERVICE_LIMIT_CONCURRENCY"):
+        return None
+    return _positive_int_from_env("DAEPLOY_SERVICE_LIMIT_CONCURRENCY", None)
+
+
+def get_db_batch_size() -> int:
+    """Largest number of values that the database writer writes in one
+    transaction. Reads from the environment variable
+    DAEPLOY_SERVICE_DB_BATCH_SIZE.
+
+    Returns:
+        int: Values per transaction. Defaults to 1000
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_DB_BATCH_SIZE", 1000)
+
+
+def get_db_batch_wait_seconds() -> float:
+    """Longest time that the database writer waits for more values before it
+    writes a batch. Reads from the environment variable
+    DAEPLOY_SERVICE_DB_BATCH_WAIT_MS, in milliseconds.
+
+    Returns:
+        float: Seconds to wait. Defaults to 0.01
+    """
+    env_var = "DAEPLOY_SERVICE_DB_BATCH_WAIT_MS"
+    default = 10
+    value = os.environ.get(env_var, str(default))
+    try:
+        value = float(value)
+        if value < 0:
+            raise ValueError
+    except ValueError:
+        LOGGER.error(
+            f"Invalid format of environment variable {env_var}."
+            f" It should be a non-negative number. Using standard value {default}."
+        )
+        value = default
+    return value / 1000
+
+
+def get_db_queue_size() -> int:
+    """Largest number of values waiting to be written to the monitoring
+    database. Reads from the environment variable
+    DAEPLOY_SERVICE_DB_QUEUE_SIZE.
+
+    Returns:
+        int: Size of the queue. Defaults to 100000
+    """
+    return _positive_int_from_env("DAEPLOY_SERVICE_DB_QUEUE_SIZE", 100000)
+
+
+def get_db_queue_policy() -> str:
+    """What happens to values that are stored when the queue to the monitoring
+    database is full. Reads from the environment variable
+    DAEPLOY_SERVICE_DB_QUEUE_POLICY.
+
+    Returns:
+        str: "block", "drop_oldest", "drop_newest" or "sample". Defaults to
+        "drop_oldest".
+    """
+    return _choice_from_env(
+        "DAEPLOY_SERVICE_DB_QUEUE_POLICY", DB_QUEUE_POLICIES, "drop_oldest"
+    )
+
+
+def spawn_task(
+    coroutine: Awaitable, tasks: Optional[Set[asyncio.Task]] = None
+) -> asyncio.Task:
+    """Run a coroutine in the background on the running event loop and keep a
+    reference to it until it is done. The event loop only keeps weak
+    references to its tasks, so a task that nobody else refers to can be
+    garbage collected before it finishes.
+
+    Args:
+        coroutine (Awaitable): The coroutine to run.
+        tasks (Optional[Set[asyncio.Task]]): Set that holds the task while it
+            runs, for callers that need to find their running tasks. Defaults
+            to None, which uses a module-wide set.
+
+    Returns:
+        asyncio.Task: The running task
+    """
+    if tasks is None:
+        tasks = _RUNNING_TASKS
+    task = asyncio.ensure_future(coroutine)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
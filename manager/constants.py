@@ -82,6 +82,12 @@ def letsencrypt_staging_server():
     )
 
 
+def get_service_ready_timeout():
+    """Seconds to wait for a new service version to report ready on /~ready
+    before traffic is routed to it. 0 disables the wait."""
+    return float(os.environ.get("DAEPLOY_SERVICE_READY_TIMEOUT", 60))
+
+
 def get_internal_manager_url():
     return "http://localhost:8000"
 
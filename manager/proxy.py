@@ -1,10 +1,12 @@
 import time
+import asyncio
 import logging
 import shutil
 import subprocess
 from typing import List, Union
 from pathlib import Path
 
+import requests
 import toml
 
 from manager.routers.notification_api import (
@@ -22,6 +24,7 @@ from manager.constants import (
     get_proxy_http_port,
     get_proxy_https_port,
     get_internal_manager_url,
+    get_service_ready_timeout,
     auth_enabled,
     https_proxy,
     configuration_email,
@@ -440,6 +443,43 @@ def create_new_service_configuration(name: str, version: str, address: str):
     add_dynamic_configuration(file_name, config)
 
 
+async def wait_for_service_ready(address: str, timeout: float = None) -> bool:
+    """Wait until a service reports that it is ready to receive traffic on
+    its /~ready endpoint, e.g. when its warm-up hooks have finished.
+
+    Services without a /~ready endpoint, from older SDK versions or images
+    that do not use the SDK, are considered ready as soon as they respond.
+    The wait runs on the event loop, so that it holds up neither the request
+    that started it nor a thread of the manager.
+
+    Args:
+        address (str): URL to the service
+        timeout (float, optional): Seconds to wait at most. Defaults to None,
+            in which case DAEPLOY_SERVICE_READY_TIMEOUT is used.
+
+    Returns:
+        bool: True if the service is ready, False if the wait timed out.
+    """
+    timeout = get_service_ready_timeout() if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    url = f"{address.rstrip('/')}/~ready"
+    while True:
+        try:
+            response = await asyncio.to_thread(requests.get, url, timeout=5)
+            if response.status_code in (200, 404):
+                return True
+        except requests.exceptions.RequestException:
+            # Not accepting connections yet
+            pass
+        if time.monotonic() >= deadline:
+            LOGGER.warning(
+                f"Service at {address} was not ready within {timeout} seconds,"
+                " routing traffic to it anyway"
+            )
+            return False
+        await asyncio.sleep(0.5)
+
+
 def create_mirror_configuration(
     name: str, main_version: str, shadow_versions: List[str] = None
 ):
@@ -9,7 +9,15 @@ from urllib.parse import quote
 from pydantic import ValidationError, Json
 
 from cookiecutter.main import cookiecutter
-from fastapi import APIRouter, HTTPException, File, Request, UploadFile, Form
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    HTTPException,
+    File,
+    Request,
+    UploadFile,
+    Form,
+)
 from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from docker.errors import ImageNotFound, ImageLoadError
@@ -82,7 +90,9 @@ def read_services():
 
 
 @ROUTER.post("/~git", status_code=202)
-def new_service_from_git_repo(service_request: ServiceGitRequest):
+def new_service_from_git_repo(
+    service_request: ServiceGitRequest, background_tasks: BackgroundTasks
+):
     """
     Create a new service from a git repository.
 
@@ -92,7 +102,7 @@ def new_service_from_git_repo(service_request: ServiceGitRequest):
     """
     check_service_exists(service_request.name, service_request.version)
     image = build_service_image_s2i(str(service_request.git_url), service_request)
-    start_service_from_image(image, service_request)
+    start_service_from_image(image, service_request, background_tasks)
 
     return "Accepted"
 
@@ -100,6 +110,7 @@ def new_service_from_git_repo(service_request: ServiceGitRequest):
 # pylint: disable=too-many-locals
 @ROUTER.post("/~tar", status_code=202)
 def new_service_from_tar_file(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     version: str = Form(...),
     port: int = Form(DAEPLOY_DEFAULT_INTERNAL_PORT),
@@ -149,7 +160,7 @@ def new_service_from_tar_file(
 
         # Build and deploy the service image
         image = build_service_image_s2i(tmpdirname, service_request)
-        start_service_from_image(image, service_request)
+        start_service_from_image(image, service_request, background_tasks)
 
     return "Accepted"
 
@@ -157,6 +168,7 @@ def new_service_from_tar_file(
 # pylint: disable=too-many-locals
 @ROUTER.post("/~pickle", status_code=202)
 def new_service_from_pickle(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     version: str = Form(...),
     port: int = Form(DAEPLOY_DEFAULT_INTERNAL_PORT),
@@ -219,7 +231,7 @@ def new_service_from_pickle(
 
         # Build and deploy the service image
         image = build_service_image_s2i(project_dir, service_request)
-        start_service_from_image(image, service_request)
+        start_service_from_image(image, service_request, background_tasks)
 
     return "Accepted"
 
@@ -248,7 +260,9 @@ def new_service_from_local_image(
 
 
 @ROUTER.post("/~image", status_code=202)
-def new_service_from_image(service_request: ServiceImageRequest):
+def new_service_from_image(
+    service_request: ServiceImageRequest, background_tasks: BackgroundTasks
+):
     """
     Create a new service from a image.
 
@@ -257,7 +271,7 @@ def new_service_from_image(service_request: ServiceImageRequest):
 
     """
     check_service_exists(service_request.name, service_request.version)
-    start_service_from_image(service_request.image, service_request)
+    start_service_from_image(service_request.image, service_request, background_tasks)
 
     return "Accepted"
 
@@ -313,19 +327,21 @@ def kill_service(service: BaseService, remove_image: bool = True):
 
 @ROUTER.put("/~assign")
 @check_service_exists_json_body
-def assign_main_service(service: BaseService):
+def assign_main_service(service: BaseService, background_tasks: BackgroundTasks):
 
     try:
         service_db.assign_main_version(service.name, service.version)
     except DatabaseNoMatchException as exc:
         raise HTTPException(status_code=404, detail=f"{str(exc)}")
 
-    # Write a new mirror configuration file
-    main_version, shadow_versions = service_db.get_main_and_shadow_versions(
-        service.name
-    )
+    main_version, _ = service_db.get_main_and_shadow_versions(service.name)
     if main_version:
-        proxy.create_mirror_configuration(service.name, main_version, shadow_versions)
+        # Only switch the traffic once the new main version is warmed up
+        with session_scope() as session:
+            url = service_db.get_service_record(session, service.name, main_version).url
+        background_tasks.add_task(
+            route_to_main_version_when_ready, service.name, main_version, url
+        )
     return "OK"
 
 
@@ -480,7 +496,11 @@ def build_service_image_s2i(
     return image
 
 
-def start_service_from_image(image: str, service_request: BaseNewServiceRequest):
+def start_service_from_image(
+    image: str,
+    service_request: BaseNewServiceRequest,
+    background_tasks: BackgroundTasks,
+):
     token = new_api_token()
     try:
         url = RTE_CONN.create_service(
@@ -504,12 +524,22 @@ def start_service_from_image(image: str, service_request: BaseNewServiceRequest)
         )
 
     new_service_configuration(
-        service_request.name, service_request.version, image, url, token
+        service_request.name,
+        service_request.version,
+        image,
+        url,
+        token,
+        background_tasks,
     )
 
 
 def new_service_configuration(
-    name: str, version: str, image: str, url: str, token: dict
+    name: str,
+    version: str,
+    image: str,
+    url: str,
+    token: dict,
+    background_tasks: BackgroundTasks,
 ):
     """Creates service configuration files for a new service
 
@@ -519,6 +549,8 @@ def new_service_configuration(
         image (str): Image of the new service
         url (str): URL of the new service
         token (dict): Token of the new service
+        background_tasks (BackgroundTasks): Tasks of the request, which route
+            the traffic of the service to a new main version once it is ready
     """
 
     try:
@@ -534,6 +566,29 @@ def new_service_configuration(
         LOGGER.info(f"Service was not added to database because: {str(exc)}")
     main_version, shadow_versions = service_db.get_main_and_shadow_versions(name)
 
-    # Configure proxy for service and mirroring
+    # Configure proxy for service and mirroring. The versioned route is
+    # available right away, but the main route of the service is only
+    # pointed at a new main version once it is ready.
     proxy.create_new_service_configuration(name=name, version=version, address=url)
+    if version == main_version:
+        background_tasks.add_task(route_to_main_version_when_ready, name, version, url)
+    else:
+        proxy.create_mirror_configuration(name, main_version, shadow_versions)
+
+
+async def route_to_main_version_when_ready(name: str, version: str, url: str):
+    """Point the main route of a service at a main version once it is ready,
+    after the response to the request that deployed or assigned it
+
+    Args:
+        name (str): Name of the service
+        version (str): Version that became the main version
+        url (str): URL of the version
+    """
+    await proxy.wait_for_service_ready(url)
+    main_version, shadow_versions = service_db.get_main_and_shadow_versions(name)
+    if main_version != version:
+        # Another version was assigned while this one was warming up
+        LOGGER.info(f"Main version of {name} is no longer {version}, not routing")
+        return
     proxy.create_mirror_configuration(name, main_version, shadow_versions)
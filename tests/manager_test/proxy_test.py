@@ -1,7 +1,7 @@
 import os
 import time
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 import requests
 
 import docker
@@ -229,3 +229,35 @@ def test_https_static_config(tmp_path, pinned):
     finally:
         killer()
         os.environ["DAEPLOY_PROXY_HTTPS"] = "false"
+
+
+@pytest.mark.asyncio
+async def test_wait_for_service_ready(monkeypatch):
+    warming_up = MagicMock(status_code=503)
+    ready = MagicMock(status_code=200)
+    get = MagicMock(
+        side_effect=[requests.exceptions.ConnectionError(), warming_up, ready]
+    )
+    monkeypatch.setattr(pr.requests, "get", get)
+    monkeypatch.setattr(pr.asyncio, "sleep", AsyncMock())
+
+    assert await pr.wait_for_service_ready("http://service:8000/", timeout=10)
+    assert get.call_count == 3
+    assert get.call_args.args == ("http://service:8000/~ready",)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_service_ready_without_endpoint(monkeypatch):
+    # Services from older SDK versions have no /~ready endpoint
+    get = MagicMock(return_value=MagicMock(status_code=404))
+    monkeypatch.setattr(pr.requests, "get", get)
+    assert await pr.wait_for_service_ready("http://service:8000", timeout=10)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_service_ready_timeout(monkeypatch):
+    get = MagicMock(return_value=MagicMock(status_code=503))
+    monkeypatch.setattr(pr.requests, "get", get)
+    monkeypatch.setattr(pr.asyncio, "sleep", AsyncMock())
+    assert not await pr.wait_for_service_ready("http://service:8000", timeout=0)
+    get.assert_called_once()
@@ -1,23 +1,43 @@
 import asyncio
+import base64
 import datetime
 import json
 import logging
 import os
+import queue
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, Mock, patch
 
+import anyio.to_thread
+import httpx
 import numpy as np
 import pandas as pd
 import pydantic
 import pytest
+import sqlalchemy
 import logging
 from fastapi.exceptions import FastAPIError
 from fastapi.testclient import TestClient
-from daeploy._service import db
+from daeploy import _encoding, utilities
+from daeploy._service import db, executor, profiler, scheduler
+from daeploy._service.executor import _ProcessPool
+from daeploy._service.serialization import FastJSONResponse
 from daeploy._service.service import _Service
 from daeploy.communication import Severity, call_service, notify
 from daeploy.data_types import ArrayInput, ArrayOutput, DataFrameInput, DataFrameOutput
-from daeploy.utilities import get_db_table_limit
+from daeploy._service.workers import _ParameterBroadcast, _WorkerPool
+from daeploy.utilities import (
+    get_db_queue_policy,
+    get_db_table_limit,
+    get_service_limit_concurrency,
+    get_service_loop,
+    get_service_workers,
+    get_thread_pool_size,
+    spawn_task,
+)
 
 
 @pytest.fixture
@@ -322,6 +342,82 @@ def test_set_list():
     service.set_parameter("myparameter", [3, 2, 1])
 
 
+def test_update_parameters_bulk():
+    service = _Service()
+    service.add_parameter("a", 1)
+    service.add_parameter("b", "x")
+    service.add_parameter("internal", 1, expose=False)
+    client = TestClient(service.app)
+    version = int(client.get("/~parameters").headers["X-Parameters-Version"])
+
+    response = client.post("/~parameters", json={"a": 2, "b": "y"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "version": version + 1,
+        "parameters": {"a": 2.0, "b": "y"},
+    }
+    response = client.get("/~parameters")
+    assert response.json() == {"a": 2.0, "b": "y", "internal": 1.0}
+    assert response.headers["X-Parameters-Version"] == str(version + 1)
+
+    # Either all or none of the parameters are updated
+    for update, status in [
+        ({"a": 3, "b": [1]}, 422),
+        ({"a": 3, "c": 1}, 404),
+        ({"a": 3, "internal": 2}, 403),
+    ]:
+        response = client.post("/~parameters", json=update)
+        assert response.status_code == status
+    response = client.get("/~parameters")
+    assert response.json() == {"a": 2.0, "b": "y", "internal": 1.0}
+    assert response.headers["X-Parameters-Version"] == str(version + 1)
+
+    # An empty update changes nothing and keeps the version
+    response = client.post("/~parameters", json={})
+    assert response.json() == {"version": version + 1, "parameters": {}}
+    assert service._parameter_store.version == version + 1
+
+    # The setter of the parameter dictionary still works
+    assert service.parameters["a"]["setter"](5) == 5.0
+    assert service.get_parameter("a") == 5.0
+
+    with pytest.raises(ValueError, match="reserved"):
+        service.add_parameter("watch", 1)
+
+
+def test_watch_parameters():
+    service = _Service()
+    service.add_parameter("a", 1)
+    service.add_parameter("b", 1)
+
+    with TestClient(service.app) as client:
+        # Everything since the start, right away
+        response = client.get("/~parameters/watch", params={"since": 0})
+        assert response.json() == {"version": 2, "parameters": {"a": 1.0, "b": 1.0}}
+
+        # Nothing changed before the timeout
+        start = time.monotonic()
+        response = client.get("/~parameters/watch?since=2&timeout=0.2")
+        assert time.monotonic() - start >= 0.2
+        assert response.json() == {"version": 2, "parameters": {}}
+
+        # Woken up by an update
+        with ThreadPoolExecutor(1) as pool:
+            watch = pool.submit(client.get, "/~parameters/watch?since=2&timeout=10")
+            time.sleep(0.2)
+            assert not watch.done()
+            service.set_parameter("b", 5)
+            response = watch.result(5)
+        assert response.json() == {"version": 3, "parameters": {"b": 5.0}}
+
+        # A version from before a restart gets all parameters
+        response = client.get("/~parameters/watch", params={"since": 10})
+        assert response.json() == {"version": 3, "parameters": {"a": 1.0, "b": 5.0}}
+
+        response = client.get("/~parameters/watch?timeout=1000")
+        assert response.status_code == 422
+
+
 @patch("daeploy.communication.request")
 def test_notify(request):
     datetime_mock = Mock(wraps=datetime.datetime)
@@ -561,10 +657,42 @@ def test_entrypoint_monitored(database):
     )
     assert response.status_code == 200
     await_database_queue()
-    assert db.stored_variables() == [
-        "valid_entrypoint_method_args_request",
-        "valid_entrypoint_method_args_response",
-    ]
+    assert db.stored_variables() == ["valid_entrypoint_method_args_calls"]
+
+    records = db.read_from_ts("valid_entrypoint_method_args_calls")
+    assert len(records) == 1
+    assert json.loads(records[0].request) == req
+    assert records[0].response == response.text
+    assert records[0].status == 200
+    assert records[0].latency > 0
+
+
+def test_entrypoint_monitored_error(database):
+    service = _Service()
+    service.entrypoint(monitor=True)(valid_entrypoint_method_args)
+    client = TestClient(service.app)
+
+    response = client.post("/valid_entrypoint_method_args", json={"name": "Rune"})
+    assert response.status_code == 422
+    await_database_queue()
+
+    records = db.read_from_ts("valid_entrypoint_method_args_calls")
+    assert records[0].status == 422
+    assert json.loads(records[0].request) == {"name": "Rune"}
+
+
+def test_entrypoint_monitored_json_api(database):
+    service = _Service()
+    service.entrypoint(monitor=True)(valid_entrypoint_method_args)
+    client = TestClient(service.app)
+
+    client.post("/valid_entrypoint_method_args", json={"name": "Rune", "age": 100})
+    await_database_queue()
+
+    data = client.get("/~monitor").json()["valid_entrypoint_method_args_calls"]
+    assert set(data) == {"timestamp", "request", "response", "latency", "status"}
+    assert data["response"] == ['"hello"']
+    assert data["status"] == [200]
 
 
 def test_entrypoint_not_monitored():
@@ -649,16 +777,17 @@ def test_call_every_decorator():
     assert mock1 == service.call_every(seconds=0.1, wait_first=False)(mock1)
     assert mock2 == service.call_every(seconds=0.1, wait_first=True)(mock2)
 
-    # Use asyncio.sleep to let the tasks run appropriately in a test env
+    # Use asyncio.sleep to let the tasks run appropriately in a test env. The
+    # runs do not drift, so stop half an interval after the run at 1 second.
     with TestClient(service.app) as client:
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(asyncio.sleep(1))
+        loop.run_until_complete(asyncio.sleep(1.05))
 
-    # At 0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9 seconds = 10 calls
-    assert mock1.call_count == 10
+    # At 0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0 seconds = 11 calls
+    assert mock1.call_count == 11
 
-    # At 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9 seconds = 9 calls
-    assert mock2.call_count == 9
+    # At 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0 seconds = 10 calls
+    assert mock2.call_count == 10
 
 
 def test_call_every_decorator_long_execution_time():
@@ -677,6 +806,138 @@ def test_call_every_decorator_long_execution_time():
             loop.run_until_complete(asyncio.sleep(1))
 
 
+def test_call_every_overrun_notifies_off_the_loop(monkeypatch):
+    service = _Service()
+    threads = []
+    monkeypatch.setattr(
+        scheduler, "notify", lambda *args: threads.append(threading.get_ident())
+    )
+
+    @service.call_every(seconds=0.05)
+    async def long_running_func():
+        await asyncio.sleep(0.1)
+
+    with pytest.warns(UserWarning):
+        with TestClient(service.app) as client:
+            loop_thread = client.portal.call(threading.get_ident)
+            time.sleep(0.3)
+            stats = client.get("/~monitor/tasks").json()["long_running_func"]
+
+    assert threads and loop_thread not in threads
+    assert stats["overruns"] >= 1
+    assert stats["skipped"] >= 1
+
+
+@pytest.mark.parametrize(
+    "overlap, expected_starts",
+    [("skip", 2), ("queue", 5), ("concurrent", 5)],
+)
+def test_call_every_overlap(overlap, expected_starts):
+    service = _Service()
+    starts = []
+    running = []
+
+    @service.call_every(seconds=0.1, overlap=overlap)
+    async def task():
+        starts.append(time.monotonic())
+        running.append(1)
+        await asyncio.sleep(0.25)
+        running.pop()
+
+    with pytest.warns(UserWarning):
+        with TestClient(service.app) as client:
+            time.sleep(0.45)
+            stats = client.get("/~monitor/tasks").json()["task"]
+
+    if overlap == "skip":
+        assert len(starts) == expected_starts
+        assert stats["skipped"] == 3
+    elif overlap == "queue":
+        # One run at a time, the missed ones are queued
+        assert len(starts) == 2
+        assert stats["queued"] == 1
+    else:
+        assert len(starts) == expected_starts
+        assert stats["running"] >= 2
+
+
+def test_call_every_fixed_delay():
+    service = _Service()
+    starts = []
+
+    @service.call_every(seconds=0.1, mode="fixed_delay")
+    def task():
+        starts.append(time.monotonic())
+        time.sleep(0.05)
+
+    with TestClient(service.app) as client:
+        time.sleep(0.4)
+        stats = client.get("/~monitor/tasks").json()["task"]
+
+    # A run every 0.15 seconds: 0, 0.15 and 0.3
+    assert len(starts) == 3
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.15
+    assert stats["mode"] == "fixed_delay"
+    assert stats["overruns"] == 0
+    assert stats["runs"] >= 2
+
+
+def test_call_every_jitter_does_not_drift():
+    task = scheduler._Task(lambda: None, "task", seconds=1, jitter=0.5)
+    first = task.first_run(100)
+    assert 100 <= first <= 100.5
+    runs = [task.next_run(100 + n) for n in range(1, 10)]
+    assert all(100 + n <= run <= 100.5 + n for n, run in enumerate(runs, 2))
+    # Missed runs are skipped instead of run late
+    assert 115 <= task.next_run(114.2) <= 115.5
+
+
+def test_call_every_cron():
+    cron = scheduler._Cron("*/15 8-17 * * 1-5")
+    # Saturday 2021-01-02
+    saturday = datetime.datetime(2021, 1, 2, 12, 0)
+    assert cron.next_after(saturday) == datetime.datetime(2021, 1, 4, 8, 0)
+    monday = datetime.datetime(2021, 1, 4, 9, 7, 30)
+    assert cron.next_after(monday) == datetime.datetime(2021, 1, 4, 9, 15)
+    evening = datetime.datetime(2021, 1, 4, 17, 45)
+    assert cron.next_after(evening) == datetime.datetime(2021, 1, 5, 8, 0)
+
+    # Day of month and day of week are either-or, like in cron
+    cron = scheduler._Cron("0 0 13 * 5")
+    assert cron.next_after(saturday) == datetime.datetime(2021, 1, 8, 0, 0)
+    assert cron.next_after(datetime.datetime(2021, 1, 12, 1, 0)) == datetime.datetime(
+        2021, 1, 13, 0, 0
+    )
+
+    service = _Service()
+    service.call_every(cron="0 3 * * *")(Mock(__name__="nightly"))
+    with TestClient(service.app) as client:
+        stats = client.get("/~monitor/tasks").json()
+    assert stats["nightly"]["cron"] == "0 3 * * *"
+    assert stats["nightly"]["runs"] == 0
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"seconds": 1, "cron": "* * * * *"},
+        {"seconds": 0},
+        {"seconds": 1, "mode": "sometimes"},
+        {"seconds": 1, "overlap": "always"},
+        {"seconds": 1, "jitter": -1},
+        {"cron": "* * * *"},
+        {"cron": "61 * * * *"},
+        {"cron": "* * * * mon"},
+        {"cron": "* * * * *", "mode": "fixed_delay"},
+    ],
+)
+def test_call_every_invalid_options(kwargs):
+    service = _Service()
+    with pytest.raises(ValueError):
+        service.call_every(**kwargs)
+
+
 def test_database_table_creation(database):
 
     timestamp = datetime.datetime.utcnow()
@@ -735,6 +996,441 @@ def test_edge_case_type_storing(database):
     assert db.read_from_ts("my.normal.float")[-1].value == 10.10
 
 
+def test_database_batched_writes(database):
+    commits = []
+
+    def count_commit(connection):
+        commits.append(connection)
+
+    sqlalchemy.event.listen(db.ENGINE, "commit", count_commit)
+    try:
+        timestamp = datetime.datetime.utcnow()
+        for i in range(500):
+            timestamp += datetime.timedelta(microseconds=1)
+            db.write_to_ts("float", float(i), timestamp)
+            db.write_to_ts("text", str(i), timestamp)
+        # Duplicate timestamps and invalid values are skipped, the rest of the
+        # batch is written
+        db.write_to_ts("float", -1.0, timestamp)
+        db.write_to_ts("invalid", lambda x: x, timestamp)
+        db.write_to_ts("float", 500.0, timestamp + datetime.timedelta(seconds=1))
+        await_database_queue()
+    finally:
+        sqlalchemy.event.remove(db.ENGINE, "commit", count_commit)
+
+    values = [
+        record.value
+        for record in db.read_from_ts(
+            "float", to_time=timestamp + datetime.timedelta(seconds=2)
+        )
+    ]
+    assert len(values) == 501
+    assert values[-2:] == [499.0, 500.0]
+    assert "invalid" not in db.stored_variables()
+    assert len(db.read_from_ts("text")) == 500
+    # Far fewer transactions than values
+    assert len(commits) < 50
+
+
+def test_database_batch_size(monkeypatch):
+    monkeypatch.setattr(db, "QUEUE", queue.Queue())
+    for i in range(5):
+        db.QUEUE.put(("float", float(i), datetime.datetime.utcnow()))
+    db.QUEUE.put(None)
+    assert len(db._next_batch(max_size=3, max_wait=0)) == 3
+    # A batch ends at the signal to stop
+    assert db._next_batch(max_size=10, max_wait=1)[-1] is None
+
+
+@pytest.fixture
+def bounded_queue(monkeypatch):
+    """A full write queue of three values, without a writer"""
+    monkeypatch.setattr(db, "QUEUE", queue.Queue(3))
+    monkeypatch.setattr(db, "QUEUE_SIZE", 3)
+    monkeypatch.setattr(db, "ENQUEUED", db._Counter())
+    monkeypatch.setattr(db, "DROPPED", db._Counter())
+    for i in range(3):
+        db.write_to_ts("float", float(i), datetime.datetime.utcnow())
+    return db.QUEUE
+
+
+@pytest.mark.parametrize(
+    "policy, values",
+    [("drop_oldest", [1.0, 2.0, 3.0]), ("drop_newest", [0.0, 1.0, 2.0])],
+)
+def test_database_queue_drop_policies(monkeypatch, bounded_queue, policy, values):
+    monkeypatch.setattr(db, "QUEUE_POLICY", policy)
+    db.write_to_ts("float", 3.0, datetime.datetime.utcnow())
+    assert [value for _, value, _ in bounded_queue.queue] == values
+    assert db.queue_stats() == {
+        "max_size": 3,
+        "policy": policy,
+        "depth": 3,
+        "enqueued": 3 + (policy == "drop_oldest"),
+        "dropped": 1,
+    }
+
+
+def test_database_queue_keeps_stop_signal(monkeypatch, bounded_queue):
+    monkeypatch.setattr(db, "QUEUE_POLICY", "drop_oldest")
+    bounded_queue.get_nowait()
+    bounded_queue.task_done()
+    bounded_queue.put(None)
+    db.write_to_ts("float", 3.0, datetime.datetime.utcnow())
+    assert None in bounded_queue.queue
+    assert db.queue_stats()["dropped"] == 1
+
+
+def test_database_queue_sample_policy(monkeypatch, bounded_queue):
+    monkeypatch.setattr(db, "QUEUE_POLICY", "sample")
+    for i in range(100):
+        db.write_to_ts("float", float(i), datetime.datetime.utcnow())
+    assert db.queue_stats()["dropped"] == 100
+    # Values are kept, with a lower probability, before the queue is full
+    bounded_queue.get_nowait()
+    for i in range(100):
+        db.write_to_ts("float", float(i), datetime.datetime.utcnow())
+    assert bounded_queue.full()
+    assert db.queue_stats()["enqueued"] == 4
+
+
+def test_database_queue_block_policy(monkeypatch, bounded_queue):
+    monkeypatch.setattr(db, "QUEUE_POLICY", "block")
+    writer = threading.Thread(
+        target=db.write_to_ts, args=("float", 3.0, datetime.datetime.utcnow())
+    )
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+    bounded_queue.get_nowait()
+    writer.join(1)
+    assert not writer.is_alive()
+    assert db.queue_stats()["enqueued"] == 4
+    assert db.queue_stats()["dropped"] == 0
+
+
+def test_database_queue_config(monkeypatch):
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_QUEUE_SIZE", "10")
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_QUEUE_POLICY", "drop_newest")
+    db.initialize_db()
+    try:
+        client = TestClient(_Service().app)
+        db.write_to_ts("float", 1.0, datetime.datetime.utcnow())
+        await_database_queue()
+        assert client.get("/~monitor/queue").json() == {
+            "max_size": 10,
+            "policy": "drop_newest",
+            "depth": 0,
+            "enqueued": 1,
+            "dropped": 0,
+        }
+        metrics = client.get("/~metrics").text
+        assert "daeploy_monitoring_enqueued_total 1" in metrics
+        assert "daeploy_monitoring_dropped_total 0" in metrics
+    finally:
+        db.remove_db()
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_QUEUE_POLICY", "drop_random")
+    assert get_db_queue_policy() == "drop_oldest"
+
+
+def test_database_wal_and_read_only_readers(database):
+    with db.ENGINE.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+    db.write_to_ts("float", 1.0, datetime.datetime.utcnow())
+    await_database_queue()
+    with db.READ_ENGINE.connect() as connection:
+        # Readers see the committed values, but can not write
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM samples").scalar() == 1
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            connection.exec_driver_sql("DELETE FROM samples")
+
+    # Reads do not wait for the writer, which holds the lock while writing
+    with db.LOCK:
+        assert len(db.read_from_ts("float")) == 1
+
+
+def test_database_download(database, tmp_path):
+    service = _Service()
+    timestamp = datetime.datetime.utcnow()
+    for i in range(10):
+        db.write_to_ts("float", float(i), timestamp - datetime.timedelta(seconds=i))
+    await_database_queue()
+
+    client = TestClient(service.app)
+    with db.LOCK:
+        response = client.get("/~monitor/db")
+    assert response.status_code == 200
+    copy = tmp_path / "database.db"
+    copy.write_bytes(response.content)
+    with sqlite3.connect(copy) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM samples").fetchone() == (10,)
+
+
+def test_database_long_format(database):
+    timestamp = datetime.datetime(2024, 1, 1, 12, 0, 0, 123456)
+    db.write_to_ts("mixed", 1.5, timestamp)
+    db.write_to_ts("mixed", "text", timestamp + datetime.timedelta(seconds=1))
+    db.write_call("predict_calls", b"{}", b"1", 0.1, 200, timestamp)
+    await_database_queue()
+
+    # One row per value in the shared tables, with integer nanosecond timestamps
+    with db.READ_ENGINE.connect() as connection:
+        assert set(sqlalchemy.inspect(connection).get_table_names()) == {
+            "variables",
+            "samples",
+            "calls",
+            "rollups",
+        }
+        assert connection.exec_driver_sql(
+            "SELECT ts, value_num, value_text FROM samples ORDER BY ts"
+        ).all() == [
+            (db.to_epoch_ns(timestamp), 1.5, None),
+            (db.to_epoch_ns(timestamp) + 10**9, None, "text"),
+        ]
+    records = db.read_from_ts("mixed", from_time=timestamp)
+    assert [(record.timestamp, record.value) for record in records] == [
+        (timestamp, 1.5),
+        (timestamp + datetime.timedelta(seconds=1), "text"),
+    ]
+    assert db.stored_columns("predict_calls") == [
+        "request",
+        "response",
+        "latency",
+        "status",
+    ]
+
+    # A variable keeps its kind
+    db.write_to_ts("predict_calls", 1.0, timestamp + datetime.timedelta(seconds=1))
+    await_database_queue()
+    assert len(db.read_from_ts("predict_calls", from_time=timestamp)) == 1
+
+
+def test_database_rollups(database, monkeypatch):
+    start = datetime.datetime(2024, 1, 1, 12, 0)
+    for second, value in [(0, 1.0), (30, 5.0), (59, 3.0), (60, 2.0), (119, 4.0)]:
+        db.write_to_ts("float", value, start + datetime.timedelta(seconds=second))
+    db.write_to_ts("float", "not a number", start + datetime.timedelta(seconds=10))
+    await_database_queue()
+    # Values that are written later, and duplicates that are skipped
+    db.write_to_ts("float", 0.0, start + datetime.timedelta(seconds=15))
+    db.write_to_ts("float", 100.0, start)
+    await_database_queue()
+
+    minutes = db.read_rollups("float", "1m")
+    assert [tuple(minute) for minute in minutes] == [
+        (start, 4, 0.0, 5.0, 2.25, 9.0, 3.0),
+        (start + datetime.timedelta(minutes=1), 2, 2.0, 4.0, 3.0, 6.0, 4.0),
+    ]
+    (hour,) = db.read_rollups("float", "1h")
+    assert (hour.timestamp, hour.count, hour.last) == (start, 6, 4.0)
+    # Buckets that overlap the time range are read
+    assert (
+        len(
+            db.read_rollups(
+                "float", "1m", from_time=start + datetime.timedelta(seconds=90)
+            )
+        )
+        == 1
+    )
+
+    # Rollups are kept when old values are cleaned, the values of this test
+    # are older than the default retention of the minute rollups
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_TABLE_LIMIT", "1rows")
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_1M", "36500days")
+    db.clean_database()
+    assert len(db.read_from_ts("float")) == 1
+    assert len(db.read_rollups("float", "1m")) == 2
+
+    with pytest.raises(ValueError):
+        db.read_rollups("float", "5m")
+
+
+def test_database_rollup_retention(database, monkeypatch):
+    now = datetime.datetime.utcnow()
+    db.write_to_ts("float", 1.0, now - datetime.timedelta(days=3))
+    db.write_to_ts("float", 2.0, now)
+    await_database_queue()
+
+    # Rollups outlive the values, until the retention of their resolution
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_TABLE_LIMIT", "1hours")
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_ROLLUP_LIMIT_1M", "1days")
+    db.clean_database()
+    assert len(db.read_from_ts("float")) == 1
+    assert [minute.last for minute in db.read_rollups("float", "1m")] == [2.0]
+    assert [hour.last for hour in db.read_rollups("float", "1h")] == [1.0, 2.0]
+
+
+def test_monitor_resolution(database):
+    service = _Service()
+    service.entrypoint(monitor=True)(valid_entrypoint_method_args)
+    client = TestClient(service.app)
+    client.post("/valid_entrypoint_method_args", json={"name": "Rune", "age": 100})
+    start = datetime.datetime(2024, 1, 1, 12, 0)
+    db.write_to_ts("float", 1.0, start)
+    db.write_to_ts("float", 3.0, start + datetime.timedelta(minutes=90))
+    await_database_queue()
+
+    # Only variables with values have rollups
+    assert client.get("/~monitor", params={"resolution": "1h"}).json() == {
+        "float": {
+            "timestamp": ["2024-01-01 12:00:00", "2024-01-01 13:00:00"],
+            "count": [1, 1],
+            "min": [1.0, 3.0],
+            "max": [1.0, 3.0],
+            "mean": [1.0, 3.0],
+            "sum": [1.0, 3.0],
+            "last": [1.0, 3.0],
+        }
+    }
+    response = client.get("/~monitor", params={"resolution": "1d"})
+    assert response.json()["float"]["count"] == [2]
+    response = client.get(
+        "/~monitor",
+        params={"resolution": "1m", "variables": "valid_entrypoint_method_args_calls"},
+    )
+    assert response.status_code == 412
+    assert client.get("/~monitor", params={"resolution": "5m"}).status_code == 422
+    response = client.get("/~monitor/csv", params={"resolution": "1h"})
+    assert response.status_code == 200
+
+
+def test_database_aggregate(database, monkeypatch):
+    start = datetime.datetime(2024, 1, 1, 12, 0)
+    values = np.random.default_rng(0).normal(size=600)
+    for second, value in enumerate(values):
+        db.write_to_ts("float", value, start + datetime.timedelta(seconds=second))
+    db.write_to_ts("float", "not a number", start - datetime.timedelta(seconds=1))
+    await_database_queue()
+    end = start + datetime.timedelta(seconds=600)
+
+    # SQLite and numpy give the same aggregates, over the half-open range
+    functions = ["count", "sum", "mean", "min", "max"]
+    in_sqlite = db.aggregate_ts("float", 300, functions, start, end)
+    in_numpy = db.aggregate_ts("float", 300, functions + ["p50", "p95"], start, end)
+    assert in_sqlite["timestamp"].tolist() == in_numpy["timestamp"].tolist()
+    assert in_sqlite["count"].tolist() == [300, 300]
+    for function in functions:
+        np.testing.assert_allclose(in_sqlite[function], in_numpy[function])
+    for index, bucket in enumerate(np.split(values, 2)):
+        assert in_numpy["mean"][index] == pytest.approx(bucket.mean())
+        assert in_numpy["p50"][index] == pytest.approx(np.percentile(bucket, 50))
+        assert in_numpy["p95"][index] == pytest.approx(np.percentile(bucket, 95))
+
+    # Buckets that are not aligned with the range are partial
+    offset = db.aggregate_ts(
+        "float", 300, ["count"], start + datetime.timedelta(seconds=100), end
+    )
+    assert offset["count"].tolist() == [200, 300]
+    assert db.aggregate_ts("float", 60, ["p99"], end, end)["p99"].size == 0
+
+    # Aligned ranges use the rollups, which are kept when values are cleaned
+    monkeypatch.setenv("DAEPLOY_SERVICE_DB_TABLE_LIMIT", "1rows")
+    db.clean_database()
+    hourly = db.aggregate_ts("float", 3600, ["count", "mean"], start)
+    assert hourly["count"].tolist() == [600]
+    assert hourly["mean"][0] == pytest.approx(values.mean())
+
+    with pytest.raises(ValueError):
+        db.aggregate_ts("float", 60, ["median"])
+    with pytest.raises(ValueError):
+        db.aggregate_ts("float", 0, ["mean"])
+
+
+def test_monitor_aggregate(database):
+    service = _Service()
+    service.entrypoint(monitor=True)(valid_entrypoint_method_args)
+    client = TestClient(service.app)
+    client.post("/valid_entrypoint_method_args", json={"name": "Rune", "age": 100})
+    start = datetime.datetime(2024, 1, 1, 12, 0)
+    for minute, value in [(0, 1.0), (2, 3.0), (7, 5.0)]:
+        db.write_to_ts("float", value, start + datetime.timedelta(minutes=minute))
+    await_database_queue()
+
+    # Only variables with values are aggregated
+    response = client.get("/~monitor/aggregate", params={"fn": "mean,p50,max"})
+    assert response.json() == {
+        "float": {
+            "timestamp": ["2024-01-01T12:00:00", "2024-01-01T12:05:00"],
+            "mean": [2.0, 5.0],
+            "p50": [2.0, 5.0],
+            "max": [3.0, 5.0],
+        }
+    }
+    response = client.get(
+        "/~monitor/aggregate",
+        params={"bucket": "1h", "fn": "count", "start": str(start)},
+    )
+    assert response.json()["float"]["count"] == [3]
+
+    for params in [{"bucket": "5x"}, {"bucket": "0m"}, {"fn": "mean,median"}]:
+        assert client.get("/~monitor/aggregate", params=params).status_code == 422
+    response = client.get(
+        "/~monitor/aggregate",
+        params={"variables": "valid_entrypoint_method_args_calls"},
+    )
+    assert response.status_code == 412
+
+
+def test_database_migrate_legacy_tables():
+    connection = sqlite3.connect(db.SERVICE_DB_PATH)
+    connection.executescript("""
+        CREATE TABLE temperature (timestamp DATETIME PRIMARY KEY, value FLOAT);
+        CREATE TABLE samples (timestamp DATETIME PRIMARY KEY, value TEXT);
+        CREATE TABLE predict_calls (
+            timestamp DATETIME PRIMARY KEY,
+            request TEXT,
+            response TEXT,
+            latency FLOAT,
+            status INTEGER
+        );
+        INSERT INTO temperature VALUES ('2024-01-01 12:00:00.000001', 20.5);
+        INSERT INTO temperature VALUES ('2024-01-01 12:00:01.000000', 21.0);
+        INSERT INTO samples VALUES ('2024-01-01 12:00:00.000000', 'a');
+        INSERT INTO predict_calls VALUES
+            ('2024-01-01 12:00:00.500000', '{}', '1', 0.1, 200);
+        """)
+    connection.close()
+    try:
+        db.initialize_db()
+        assert set(db.stored_variables()) == {"temperature", "samples", "predict_calls"}
+        temperature = db.read_from_ts("temperature")
+        assert [(record.timestamp, record.value) for record in temperature] == [
+            (datetime.datetime(2024, 1, 1, 12, 0, 0, 1), 20.5),
+            (datetime.datetime(2024, 1, 1, 12, 0, 1), 21.0),
+        ]
+        # Rollups are computed for the values that were stored before
+        (minute,) = db.read_rollups("temperature", "1m")
+        assert (minute.count, minute.mean, minute.last) == (2, 20.75, 21.0)
+        # A variable with the name of one of the new tables is migrated too
+        assert db.read_from_ts("samples")[0].value == "a"
+        call = db.read_from_ts("predict_calls")[0]
+        assert (call.request, call.response, call.status) == ("{}", "1", 200)
+        with db.READ_ENGINE.connect() as connection:
+            assert set(sqlalchemy.inspect(connection).get_table_names()) == {
+                "variables",
+                "samples",
+                "calls",
+                "rollups",
+            }
+    finally:
+        db.remove_db()
+
+
+def test_database_engines_use_same_file(tmp_path):
+    assert db.ENGINE.url.database == str(db._DB_FILE)
+    read_uri = f"{db.READ_ENGINE.url.database}?mode=ro"
+    assert read_uri == db._read_only_uri(db._DB_FILE)
+
+    path = tmp_path / "odd?name#with%.db"
+    sqlite3.connect(path).execute("CREATE TABLE t (a)").connection.close()
+    connection = sqlite3.connect(db._read_only_uri(path), uri=True)
+    assert connection.execute("SELECT count(*) FROM t").fetchone() == (0,)
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute("INSERT INTO t VALUES (1)")
+    connection.close()
+
+
 def test_read_timerange(database, monkeypatch):
 
     # Root cause of this test's historic flakiness: clean_database() is the only
@@ -746,11 +1442,11 @@ def test_read_timerange(database, monkeypatch):
     # the duration of this test so any concurrent clean is a no-op for our data.
     monkeypatch.setenv("DAEPLOY_SERVICE_DB_TABLE_LIMIT", "36500days")
 
-    before = datetime.datetime.utcnow()
-
     # Explicit, strictly-increasing timestamps: the timestamp column is the
     # table's primary key, so repeated utcnow() within one microsecond would
-    # collide on the PK.
+    # collide on the PK. They are in the past, since to_time defaults to
+    # utcnow() and would leave out the latest values otherwise.
+    before = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
     timestamps = [before + datetime.timedelta(milliseconds=i + 1) for i in range(200)]
     mid = timestamps[100]
 
@@ -775,6 +1471,27 @@ def test_read_timerange(database, monkeypatch):
     assert 0 < len(db.read_from_ts("float", from_time=before, to_time=mid)) < 200
 
 
+def test_write_batch_isolates_failing_value(database, monkeypatch):
+    insert_samples = db._insert_samples
+
+    def failing_insert(connection, rows):
+        if any(row["value_num"] == 13 for row in rows):
+            raise ValueError("Unlucky value")
+        insert_samples(connection, rows)
+
+    monkeypatch.setattr(db, "_insert_samples", failing_insert)
+    start = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db._write_batch(
+        [
+            ("float", float(i), start + datetime.timedelta(milliseconds=i))
+            for i in range(20)
+        ]
+    )
+
+    values = [float(row.value) for row in db.read_from_ts("float")]
+    assert values == [float(i) for i in range(20) if i != 13]
+
+
 def test_database_limit_rows(database, db_limit_rows):
     before = datetime.datetime.utcnow()
     for i in range(12):
@@ -812,3 +1529,1412 @@ def test_database_limit_invalid_unit(database, db_limit_invalid_unit):
     limit, limiter = get_db_table_limit()
     assert limit == 90
     assert limiter == "days"
+
+
+def test_spawn_task_keeps_reference_until_done():
+    tasks = set()
+
+    async def main():
+        task = spawn_task(asyncio.sleep(0.01), tasks)
+        assert tasks == {task}
+        await task
+        # The done callback runs on the next iteration of the loop
+        await asyncio.sleep(0)
+        assert not tasks
+
+    asyncio.new_event_loop().run_until_complete(main())
+
+
+def test_entrypoint_batch():
+    service = _Service()
+    calls = []
+
+    @service.entrypoint(batch=True, max_batch_size=4, max_wait_ms=200)
+    def batched(value: int) -> int:
+        calls.append(list(value))
+        return [v * 2 for v in value]
+
+    with TestClient(service.app) as client:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(
+                executor.map(
+                    lambda v: client.post("/batched", json={"value": v}), range(4)
+                )
+            )
+        stats = client.get("/~monitor/batching").json()
+
+    assert [response.json() for response in responses] == [0, 2, 4, 6]
+    assert len(calls) == 1
+    assert sorted(calls[0]) == [0, 1, 2, 3]
+    assert stats["batched"]["batches"] == 1
+    assert stats["batched"]["batch_sizes"] == {"4": 1}
+    assert stats["batched"]["queue_depth"] == 0
+    # Finished batches are no longer referenced
+    assert not utilities._RUNNING_TASKS
+
+
+def test_entrypoint_batch_max_wait():
+    service = _Service()
+
+    @service.entrypoint(batch=True, max_batch_size=100, max_wait_ms=10)
+    def batched(value: int) -> int:
+        return value
+
+    with TestClient(service.app) as client:
+        response = client.post("/batched", json={"value": 3})
+        stats = client.get("/~monitor/batching").json()
+
+    assert response.json() == 3
+    assert stats["batched"]["batch_sizes"] == {"1": 1}
+    assert stats["batched"]["max_wait_observed_ms"] >= 5
+
+
+def test_entrypoint_batch_wrong_result_length():
+    service = _Service()
+
+    @service.entrypoint(batch=True, max_wait_ms=1)
+    def batched(value: int) -> int:
+        return []
+
+    with TestClient(service.app, raise_server_exceptions=False) as client:
+        response = client.post("/batched", json={"value": 3})
+
+    assert response.status_code == 500
+
+
+def test_async_entrypoint_runs_on_event_loop():
+    service = _Service()
+    threads = {}
+
+    @service.entrypoint
+    async def async_entrypoint(value: int) -> int:
+        threads["async"] = threading.get_ident()
+        await asyncio.sleep(0)
+        return value + 1
+
+    @service.entrypoint
+    def sync_entrypoint(value: int) -> int:
+        threads["sync"] = threading.get_ident()
+        return value + 1
+
+    @service.entrypoint
+    async def loop_thread() -> int:
+        return threading.get_ident()
+
+    with TestClient(service.app) as client:
+        assert client.post("/async_entrypoint", json={"value": 1}).json() == 2
+        assert client.post("/sync_entrypoint", json={"value": 1}).json() == 2
+        loop_ident = client.post("/loop_thread").json()
+
+    assert threads["async"] == loop_ident
+    assert threads["sync"] != loop_ident
+
+
+def test_thread_pool_size(monkeypatch):
+    monkeypatch.setenv("DAEPLOY_SERVICE_THREAD_POOL_SIZE", "7")
+    service = _Service()
+    assert service.thread_pool_size == 7
+
+    @service.entrypoint
+    async def tokens() -> float:
+        return anyio.to_thread.current_default_thread_limiter().total_tokens
+
+    with TestClient(service.app) as client:
+        assert client.post("/tokens").json() == 7
+
+
+def test_thread_pool_size_invalid(monkeypatch):
+    monkeypatch.setenv("DAEPLOY_SERVICE_THREAD_POOL_SIZE", "many")
+    assert get_thread_pool_size() == 40
+
+
+def test_entrypoint_cache():
+    service = _Service()
+    mock = Mock(side_effect=lambda name, age: f"{name} {age}")
+
+    @service.entrypoint(cache={"ttl": 30, "maxsize": 2})
+    def cached(name: str, age: int) -> str:
+        return mock(name, age)
+
+    with TestClient(service.app) as client:
+        for _ in range(3):
+            response = client.post("/cached", json={"name": "Rune", "age": 100})
+            assert response.json() == "Rune 100"
+        # Argument order does not matter
+        client.post("/cached", json={"age": 100, "name": "Rune"})
+        assert mock.call_count == 1
+
+        client.post("/cached", json={"name": "Rune", "age": 1})
+        client.post("/cached", json={"name": "Rune", "age": 2})
+        stats = client.get("/~cache").json()["cached"]
+        assert stats["hits"] == 3
+        assert stats["misses"] == 3
+        assert stats["evictions"] == 1
+        assert stats["size"] == 2
+
+        assert client.delete("/~cache/cached").status_code == 200
+        assert client.get("/~cache").json()["cached"]["size"] == 0
+        client.post("/cached", json={"name": "Rune", "age": 2})
+        assert mock.call_count == 4
+
+        assert client.delete("/~cache/nonexistent").status_code == 404
+
+
+def test_entrypoint_cache_ttl():
+    service = _Service()
+    mock = Mock(return_value=1)
+
+    @service.entrypoint(cache={"ttl": 0.1})
+    def cached() -> int:
+        return mock()
+
+    with TestClient(service.app) as client:
+        client.post("/cached")
+        client.post("/cached")
+        time.sleep(0.2)
+        client.post("/cached")
+        stats = client.get("/~cache").json()["cached"]
+
+    assert mock.call_count == 2
+    assert stats["expirations"] == 1
+
+
+def test_entrypoint_cache_array_arguments():
+    service = _Service()
+    mock = Mock(side_effect=lambda arr1, arr2: arr1 + arr2)
+
+    @service.entrypoint(cache={"maxsize": 10})
+    def cached(arr1: ArrayInput, arr2: ArrayInput) -> ArrayOutput:
+        return mock(arr1, arr2)
+
+    with TestClient(service.app) as client:
+        client.post("/cached", json={"arr1": [1, 2], "arr2": [3, 4]})
+        response = client.post("/cached", json={"arr1": [1, 2], "arr2": [3, 4]})
+        assert response.json() == [4, 6]
+        response = client.post("/cached", json={"arr1": [1, 2], "arr2": [3, 5]})
+        assert response.json() == [4, 7]
+
+    assert mock.call_count == 2
+
+
+def test_entrypoint_cache_invalid_config():
+    service = _Service()
+    with pytest.raises(TypeError):
+        service.entrypoint(cache={"size": 10})(valid_entrypoint_method_args)
+    with pytest.raises(ValueError):
+        service.entrypoint(cache={"ttl": -1})(valid_entrypoint_method_args)
+
+
+def test_entrypoint_coalesce():
+    service = _Service()
+    mock = Mock(side_effect=lambda name: f"Hello {name}")
+    calls = threading.Semaphore(0)
+    release = threading.Event()
+
+    @service.entrypoint(coalesce=True)
+    def greet(name: str) -> str:
+        calls.release()
+        release.wait(5)
+        if name == "error":
+            raise ValueError(name)
+        return mock(name)
+
+    with TestClient(service.app, raise_server_exceptions=False) as client:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = [
+                pool.submit(client.post, "/greet", json={"name": name})
+                for name in ["Rune"] * 5 + ["Sven"] + ["error"] * 2
+            ]
+            # Wait for the three distinct calls and give the identical requests
+            # time to join them
+            for _ in range(3):
+                assert calls.acquire(timeout=5)
+            time.sleep(0.2)
+            assert client.get("/~monitor/coalescing").json()["greet"] == {
+                "in_flight": 3,
+                "calls": 3,
+                "coalesced": 5,
+            }
+            release.set()
+            responses = [response.result(5) for response in responses]
+
+        assert [response.json() for response in responses[:6]] == ["Hello Rune"] * 5 + [
+            "Hello Sven"
+        ]
+        # The error reaches every caller
+        assert [response.status_code for response in responses[6:]] == [500, 500]
+        assert mock.call_count == 2
+
+        # Nothing is kept once the call has finished
+        assert client.post("/greet", json={"name": "Rune"}).json() == "Hello Rune"
+        assert mock.call_count == 3
+        assert client.get("/~monitor/coalescing").json()["greet"]["in_flight"] == 0
+
+        metrics = client.get("/~metrics").text
+        assert 'daeploy_entrypoint_coalesced_total{entrypoint="greet"} 5' in metrics
+
+
+def test_entrypoint_coalesce_with_cache():
+    service = _Service()
+    mock = Mock(return_value=1)
+
+    @service.entrypoint(cache={"ttl": 30}, coalesce=True)
+    async def cached() -> int:
+        await asyncio.sleep(0.2)
+        return mock()
+
+    with TestClient(service.app) as client:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(lambda _: client.post("/cached"), range(4)))
+        client.post("/cached")
+        stats = client.get("/~cache").json()["cached"]
+
+    assert [response.json() for response in responses] == [1] * 4
+    # The concurrent cache misses shared one call
+    assert mock.call_count == 1
+    assert stats["misses"] == 4
+    assert stats["hits"] == 1
+
+
+def test_fast_json_entrypoint():
+    service = _Service()
+    service.entrypoint(fast_json=True)(entrypoint_with_arrays)
+    service.entrypoint(fast_json=True)(entrypoint_with_dataframes)
+
+    @service.entrypoint(fast_json=True)
+    def mixed() -> dict:
+        return {
+            "scalar": np.float32(1.5),
+            "int": np.int64(3),
+            "time": datetime.datetime(2020, 1, 1, 12),
+            "matrix": np.arange(6).reshape(2, 3)[:, 1:],
+            "series": pd.Series([1, 2], index=["a", "b"]),
+        }
+
+    client = TestClient(service.app)
+    response = client.post(
+        "/entrypoint_with_arrays", json={"arr1": [1, 2, 3], "arr2": [4, 5, 6]}
+    )
+    assert response.json() == [5, 7, 9]
+
+    df1 = pd.DataFrame.from_dict({"col1": [1, 2, 3], "col2": [0.5, 1.0, 1.5]})
+    response = client.post(
+        "/entrypoint_with_dataframes",
+        json={"df1": df1.to_dict(), "df2": df1.to_dict()},
+    )
+    assert response.json() == json.loads((df1 + df1).to_json())
+
+    response = client.post("/mixed")
+    assert response.json() == {
+        "scalar": 1.5,
+        "int": 3,
+        "time": "2020-01-01T12:00:00",
+        "matrix": [[1, 2], [4, 5]],
+        "series": {"a": 1, "b": 2},
+    }
+
+
+def test_fast_json_float16():
+    service = _Service()
+    values = np.array([[0.5, 1.25, 3.0], [1e-3, 2.0, 4.5]], dtype=np.float16)
+
+    @service.entrypoint(fast_json=True)
+    def half() -> ArrayOutput:
+        return values
+
+    @service.entrypoint(fast_json=True)
+    def half_columns() -> ArrayOutput:
+        return values[:, 1:]
+
+    @service.entrypoint
+    def half_default() -> ArrayOutput:
+        return values
+
+    client = TestClient(service.app)
+    # Newer orjson versions write float16 with fewer digits
+    response = client.post("/half")
+    assert response.status_code == 200
+    np.testing.assert_allclose(response.json(), values, rtol=1e-3)
+    default = client.post("/half_default").json()
+    np.testing.assert_allclose(response.json(), default, rtol=1e-3)
+    response = client.post("/half_columns")
+    assert response.status_code == 200
+    np.testing.assert_allclose(response.json(), values[:, 1:], rtol=1e-3)
+
+
+def test_fast_json_nested_dataframe_datetime_index():
+    service = _Service()
+    df = pd.DataFrame(
+        {"value": [1.0, 2.0]},
+        index=pd.date_range("2020-01-01", periods=2, freq="D"),
+    )
+
+    @service.entrypoint(fast_json=True)
+    def top_level() -> dict:
+        return df
+
+    @service.entrypoint(fast_json=True)
+    def nested() -> dict:
+        return {"frame": df, "series": df["value"]}
+
+    client = TestClient(service.app)
+    top = client.post("/top_level").json()
+    nested_response = client.post("/nested").json()
+
+    assert top == {
+        "value": {"2020-01-01T00:00:00.000": 1.0, "2020-01-02T00:00:00.000": 2.0}
+    }
+    assert nested_response["frame"] == top
+    assert nested_response["series"] == top["value"]
+
+
+def test_fast_json_service_wide():
+    service = _Service()
+    service.fast_json = True
+    service.entrypoint(status_code=201)(entrypoint_with_arrays)
+    service.entrypoint(fast_json=False)(valid_entrypoint_method_no_args)
+
+    with patch("daeploy._service.service.FastJSONResponse") as response_class:
+        response_class.side_effect = FastJSONResponse
+        client = TestClient(service.app)
+        response = client.post(
+            "/entrypoint_with_arrays", json={"arr1": [1, 2], "arr2": [3, 4]}
+        )
+        assert response.status_code == 201
+        assert response.json() == [4, 6]
+        assert response_class.call_count == 1
+
+        assert client.post("/valid_entrypoint_method_no_args").json() == 10
+        assert response_class.call_count == 1
+
+
+def entrypoint_with_single_array(arr: ArrayInput) -> ArrayOutput:
+    return arr * 2
+
+
+def entrypoint_with_single_dataframe(df: DataFrameInput) -> DataFrameOutput:
+    return df * 2
+
+
+def test_binary_npy_entrypoint():
+    service = _Service()
+    service.entrypoint(entrypoint_with_single_array)
+    client = TestClient(service.app)
+
+    arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+    response = client.post(
+        "/entrypoint_with_single_array",
+        content=_encoding.encode(arr, _encoding.NPY),
+        headers={"content-type": _encoding.NPY, "accept": _encoding.NPY},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == _encoding.NPY
+    result = _encoding.decode(response.content, _encoding.NPY)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, arr * 2)
+
+    # JSON is still the default
+    response = client.post("/entrypoint_with_single_array", json={"arr": [1, 2]})
+    assert response.json() == [2, 4]
+
+
+def test_binary_monitored_entrypoint(database):
+    service = _Service()
+    service.entrypoint(monitor=True)(entrypoint_with_single_array)
+    seen_content_types = []
+
+    @service.app.middleware("http")
+    async def content_type_middleware(request, call_next):
+        response = await call_next(request)
+        seen_content_types.append(request.headers["content-type"])
+        return response
+
+    arr = np.arange(4, dtype=np.int16)
+    body = _encoding.encode(arr, _encoding.NPY)
+    client = TestClient(service.app)
+    response = client.post(
+        "/entrypoint_with_single_array",
+        content=body,
+        headers={"content-type": _encoding.NPY, "accept": _encoding.NPY},
+    )
+    assert response.status_code == 200
+    assert seen_content_types == [_encoding.NPY]
+    await_database_queue()
+
+    record = db.read_from_ts("entrypoint_with_single_array_calls")[0]
+    request = json.loads(record.request)
+    stored_response = json.loads(record.response)
+    assert request["media_type"] == _encoding.NPY
+    assert base64.b64decode(request["base64"]) == body
+    assert stored_response["media_type"] == _encoding.NPY
+    np.testing.assert_array_equal(
+        _encoding.decode(base64.b64decode(stored_response["base64"]), _encoding.NPY),
+        arr * 2,
+    )
+
+
+def test_binary_msgpack_entrypoint():
+    service = _Service()
+    service.entrypoint(entrypoint_with_arrays)
+    service.entrypoint(entrypoint_with_dataframes)
+    client = TestClient(service.app)
+
+    arr1, arr2 = np.arange(5), np.arange(5, 10)
+    response = client.post(
+        "/entrypoint_with_arrays",
+        content=_encoding.encode({"arr1": arr1, "arr2": arr2}, _encoding.MSGPACK),
+        headers={"content-type": _encoding.MSGPACK, "accept": _encoding.MSGPACK},
+    )
+    assert response.status_code == 200
+    np.testing.assert_array_equal(
+        _encoding.decode(response.content, _encoding.MSGPACK), arr1 + arr2
+    )
+
+    df = pd.DataFrame({"col1": [1.0, 2.0], "col2": ["a", "b"]})
+    response = client.post(
+        "/entrypoint_with_dataframes",
+        content=_encoding.encode({"df1": df, "df2": df}, _encoding.MSGPACK),
+        headers={"content-type": _encoding.MSGPACK, "accept": _encoding.MSGPACK},
+    )
+    assert response.status_code == 200
+    pd.testing.assert_frame_equal(
+        _encoding.decode(response.content, _encoding.MSGPACK), df + df
+    )
+
+
+def test_binary_arrow_entrypoint():
+    service = _Service()
+    service.entrypoint(entrypoint_with_single_dataframe)
+    client = TestClient(service.app)
+
+    df = pd.DataFrame({"col1": [1, 2, 3], "col2": [0.5, 1.0, 1.5]})
+    response = client.post(
+        "/entrypoint_with_single_dataframe",
+        content=_encoding.encode(df, _encoding.ARROW),
+        headers={"content-type": _encoding.ARROW, "accept": _encoding.ARROW},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == _encoding.ARROW
+    pd.testing.assert_frame_equal(
+        _encoding.decode(response.content, _encoding.ARROW), df * 2
+    )
+
+
+def test_binary_invalid_requests():
+    service = _Service()
+    service.entrypoint(entrypoint_with_arrays)
+    client = TestClient(service.app)
+
+    # npy bodies can not be mapped to several arguments
+    response = client.post(
+        "/entrypoint_with_arrays",
+        content=_encoding.encode(np.arange(3), _encoding.NPY),
+        headers={"content-type": _encoding.NPY},
+    )
+    assert response.status_code == 415
+
+    response = client.post(
+        "/entrypoint_with_arrays",
+        content=b"not msgpack",
+        headers={"content-type": _encoding.MSGPACK},
+    )
+    assert response.status_code == 400
+
+
+def test_binary_negotiate():
+    arr = np.arange(3)
+    assert _encoding.negotiate(None, arr) is None
+    assert _encoding.negotiate("application/json", arr) is None
+    assert _encoding.negotiate("application/x-npy", arr) == _encoding.NPY
+    assert _encoding.negotiate("application/x-npy", [1, 2]) is None
+    assert (
+        _encoding.negotiate("application/json;q=0.5, application/msgpack", arr)
+        == _encoding.MSGPACK
+    )
+    assert _encoding.negotiate("*/*, application/x-npy", arr) is None
+
+
+@patch("daeploy.communication.request")
+def test_call_service_binary(request):
+    arr = np.arange(4)
+    request.return_value.headers = {"content-type": _encoding.NPY}
+    request.return_value.content = _encoding.encode(arr * 2, _encoding.NPY)
+
+    result = call_service(
+        service_name="myservice",
+        entrypoint_name="mymethod",
+        arguments={"arr": arr},
+        encoding="npy",
+    )
+    np.testing.assert_array_equal(result, arr * 2)
+
+    _, kwargs = request.call_args
+    assert kwargs["headers"]["Content-Type"] == _encoding.NPY
+    assert kwargs["headers"]["Accept"].startswith(_encoding.NPY)
+    np.testing.assert_array_equal(_encoding.decode(kwargs["data"], _encoding.NPY), arr)
+
+    with pytest.raises(ValueError):
+        call_service(
+            service_name="myservice",
+            entrypoint_name="mymethod",
+            arguments={"arr1": arr, "arr2": arr},
+            encoding="npy",
+        )
+    with pytest.raises(ValueError):
+        call_service(
+            service_name="myservice", entrypoint_name="mymethod", encoding="xml"
+        )
+
+
+def test_generator_entrypoint_ndjson():
+    service = _Service()
+
+    @service.entrypoint
+    def numbers(count: int):
+        for i in range(count):
+            yield {"number": i, "square": np.int64(i * i)}
+
+    with TestClient(service.app) as client:
+        with client.stream("POST", "/numbers", json={"count": 3}) as response:
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = list(response.iter_lines())
+
+    assert [json.loads(line) for line in lines] == [
+        {"number": 0, "square": 0},
+        {"number": 1, "square": 1},
+        {"number": 2, "square": 4},
+    ]
+
+
+def test_async_generator_entrypoint_sse():
+    service = _Service()
+
+    @service.entrypoint
+    async def tokens(text: str):
+        for token in text.split():
+            await asyncio.sleep(0)
+            yield token
+
+    with TestClient(service.app) as client:
+        response = client.post(
+            "/tokens",
+            json={"text": "one two three"},
+            headers={"accept": "text/event-stream"},
+        )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == 'data: "one"\n\ndata: "two"\n\ndata: "three"\n\n'
+
+
+@pytest.mark.timeout(10)
+def test_generator_entrypoint_monitored(database):
+    service = _Service()
+
+    @service.entrypoint(monitor=True)
+    def numbers(count: int):
+        yield from range(count)
+
+    client = TestClient(service.app)
+    response = client.post("/numbers", json={"count": 5})
+    assert response.text == "0\n1\n2\n3\n4\n"
+    await_database_queue()
+
+    record = db.read_from_ts("numbers_calls")[0]
+    summary = json.loads(record.response)
+    assert summary["items"] == 5
+    assert summary["bytes"] == 10
+    assert summary["duration"] >= 0
+    assert record.status == 200
+
+
+def test_generator_entrypoint_invalid_options():
+    service = _Service()
+
+    def numbers(count: int):
+        yield from range(count)
+
+    with pytest.raises(ValueError):
+        service.entrypoint(batch=True)(numbers)
+    with pytest.raises(ValueError):
+        service.entrypoint(cache={"ttl": 1})(numbers)
+    with pytest.raises(ValueError):
+        service.entrypoint(coalesce=True)(numbers)
+
+
+def test_entrypoint_max_queue_rejects():
+    service = _Service()
+    started = threading.Event()
+    release = threading.Event()
+
+    @service.entrypoint(max_concurrency=1, max_queue=0)
+    def slow() -> str:
+        started.set()
+        release.wait(5)
+        return "done"
+
+    with TestClient(service.app) as client:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first = executor.submit(client.post, "/slow")
+            assert started.wait(5)
+            rejected = client.post("/slow")
+            stats = client.get("/~monitor/concurrency").json()
+            release.set()
+            assert first.result().json() == "done"
+
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
+    assert stats["slow"]["in_flight"] == 1
+    assert stats["slow"]["rejected"] == 1
+
+
+def test_entrypoint_max_concurrency_queues():
+    service = _Service()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    @service.entrypoint(max_concurrency=2)
+    def limited(value: int) -> int:
+        with lock:
+            running.append(value)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(value)
+        return value
+
+    with TestClient(service.app) as client:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            responses = list(
+                executor.map(
+                    lambda v: client.post("/limited", json={"value": v}), range(6)
+                )
+            )
+
+    assert [response.json() for response in responses] == list(range(6))
+    assert max(peak) <= 2
+
+
+def test_entrypoint_timeout():
+    service = _Service()
+
+    @service.entrypoint(timeout=0.1)
+    def sleepy() -> str:
+        time.sleep(1)
+        return "late"
+
+    @service.entrypoint(timeout=0.1)
+    async def async_sleepy() -> str:
+        await asyncio.sleep(1)
+        return "late"
+
+    with TestClient(service.app) as client:
+        start = time.monotonic()
+        response = client.post("/sleepy")
+        async_response = client.post("/async_sleepy")
+        elapsed = time.monotonic() - start
+        stats = client.get("/~monitor/concurrency").json()
+
+    assert response.status_code == 504
+    assert async_response.status_code == 504
+    assert elapsed < 1
+    assert stats["sleepy"]["timeouts"] == 1
+    assert stats["async_sleepy"]["timeouts"] == 1
+
+
+def test_entrypoint_timeout_keeps_max_concurrency():
+    service = _Service()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    @service.entrypoint(max_concurrency=1, timeout=0.1)
+    def sleepy() -> str:
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.3)
+        with lock:
+            running.pop()
+        return "late"
+
+    with TestClient(service.app) as client:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda _: client.post("/sleepy"), range(8)))
+        # Let the threads of the timed out calls finish
+        time.sleep(1)
+        stats = client.get("/~monitor/concurrency").json()
+
+    assert {response.status_code for response in responses} == {504}
+    assert max(peak) == 1
+    assert stats["sleepy"]["in_flight"] == 0
+    assert stats["sleepy"]["timeouts"] == 8
+
+
+def test_entrypoint_concurrency_invalid_options():
+    service = _Service()
+
+    with pytest.raises(ValueError):
+        service.entrypoint(max_concurrency=0)(valid_entrypoint_method_no_args)
+    with pytest.raises(ValueError):
+        service.entrypoint(max_queue=3)(valid_entrypoint_method_no_args)
+    with pytest.raises(ValueError):
+        service.entrypoint(timeout=-1)(valid_entrypoint_method_no_args)
+
+
+def test_metrics_endpoint():
+    service = _Service()
+    service.entrypoint(valid_entrypoint_method_args)
+    service.entrypoint(max_concurrency=1)(valid_entrypoint_method_no_args)
+
+    @service.entrypoint
+    def failing() -> int:
+        raise RuntimeError("Failure")
+
+    @service.call_every(0.01)
+    def task():
+        pass
+
+    with TestClient(service.app, raise_server_exceptions=False) as client:
+        time.sleep(0.05)
+        client.post("/valid_entrypoint_method_args", json={"name": "Rune", "age": 1})
+        client.post("/valid_entrypoint_method_args", json={"name": "Rune"})
+        client.post("/valid_entrypoint_method_no_args")
+        client.post("/failing")
+        response = client.get("/~metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    for line in [
+        "# TYPE daeploy_entrypoint_requests_total counter",
+        'daeploy_entrypoint_requests_total{entrypoint="valid_entrypoint_method_args"'
+        ',status="200"} 1',
+        'daeploy_entrypoint_requests_total{entrypoint="valid_entrypoint_method_args"'
+        ',status="422"} 1',
+        'daeploy_entrypoint_errors_total{entrypoint="failing"} 1',
+        'daeploy_entrypoint_in_flight{entrypoint="failing"} 0',
+        "daeploy_entrypoint_request_duration_seconds_bucket"
+        '{entrypoint="valid_entrypoint_method_no_args",le="+Inf"} 1',
+        "daeploy_entrypoint_request_duration_seconds_count"
+        '{entrypoint="valid_entrypoint_method_no_args"} 1',
+        'daeploy_entrypoint_queue_depth{entrypoint="valid_entrypoint_method_no_args"'
+        ',kind="concurrency"} 0',
+        "daeploy_entrypoint_rejected_total"
+        '{entrypoint="valid_entrypoint_method_no_args"} 0',
+        "daeploy_monitoring_queue_depth 0",
+    ]:
+        assert line in lines, line
+    assert any(line.startswith("daeploy_thread_pool_in_use ") for line in lines)
+    assert "# TYPE daeploy_call_every_lateness_seconds histogram" in lines
+    assert 'daeploy_call_every_lateness_seconds_count{task="task"}' in response.text
+
+
+def test_service_workers(monkeypatch):
+    assert get_service_workers() == 1
+    monkeypatch.setenv("DAEPLOY_SERVICE_WORKERS", "4")
+    assert get_service_workers() == 4
+    monkeypatch.setenv("DAEPLOY_SERVICE_WORKERS", "0")
+    assert get_service_workers() == 1
+
+
+def test_server_transport_env(monkeypatch):
+    assert get_service_loop() == "auto"
+    monkeypatch.setenv("DAEPLOY_SERVICE_LOOP", "asyncio")
+    assert get_service_loop() == "asyncio"
+    monkeypatch.setenv("DAEPLOY_SERVICE_LOOP", "trio")
+    assert get_service_loop() == "auto"
+    assert get_service_limit_concurrency() is None
+    monkeypatch.setenv("DAEPLOY_SERVICE_LIMIT_CONCURRENCY", "100")
+    assert get_service_limit_concurrency() == 100
+
+
+def test_run_transport_options(monkeypatch, tmp_path):
+    service = _Service()
+    with patch("daeploy._service.service.uvicorn.run") as uvicorn_run:
+        service.run()
+    assert uvicorn_run.call_args.kwargs == {
+        "host": "0.0.0.0",
+        "port": 8000,
+        "uds": None,
+        "loop": "auto",
+        "http": "auto",
+        "backlog": 2048,
+        "timeout_keep_alive": 5,
+        "limit_concurrency": None,
+    }
+
+    # Arguments take precedence over the environment
+    uds = str(tmp_path / "service.sock")
+    monkeypatch.setenv("DAEPLOY_SERVICE_UDS", uds)
+    monkeypatch.setenv("DAEPLOY_SERVICE_HTTP", "h11")
+    monkeypatch.setenv("DAEPLOY_SERVICE_KEEP_ALIVE", "30")
+    with patch("daeploy._service.service.uvicorn.run") as uvicorn_run:
+        service.run(loop="asyncio", backlog=128, timeout_keep_alive=60)
+    kwargs = uvicorn_run.call_args.kwargs
+    assert kwargs["uds"] == uds
+    assert kwargs["http"] == "h11"
+    assert kwargs["loop"] == "asyncio"
+    assert kwargs["backlog"] == 128
+    assert kwargs["timeout_keep_alive"] == 60
+
+    with patch("daeploy._service.service._WorkerPool") as pool:
+        service.run(workers=2, limit_concurrency=50)
+    config = pool.call_args.args[0]
+    assert config.uds == uds
+    assert config.limit_concurrency == 50
+
+    with pytest.raises(ValueError):
+        service.run(loop="trio")
+    with patch("importlib.util.find_spec", return_value=None):
+        with pytest.raises(ValueError, match="pip install httptools"):
+            service.run(http="httptools")
+
+
+def test_run_unix_domain_socket(tmp_path):
+    service = _Service()
+
+    @service.entrypoint
+    def echo(value: int) -> int:
+        return value
+
+    uds = str(tmp_path / "service.sock")
+    server = executor.CONTEXT.Process(
+        target=service.run, kwargs={"uds": uds, "loop": "asyncio", "http": "h11"}
+    )
+    server.start()
+    try:
+        transport = httpx.HTTPTransport(uds=uds, retries=20)
+        with httpx.Client(transport=transport, base_url="http://service") as client:
+            deadline = time.monotonic() + 10
+            while not os.path.exists(uds) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            response = client.post("/echo", json={"value": 3})
+        assert response.json() == 3
+    finally:
+        server.terminate()
+        server.join(10)
+
+
+def test_run_workers():
+    service = _Service()
+    with patch("daeploy._service.service.uvicorn.run") as uvicorn_run:
+        service.run()
+    uvicorn_run.assert_called_once()
+
+    with patch("daeploy._service.service._WorkerPool") as pool:
+        service.run(workers=3)
+    config, workers, broadcast, apply_parameters = pool.call_args.args
+    assert config.app is service.app
+    assert workers == 3
+    assert broadcast is service._parameter_broadcast
+    assert apply_parameters == service._apply_parameters
+    pool.return_value.run.assert_called_once()
+
+
+def test_database_cleaned_by_parent_process(monkeypatch):
+    monkeypatch.setattr(db, "IN_WORKER", True)
+    with patch.object(db, "ENGINE") as engine:
+        db.clean_database()
+    engine.begin.assert_not_called()
+
+    pool = _WorkerPool(Mock(), 2, Mock(), Mock())
+    cleaned = threading.Event()
+    with patch.object(db, "clean_database", side_effect=cleaned.set):
+        cleaner = threading.Thread(target=pool._clean, args=(0.01,))
+        cleaner.start()
+        assert cleaned.wait(5)
+        pool._stop()
+        cleaner.join(5)
+    assert not cleaner.is_alive()
+
+
+def test_parameter_broadcast():
+    broadcast = _ParameterBroadcast(3)
+    apply = Mock()
+    relay = threading.Thread(target=broadcast.relay, args=(apply,))
+    relay.start()
+
+    # Published from worker 1, received by worker 0 and 2
+    broadcast.worker = 1
+    broadcast.publish({"threshold": 0.5}, 1)
+    for worker in (0, 2):
+        assert broadcast._outboxes[worker].get(timeout=5) == ({"threshold": 0.5}, 1)
+    broadcast.stop()
+    relay.join(5)
+    assert broadcast._outboxes[1].empty()
+    # The parent process applies the update as well
+    apply.assert_called_once_with({"threshold": 0.5}, 1)
+
+
+def test_restarted_worker_has_latest_parameters():
+    service = _Service()
+    service.add_parameter("threshold", 1.0)
+    with patch("daeploy._service.service._WorkerPool"):
+        service.run(workers=2)
+    broadcast = service._parameter_broadcast
+    relay = threading.Thread(target=broadcast.relay, args=(service._apply_parameters,))
+    relay.start()
+
+    # Updated in worker 1, which then dies and is forked again from the parent
+    broadcast.worker = 1
+    broadcast.publish({"threshold": 2.0}, broadcast.next_version())
+    broadcast.worker = None
+    assert broadcast._outboxes[0].get(timeout=5)[0] == {"threshold": 2.0}
+    broadcast.stop()
+    relay.join(5)
+
+    values = executor.CONTEXT.Queue()
+    worker = executor.CONTEXT.Process(
+        target=lambda: values.put(service.get_parameter("threshold"))
+    )
+    worker.start()
+    worker.join(5)
+    assert values.get(timeout=5) == 2.0
+
+
+def test_parameter_published_to_workers():
+    service = _Service()
+    service.add_parameter("threshold", 1.0, monitor=False)
+    service._parameter_broadcast = Mock()
+
+    client = TestClient(service.app)
+    client.post("/~parameters/threshold", json={"value": 2})
+    service.set_parameter("threshold", 3)
+    assert service._parameter_broadcast.publish.call_args_list == [
+        (({"threshold": 2.0}, 2),),
+        (({"threshold": 3.0}, 3),),
+    ]
+
+    service._apply_parameters({"threshold": 4.0}, 5)
+    assert service.get_parameter("threshold") == 4.0
+    assert service._parameter_broadcast.publish.call_count == 2
+
+    # Updates that arrive late do not overwrite newer values
+    service._apply_parameters({"threshold": 3.5}, 4)
+    assert service.get_parameter("threshold") == 4.0
+
+
+def test_parameter_versions_shared_by_workers():
+    service = _Service()
+    service.add_parameter("a", 1.0)
+    service.add_parameter("b", 1.0)
+    with patch("daeploy._service.service._WorkerPool"):
+        service.run(workers=2)
+    broadcast = service._parameter_broadcast
+
+    # The counter continues from the versions given out before the workers
+    # were started, and is shared by the forked workers
+    worker = executor.CONTEXT.Process(target=broadcast.next_version)
+    worker.start()
+    worker.join(5)
+    assert service.set_parameter("a", 2) == 2.0
+    assert service._parameter_store.snapshot()["version"] == 4
+
+
+def wait_until_ready(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/~ready")
+        if response.status_code != 503 or "Warming up" not in response.text:
+            return response
+        time.sleep(0.01)
+    return response
+
+
+def test_warmup_hooks():
+    service = _Service()
+    calls = []
+    release = threading.Event()
+
+    @service.on_warmup
+    def load():
+        release.wait(5)
+        calls.append("load")
+
+    @service.on_warmup
+    async def predict():
+        calls.append("predict")
+
+    client = TestClient(service.app)
+    assert client.get("/~health").status_code == 200
+    assert client.get("/~ready").status_code == 503
+
+    with TestClient(service.app) as client:
+        # Health responds while the hooks are running
+        assert client.get("/~health").status_code == 200
+        response = client.get("/~ready")
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Warming up"
+
+        release.set()
+        assert wait_until_ready(client).status_code == 200
+    assert calls == ["load", "predict"]
+    assert service.ready
+
+
+def test_warmup_hook_failure():
+    service = _Service()
+
+    @service.on_warmup
+    def fail():
+        raise RuntimeError("no model")
+
+    with TestClient(service.app) as client:
+        response = wait_until_ready(client)
+        assert response.status_code == 503
+        assert "no model" in response.json()["detail"]
+        assert client.get("/~health").status_code == 200
+    assert not service.ready
+
+    with pytest.raises(TypeError):
+        service.on_warmup("not callable")
+
+
+def test_ready_without_warmup_hooks():
+    service = _Service()
+    with TestClient(service.app) as client:
+        assert wait_until_ready(client).status_code == 200
+
+
+def test_process_executor_entrypoint():
+    service = _Service()
+
+    @service.entrypoint(executor="process", workers=2)
+    def pid() -> int:
+        return os.getpid()
+
+    @service.entrypoint(executor="process", workers=1)
+    def scale(data: ArrayInput) -> ArrayOutput:
+        return data * 2
+
+    @service.entrypoint(executor="process", workers=1)
+    def fail() -> int:
+        raise ValueError("bad input")
+
+    with TestClient(service.app, raise_server_exceptions=False) as client:
+        assert wait_until_ready(client).status_code == 200
+        with ThreadPoolExecutor(4) as pool:
+            pids = set(pool.map(lambda _: client.post("/pid").json(), range(20)))
+        assert os.getpid() not in pids
+
+        # Large enough to go through shared memory
+        data = np.arange(100_000, dtype=float).reshape(1000, 100)
+        response = client.post(
+            "/scale",
+            content=_encoding.encode(data, _encoding.NPY),
+            headers={"content-type": _encoding.NPY, "accept": _encoding.NPY},
+        )
+        assert response.status_code == 200
+        result = _encoding.decode(response.content, _encoding.NPY)
+        np.testing.assert_array_equal(result, data * 2)
+
+        assert client.post("/fail").status_code == 500
+        stats = client.get("/~monitor/processes").json()
+        assert stats["pid"]["workers"] == 2
+        assert stats["fail"]["restarts"] == 0
+
+
+def test_process_pool_restart_and_recycle():
+    def crash(exit_code: int):
+        if exit_code:
+            os._exit(exit_code)
+        return os.getpid()
+
+    pool = _ProcessPool(crash, workers=1)
+    try:
+        first = pool._call({"exit_code": 0})
+        with pytest.raises(RuntimeError):
+            pool._call({"exit_code": 3})
+        assert pool.restarts == 1
+        assert pool._call({"exit_code": 0}) != first
+    finally:
+        pool.stop()
+
+    # Any worker is above a limit of 1 byte, so it is replaced after each call
+    pool = _ProcessPool(crash, workers=1, max_memory_mb=1 / 1024 / 1024)
+    try:
+        assert pool._call({"exit_code": 0}) != pool._call({"exit_code": 0})
+        assert pool.recycled == 2
+    finally:
+        pool.stop()
+
+
+def test_process_pool_replaces_workers_in_supervisor():
+    def crash(exit_code: int):
+        if exit_code:
+            os._exit(exit_code)
+        return os.getpid()
+
+    pool = _ProcessPool(crash, workers=2)
+    forked_by = []
+    new_worker = pool._new_worker
+
+    def recording_new_worker():
+        forked_by.append(threading.current_thread().name)
+        return new_worker()
+
+    pool._new_worker = recording_new_worker
+    try:
+        pool.start()
+        with ThreadPoolExecutor(4) as executor_threads:
+            calls = [
+                executor_threads.submit(pool._call, {"exit_code": i % 2})
+                for i in range(8)
+            ]
+            crashed = sum(
+                isinstance(call.exception(10), RuntimeError) for call in calls
+            )
+        assert crashed == 4
+        stats = pool.stats()
+        assert stats["busy"] == 0
+        assert stats["restarts"] == 4
+        assert pool._call({"exit_code": 0})
+        # Only the initial workers are forked outside the supervisor
+        assert forked_by[2:] == ["crash-supervisor"] * (len(forked_by) - 2)
+    finally:
+        pool.stop()
+
+
+def test_process_pool_returns_view_of_shared_argument():
+    def head(data):
+        return data[:3]
+
+    kept = []
+
+    def keep(data):
+        kept.append(data)
+        return data.sum()
+
+    data = np.arange(100_000, dtype=float)
+    pool = _ProcessPool(head, workers=1)
+    try:
+        np.testing.assert_array_equal(pool._call({"data": data}), data[:3])
+        np.testing.assert_array_equal(pool._call({"data": data}), data[:3])
+        assert pool.restarts == 0
+    finally:
+        pool.stop()
+
+    # The worker survives an argument that can not be released
+    pool = _ProcessPool(keep, workers=1)
+    try:
+        assert pool._call({"data": data}) == data.sum()
+        assert pool._call({"data": data}) == data.sum()
+        assert pool.restarts == 0
+    finally:
+        pool.stop()
+
+
+def test_shared_memory_transfer():
+    small = np.arange(10)
+    assert executor._share(small, []) is small
+
+    blocks = []
+    data = np.random.rand(300, 300)
+    shared = executor._share(data, blocks)
+    assert isinstance(shared, executor._SharedArray)
+    received = []
+    np.testing.assert_array_equal(executor._attach(shared, received, copy=True), data)
+    executor._release(received)
+    executor._release(blocks, unlink=True)
+
+
+def test_process_executor_invalid_options():
+    service = _Service()
+    with pytest.raises(ValueError):
+        service.entrypoint(executor="gpu")
+    with pytest.raises(ValueError):
+
+        @service.entrypoint(executor="process")
+        async def coroutine() -> int:
+            return 1
+
+    with pytest.raises(ValueError):
+        _ProcessPool(print, workers=0)
+
+
+def test_profile_endpoint():
+    service = _Service()
+
+    def busy_loop(stop):
+        while not stop.is_set():
+            sum(range(1000))
+
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    client = TestClient(service.app)
+    try:
+        response = client.get("/~profile?seconds=0.2&format=collapsed")
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        busy = [line for line in lines if line.startswith("busy;")]
+        assert busy
+        assert all("busy_loop (" in line for line in busy)
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) > 5
+
+        response = client.get("/~profile?seconds=0.1")
+        profile = response.json()
+        assert profile["$schema"] == profiler.SPEEDSCOPE_SCHEMA
+        profiles = {p["name"]: p for p in profile["profiles"]}
+        assert "busy" in profiles
+        frames = profile["shared"]["frames"]
+        names = {frames[i]["name"] for s in profiles["busy"]["samples"] for i in s}
+        assert "busy_loop" in names
+        assert len(profiles["busy"]["samples"]) == len(profiles["busy"]["weights"])
+    finally:
+        stop.set()
+        thread.join()
+
+    assert client.get("/~profile?seconds=61").status_code == 422
+    assert client.get("/~profile?format=pstats").status_code == 422
+
+    # Only one profile at a time
+    service._profiling.acquire()
+    try:
+        assert client.get("/~profile?seconds=0.1").status_code == 409
+    finally:
+        service._profiling.release()
+
+
+def wait_for_job(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/~jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    return job
+
+
+def test_job_entrypoint():
+    service = _Service()
+    release = threading.Event()
+
+    @service.job
+    def train(samples: int) -> dict:
+        release.wait(5)
+        return {"samples": samples, "weights": np.arange(3)}
+
+    @service.job
+    async def fail() -> int:
+        raise ValueError("no data")
+
+    with TestClient(service.app) as client:
+        response = client.post("/train", json={"samples": 10})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running")
+        assert response.headers["location"] == f"/~jobs/{job['id']}"
+        assert client.get(f"/~jobs/{job['id']}").json()["status"] != "succeeded"
+
+        release.set()
+        job = wait_for_job(client, job["id"])
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"samples": 10, "weights": [0, 1, 2]}
+        assert job["finished"] >= job["started"] >= job["submitted"]
+
+        failed = wait_for_job(client, client.post("/fail").json()["id"])
+        assert failed["status"] == "failed"
+        assert failed["error"] == "ValueError: no data"
+
+        jobs = client.get("/~jobs").json()
+        assert [job["status"] for job in jobs] == ["succeeded", "failed"]
+        assert "result" not in jobs[0]
+        assert client.get("/~jobs/unknown").status_code == 404
+        assert client.post("/train", json={"samples": "many"}).status_code == 422
+
+        stats = client.get("/~monitor/jobs").json()
+        assert stats["train"]["succeeded"] == 1
+        assert stats["fail"]["failed"] == 1
+
+    # The decorated function can still be called directly
+    assert train(1)["samples"] == 1
+
+
+def test_job_workers_and_queue():
+    service = _Service()
+    release = threading.Event()
+    running = []
+
+    @service.job(workers=2, max_queue=1)
+    def slow(value: int) -> int:
+        running.append(value)
+        release.wait(5)
+        return value
+
+    with TestClient(service.app) as client:
+        ids = [client.post("/slow", json={"value": i}).json()["id"] for i in range(3)]
+        deadline = time.monotonic() + 5
+        while len(running) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Two running, one queued and the queue is full
+        assert client.get("/~monitor/jobs").json()["slow"]["queue_depth"] == 1
+        assert client.post("/slow", json={"value": 3}).status_code == 503
+        assert sorted(running) == [0, 1]
+
+        release.set()
+        assert [wait_for_job(client, i)["result"] for i in ids] == [0, 1, 2]
+
+
+def test_job_ttl(monkeypatch):
+    service = _Service()
+
+    @service.job(ttl=10)
+    def quick() -> int:
+        return 1
+
+    with TestClient(service.app) as client:
+        job_id = client.post("/quick").json()["id"]
+        assert wait_for_job(client, job_id)["result"] == 1
+
+        now = time.monotonic()
+        monkeypatch.setattr("daeploy._service.jobs.time.monotonic", lambda: now + 11)
+        assert client.get(f"/~jobs/{job_id}").status_code == 404
+        assert service._jobs.expirations == 1
+
+
+def test_job_ttl_per_entrypoint(monkeypatch):
+    service = _Service()
+
+    @service.job(ttl=100)
+    def kept() -> int:
+        return 1
+
+    @service.job(ttl=10)
+    def short() -> int:
+        return 2
+
+    with TestClient(service.app) as client:
+        kept_id = client.post("/kept").json()["id"]
+        wait_for_job(client, kept_id)
+        short_id = client.post("/short").json()["id"]
+        wait_for_job(client, short_id)
+
+        now = time.monotonic()
+        monkeypatch.setattr("daeploy._service.jobs.time.monotonic", lambda: now + 11)
+        # Expires although a job with a longer ttl finished before it
+        assert client.get(f"/~jobs/{short_id}").status_code == 404
+        assert client.get(f"/~jobs/{kept_id}").status_code == 200
+        assert service._jobs.expirations == 1
+
+
+def test_job_refuses_multiple_workers():
+    service = _Service()
+    service.job(valid_entrypoint_method_no_args)
+
+    with patch("daeploy._service.service._WorkerPool") as pool:
+        with pytest.raises(ValueError, match="single worker"):
+            service.run(workers=2)
+    pool.assert_not_called()
+
+
+def test_job_invalid_options():
+    service = _Service()
+    with pytest.raises(ValueError):
+        service.job(workers=0)(lambda: 1)
+    with pytest.raises(ValueError):
+
+        @service.job
+        def stream():
+            yield 1